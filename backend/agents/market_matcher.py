@@ -1,16 +1,20 @@
 from __future__ import annotations
 import os
+import time
 from typing import Optional
 
-from sqlmodel import Session, select
+import numpy as np
+from sqlmodel import Session
 
 from models.agent_spec import NarrowAgentSpec
-from services.embedding_service import embedding_service
 from services.log_streamer import logger
+from services.similarity_index import similarity_index
+from services.market_index import market_index
 
 AGENTVERSE_MATCH_THRESHOLD = float(
     os.getenv("AGENTVERSE_MATCH_THRESHOLD", "0.85")
 )
+MARKET_LOG_TOP_K = 5  # published specs ranked and summarised per match query
 
 
 class MarketMatcher:
@@ -27,40 +31,40 @@ class MarketMatcher:
 
     async def find_match_by_vector(
         self,
-        query_vector: list[float],
+        query_vector: np.ndarray,
         db: Session,
     ) -> Optional[tuple[NarrowAgentSpec, float]]:
         """
-        Compare a raw embedding vector against all published spec embeddings.
+        Compare a raw embedding vector against all published spec embeddings
+        held by market_index; STALE agents never match.
         Used at detection time to compare a session trace embedding vs published specs.
         Returns (matching_spec, score) or None.
         """
-        published = db.exec(select(NarrowAgentSpec)).all()
-        if not published:
+        t0 = time.perf_counter()
+        partition = similarity_index.specs(db)
+        if not len(partition):
             logger.info("[MarketMatcher] No published agents to compare against")
             return None
 
-        best_match: Optional[NarrowAgentSpec] = None
-        best_score = 0.0
-
-        for spec in published:
-            if not spec.embedding:
-                continue
-            score = embedding_service.cosine_similarity(query_vector, spec.embedding)
-            logger.info(f"[MarketMatcher] vs '{spec.name}': cosine={score}")
-            if score > best_score:
-                best_score = score
-                best_match = spec
-
-        if best_match and best_score >= AGENTVERSE_MATCH_THRESHOLD:
-            logger.info(
-                f"[MarketMatcher] Match found: '{best_match.name}' (score={best_score})"
-            )
-            return best_match, best_score
+        ranked = market_index.search(
+            query_vector, db, k=MARKET_LOG_TOP_K, threshold=AGENTVERSE_MATCH_THRESHOLD
+        )
+        best_match = None
+        if ranked and ranked[0][1] >= AGENTVERSE_MATCH_THRESHOLD:
+            best_match = db.get(NarrowAgentSpec, ranked[0][0].id)
 
+        # One summary line per query: per-spec lines cost O(specs) formatting and SSE pushes
+        top = ", ".join(f"'{meta.name}'={score}" for meta, score in ranked) or "none"
+        outcome = (
+            f"match '{best_match.name}'" if best_match
+            else f"no match above {AGENTVERSE_MATCH_THRESHOLD}"
+        )
         logger.info(
-            f"[MarketMatcher] No match above threshold {AGENTVERSE_MATCH_THRESHOLD}"
+            f"[MarketMatcher] {len(market_index)} agents | top-{len(ranked)}: {top} | "
+            f"{outcome} | {(time.perf_counter() - t0) * 1000:.1f}ms"
         )
+        if best_match:
+            return best_match, ranked[0][1]
         return None
 
 
@@ -1,4 +1,9 @@
 from __future__ import annotations
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Optional
 
@@ -9,7 +14,236 @@ from models.session import SessionRecord, PatternState
 from services.vision_service import vision_service
 from services.pattern_detector import pattern_detector
 from services.step_labeller import step_labeller
+from services.event_log import event_log
+from services.blob_store import blob_store
+from services.input_coalescer import input_coalescer
+from services.prefix_matcher import prefix_matcher, PrefixMatch, PrefixState
 from services.log_streamer import logger
+from services.exceptions import BatchInterruptedException, QuotaExhaustedException
+
+SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "1000"))
+SESSION_CACHE_FLUSH_EVENTS = int(os.getenv("SESSION_CACHE_FLUSH_EVENTS", "20"))
+SESSION_CACHE_FLUSH_INTERVAL_S = float(os.getenv("SESSION_CACHE_FLUSH_INTERVAL_S", "5"))
+SESSION_CACHE_IDLE_S = float(os.getenv("SESSION_CACHE_IDLE_S", "300"))
+
+
+@dataclass
+class SessionWorkingSet:
+    """Observer-owned state of one live session, plus writes not yet flushed."""
+    session_id: str
+    user_id: str
+    permit_type: str
+    started_at: datetime
+    persisted: bool  # sessions row already exists
+    pending_events: list[dict] = field(default_factory=list)
+    pending_sources: list[dict] = field(default_factory=list)
+    open_input: Optional[dict] = None  # typing run still being coalesced
+    last_seen: float = field(default_factory=time.monotonic)
+    # Streaming prefix match (services/prefix_matcher.py); never persisted
+    prefix: Optional[PrefixState] = None
+    pending_match: Optional[PrefixMatch] = None  # found, waiting for an event with no other SSE
+    early_match: Optional[dict] = None  # last early match sent, for the SSE payload
+    matched_spec_id: Optional[str] = None
+
+    @property
+    def dirty(self) -> bool:
+        return (
+            not self.persisted
+            or self.open_input is not None
+            or bool(self.pending_events or self.pending_sources)
+        )
+
+    def append(self, event: dict) -> None:
+        """Queue an event, folding same-element keystrokes into the open input run."""
+        if self.open_input is not None:
+            merged = input_coalescer.merge(self.open_input, event)
+            if merged is not None:
+                self.open_input = merged
+                return
+            self.close_run()
+        if input_coalescer.opens_run(event):
+            self.open_input = event
+        else:
+            self.pending_events.append(event)
+
+    def close_run(self) -> None:
+        if self.open_input is not None:
+            self.pending_events.append(self.open_input)
+            self.open_input = None
+
+
+class SessionStateCache:
+    """
+    LRU of live session working sets for the observer path.
+
+    Events and extracted knowledge sources accumulate in memory and are written
+    to SQLite when a session has SESSION_CACHE_FLUSH_EVENTS pending events, on
+    the periodic flush, on submit (before pattern detection), on LRU/idle
+    eviction and on shutdown. Only observer-owned columns are touched on flush
+    (new ui_events rows, event_count, appended knowledge_sources), so other
+    writers of SessionRecord are never clobbered. An open typing run is only
+    written by forced flushes so later keystrokes can still be coalesced.
+
+    Every write goes through a cache-owned Session and commits before it
+    returns. Pending state is only dropped from the working set once that
+    commit succeeds, so a failed write leaves it queued for the next flush.
+    Writes are synchronous on the event loop, so two writes of one working
+    set never interleave, and no request transaction has to stay open around
+    them.
+    """
+
+    def __init__(
+        self,
+        max_size: int = SESSION_CACHE_MAX,
+        flush_events: int = SESSION_CACHE_FLUSH_EVENTS,
+        flush_interval_s: float = SESSION_CACHE_FLUSH_INTERVAL_S,
+        idle_s: float = SESSION_CACHE_IDLE_S,
+    ):
+        self.max_size = max(1, max_size)
+        self.flush_events = max(1, flush_events)
+        self.flush_interval_s = flush_interval_s
+        self.idle_s = idle_s
+        self._sets: OrderedDict[str, SessionWorkingSet] = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, session_id: str) -> Optional[SessionWorkingSet]:
+        ws = self._sets.get(session_id)
+        if ws is not None:
+            self._sets.move_to_end(session_id)
+            ws.last_seen = time.monotonic()
+        return ws
+
+    def put(self, ws: SessionWorkingSet) -> None:
+        """
+        Cache a working set, writing out least-recently-used sets over
+        capacity. A set whose write fails stays cached until a later flush.
+        """
+        self._sets[ws.session_id] = ws
+        over = len(self._sets) - self.max_size
+        for session_id in list(self._sets)[:max(0, over)]:
+            if self._try_write(self._sets[session_id]):
+                del self._sets[session_id]
+
+    def maybe_flush(self, ws: SessionWorkingSet) -> None:
+        if len(ws.pending_events) >= self.flush_events:
+            self._try_write(ws, close_run=False)
+
+    def flush(
+        self,
+        session_id: str,
+        db: Session,
+        evict: bool = False,
+    ) -> Optional[SessionRecord]:
+        """
+        Write out one session's pending state and return its record, freshly
+        loaded on db. Raises if the write fails; the working set then stays
+        cached with its pending state.
+        """
+        ws = self._sets.get(session_id)
+        if ws is not None and ws.dirty:
+            self._write(ws)
+        if evict:
+            self._sets.pop(session_id, None)
+        return db.get(SessionRecord, session_id, populate_existing=True)
+
+    def flush_all(self, evict_idle: bool = False) -> None:
+        """
+        Write out every dirty session. The periodic caller (evict_idle=True)
+        leaves open typing runs in memory unless the session has gone idle.
+        """
+        from db import engine  # avoid circular at module level
+
+        now = time.monotonic()
+        written = failed = 0
+        with Session(engine) as db:
+            for session_id, ws in list(self._sets.items()):
+                idle = evict_idle and now - ws.last_seen > self.idle_s
+                if ws.dirty:
+                    if self._try_write(ws, close_run=idle or not evict_idle, db=db):
+                        written += 1
+                    else:
+                        failed += 1
+                        continue  # keep it cached so the next flush retries
+                if idle:
+                    del self._sets[session_id]
+        if written:
+            logger.info(f"[Observer] Session cache flushed {written} session(s)")
+        if failed:
+            logger.warning(f"[Observer] Session cache kept {failed} session(s) for retry")
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the periodic flusher and write out everything still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.flush_all()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            try:
+                self.flush_all(evict_idle=True)
+            except Exception as exc:
+                logger.error(f"[Observer] Session cache flush failed: {exc}")
+
+    def _try_write(
+        self,
+        ws: SessionWorkingSet,
+        close_run: bool = True,
+        db: Optional[Session] = None,
+    ) -> bool:
+        try:
+            self._write(ws, close_run=close_run, db=db)
+            return True
+        except Exception as exc:
+            logger.error(f"[Observer] Could not write session {ws.session_id}: {exc}")
+            return False
+
+    def _write(
+        self,
+        ws: SessionWorkingSet,
+        close_run: bool = True,
+        db: Optional[Session] = None,
+    ) -> None:
+        """Commit the working set's pending writes, then drop what was written."""
+        if db is None:
+            from db import engine  # avoid circular at module level
+
+            with Session(engine) as own_db:
+                return self._write(ws, close_run, own_db)
+        if close_run:
+            ws.close_run()
+        events = list(ws.pending_events)
+        sources = list(ws.pending_sources)
+        try:
+            record = db.get(SessionRecord, ws.session_id, populate_existing=True)
+            if record is None:
+                record = SessionRecord(
+                    session_id=ws.session_id,
+                    user_id=ws.user_id,
+                    permit_type=ws.permit_type,
+                    state=PatternState.COLLECTING,
+                    started_at=ws.started_at,
+                )
+            event_log.append_many(record, events, db)
+            if sources:
+                record.knowledge_sources = [*(record.knowledge_sources or []), *sources]
+            db.add(record)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        ws.persisted = True
+        del ws.pending_events[:len(events)]
+        del ws.pending_sources[:len(sources)]
+
+
+session_cache = SessionStateCache()
 
 
 class ObserverAgent:
@@ -17,6 +251,7 @@ class ObserverAgent:
     Receives UIEvents and drives the per-session state machine.
     Vision calls happen on screen_switch events.
     Pattern detection happens on session complete (submit event).
+    Live session state is held in session_cache and flushed in batches.
     """
 
     async def handle_event(
@@ -24,23 +259,18 @@ class ObserverAgent:
         event: UIEvent,
         db: Session,
     ) -> tuple[Optional[str], Optional[object]]:
-        """Process one UIEvent. Returns SSEEventType if broadcast needed."""
-
-        session = db.get(SessionRecord, event.session_id)
-        if session is None:
-            permit_type = event.permit_type or self._infer_permit_type(event)
-            session = SessionRecord(
-                session_id=event.session_id,
-                user_id=event.user_id,
-                permit_type=permit_type,
-                state=PatternState.COLLECTING,
-                events=[],
-                started_at=datetime.utcnow(),
-            )
-            db.add(session)
-            db.commit()
-            logger.info(f"[Observer] Session {event.session_id} started")
+        """
+        Process one UIEvent. Returns SSEEventType if broadcast needed, and the
+        session (a SessionWorkingSet, or the SessionRecord once submitted).
+        Event writes go through session_cache, which commits on its own; db is
+        only written on submit, so no transaction stays open across the
+        step-label, vision or embedding awaits.
+        """
+        event = await self._record(event, db)
+        return await self._react(event, db)
 
+    async def _record(self, event: UIEvent, db: Session) -> UIEvent:
+        """Label (teach mode), store the screenshot and queue the event on its working set."""
         # In teach-me mode: generate step description in realtime
         if event.capture_mode == "teach" and not event.step_description:
             try:
@@ -50,13 +280,26 @@ class ObserverAgent:
             except Exception:
                 pass  # step label failure is non-fatal
 
-        # Accumulate events
-        events_list = list(session.events or [])
-        events_list.append(event.model_dump(mode="json"))
-        session.events = events_list
-        db.add(session)
-        db.commit()
+        # Queue for the session's event log (no rewrite of prior events).
+        # Screenshots go to the blob store; the stored event keeps only the hash.
+        stored = event.model_dump(mode="json", exclude={"screenshot_b64"})
+        stored["screenshot_ref"] = blob_store.event_ref(
+            event.session_id, event.screenshot_b64, event.screenshot_ref
+        )
+        if event.screenshot_b64 and stored["screenshot_ref"] is None:
+            event = event.model_copy(update={"screenshot_b64": None})  # malformed — no vision call either
+        ws = self._working_set(event, db)
+        ws.append(stored)
+        if event.event_type != "submit":
+            self._match_prefix(ws, event)
+        return event
 
+    async def _react(
+        self,
+        event: UIEvent,
+        db: Session,
+    ) -> tuple[Optional[str], Optional[object]]:
+        """Model work for a recorded event: vision, detection on submit, early matches."""
         sse_type: Optional[str] = None
 
         # Vision extraction on screen_switch
@@ -66,18 +309,17 @@ class ObserverAgent:
                 screen_name=event.screen_name,
                 session_id=event.session_id,
             )
-            existing = list(session.knowledge_sources or [])
-            for s in sources:
-                existing.append(s.model_dump())
-            session.knowledge_sources = existing
-            db.add(session)
-            db.commit()
+            self._working_set(event, db).pending_sources.extend(
+                s.model_dump() for s in sources
+            )
 
             if sources:
                 sse_type = SSEEventType.KNOWLEDGE_EXTRACTED
 
-        # Pattern detection on submit
+        # Pattern detection on submit — the detector reads events from the DB,
+        # so the session is flushed (and leaves the cache) first
         if event.event_type == "submit":
+            session = session_cache.flush(event.session_id, db, evict=True)
             session.state = PatternState.FINGERPRINTING
             session.completed_at = datetime.utcnow()
             db.add(session)
@@ -89,8 +331,111 @@ class ObserverAgent:
             result = await pattern_detector.process_session_complete(session, db)
             if result:
                 sse_type = result
+            return sse_type, session
+
+        ws = self._working_set(event, db)
+        if sse_type is None and ws.pending_match is not None:
+            sse_type = self._emit_early_match(ws)
+        session_cache.maybe_flush(ws)
+
+        return sse_type, ws
+
+    async def handle_batch(
+        self,
+        events: list[UIEvent],
+        db: Session,
+    ) -> tuple[list[tuple[Optional[str], Optional[object]]], Optional[int]]:
+        """
+        Process an ordered run of UIEvents belonging to one session. Events
+        accumulate in the session's working set and reach SQLite in
+        session_cache's batched flushes. Returns one (sse_type, session)
+        result per handled event so the caller can broadcast exactly what
+        per-event ingestion would have, plus the index of the first event
+        not handled.
 
-        return sse_type, session
+        The batch stops at the first QuotaExhaustedException. Each event is
+        recorded before any model call, so the event that hit the quota is
+        kept (without its vision or detection result), and the index points
+        just past it. The index is None when every event was handled. Any
+        other error is raised as BatchInterruptedException, carrying the
+        same index.
+        """
+        results: list[tuple[Optional[str], Optional[object]]] = []
+        for i, event in enumerate(events):
+            try:
+                event = await self._record(event, db)
+            except Exception as exc:
+                raise BatchInterruptedException(i, exc) from exc
+            try:
+                results.append(await self._react(event, db))
+            except QuotaExhaustedException:
+                logger.warning(
+                    f"[Observer] Quota exhausted on event {i + 1}/{len(events)} of "
+                    f"{event.session_id} — {len(events) - i - 1} left for the client to resend"
+                )
+                return results, i + 1
+            except Exception as exc:
+                raise BatchInterruptedException(i + 1, exc) from exc
+        return results, None
+
+    def _match_prefix(self, ws: SessionWorkingSet, event: UIEvent) -> None:
+        """Feed one event to the streaming matcher; park a new match on the working set."""
+        if ws.prefix is None:
+            ws.prefix = prefix_matcher.new_state()
+        match = prefix_matcher.observe(
+            ws.prefix, event.event_type, event.screen_name, event.element_selector
+        )
+        if match is not None:
+            ws.pending_match = match
+
+    def _emit_early_match(self, ws: SessionWorkingSet) -> str:
+        match, ws.pending_match = ws.pending_match, None
+        pattern = match.pattern
+        ws.early_match = {
+            "kind": pattern.kind,
+            "ref_id": pattern.ref_id,
+            "permit_type": pattern.permit_type,
+            "confidence": match.confidence,
+            "coverage": match.coverage,
+        }
+        if pattern.kind == "spec":
+            ws.matched_spec_id = pattern.ref_id
+        logger.info(
+            f"[PrefixMatcher] Early {match.sse_type.value} for {ws.session_id} | "
+            f"{pattern.kind}={pattern.ref_id[:8]} ({pattern.permit_type}) "
+            f"confidence={match.confidence} coverage={match.coverage}"
+        )
+        return match.sse_type
+
+    def _working_set(self, event: UIEvent, db: Session) -> SessionWorkingSet:
+        """
+        Resolve the cached working set, loading it on a miss. Called again after
+        every await because the set may have been evicted in the meantime.
+        """
+        ws = session_cache.get(event.session_id)
+        if ws is None:
+            ws = self._load_working_set(event, db)
+            session_cache.put(ws)
+        return ws
+
+    def _load_working_set(self, event: UIEvent, db: Session) -> SessionWorkingSet:
+        record = db.get(SessionRecord, event.session_id)
+        if record is not None:
+            return SessionWorkingSet(
+                session_id=record.session_id,
+                user_id=record.user_id,
+                permit_type=record.permit_type,
+                started_at=record.started_at,
+                persisted=True,
+            )
+        logger.info(f"[Observer] Session {event.session_id} started")
+        return SessionWorkingSet(
+            session_id=event.session_id,
+            user_id=event.user_id,
+            permit_type=event.permit_type or self._infer_permit_type(event),
+            started_at=datetime.utcnow(),
+            persisted=False,
+        )
 
     def _infer_permit_type(self, event: UIEvent) -> str:
         screen = event.screen_name.lower()
@@ -10,6 +10,8 @@ from google import genai
 from models.agent_spec import NarrowAgentSpec, TrustLevel
 from models.session import SessionRecord
 from services.embedding_service import embedding_service
+from services.event_log import event_log
+from services.exceptions import QuotaExhaustedException
 from services.log_streamer import logger
 
 
@@ -65,13 +67,14 @@ class SpecBuilderAgent:
         self,
         session: SessionRecord,
         correction: Optional[str] = None,
+        permit_type: Optional[str] = None,
     ) -> str:
         # Build a causally-threaded event summary: for teach-mode events, include
         # step_description (Gemini-generated label) and the active knowledge source.
         sources = session.confirmed_sources or session.knowledge_sources or []
         active_source: Optional[dict] = None
         event_lines = []
-        for e in (session.events or []):
+        for e in event_log.iter_events(session.session_id):
             # Track the last knowledge source seen before this event
             if e.get("screen_name") in ("POLICY_REFERENCE", "CODE_ENFORCEMENT"):
                 for s in sources:
@@ -122,7 +125,7 @@ INSTRUCTIONS:
         return f"""You are building a NarrowAgentSpec — a precise specification for a narrow AI agent
 that automates a repetitive permit processing workflow.
 
-OBSERVED ACTION TRACE (permit_type={session.permit_type}):
+OBSERVED ACTION TRACE (permit_type={permit_type or session.permit_type}):
 {events_summary}
 
 CONFIRMED KNOWLEDGE SOURCES:
@@ -151,8 +154,13 @@ Return valid JSON matching the schema. No markdown, no explanation.
         self,
         session: SessionRecord,
         correction: Optional[str] = None,
+        permit_type: Optional[str] = None,
     ) -> NarrowAgentSpec:
-        prompt = self._build_prompt(session, correction)
+        """
+        permit_type overrides the session's own label, e.g. with the label of a
+        workflow cluster the session represents.
+        """
+        prompt = self._build_prompt(session, correction, permit_type)
         token_estimate = len(prompt.split())
 
         logger.info(
@@ -160,14 +168,20 @@ Return valid JSON matching the schema. No markdown, no explanation.
         )
         t0 = time.time()
 
-        response = await self.client.aio.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config={
-                "response_mime_type": "application/json",
-                "response_schema": SPEC_SCHEMA,
-            },
-        )
+        try:
+            response = await self.client.aio.models.generate_content(
+                model="gemini-2.5-flash",
+                contents=prompt,
+                config={
+                    "response_mime_type": "application/json",
+                    "response_schema": SPEC_SCHEMA,
+                },
+            )
+        except Exception as e:
+            msg = str(e)
+            if any(k in msg for k in ("429", "quota", "RESOURCE_EXHAUSTED", "Quota")):
+                raise QuotaExhaustedException(msg) from e
+            raise
         latency_ms = int((time.time() - t0) * 1000)
 
         raw = json.loads(response.text)
@@ -193,7 +207,7 @@ Return valid JSON matching the schema. No markdown, no explanation.
             id=str(uuid4()),
             name=raw["name"],
             description=raw["description"],
-            permit_type=raw["permit_type"],
+            permit_type=permit_type or raw["permit_type"],
             trigger_pattern=raw["trigger_pattern"],
             action_sequence=raw["action_sequence"],
             knowledge_sources=raw["knowledge_sources"],
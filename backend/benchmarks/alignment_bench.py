@@ -0,0 +1,107 @@
+"""
+Throughput of the batched edit-distance scorer (services/sequence_scorer.py).
+
+--candidates synthetic traces are drawn from --workflows workflows. Each
+workflow is a --steps long walk over a shared vocabulary of screens and
+selectors, and each trace replays one workflow with random detours and
+dropped steps. A fresh replay is then scored against all candidates with
+SequenceScorer.one_vs_many. For each trace length the script reports:
+  - median and p90 time for one query vs all candidates, and comparisons/s
+  - mean similarity to same-workflow and to other-workflow candidates, and
+    the share of each at or above PATTERN_CONFIDENCE_MIN
+For scale, it also times a float32 768-dim cosine over the same number of
+rows, as the embedding path does once the query vector exists. That
+excludes the embedding call the alignment scorer does not need.
+
+    cd backend && python -m benchmarks.alignment_bench [--candidates 10000] [--steps 20,60]
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import statistics
+import time
+
+import numpy as np
+
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+
+from services.sequence_scorer import SequenceScorer  # noqa: E402
+
+THRESHOLD = float(os.getenv("PATTERN_CONFIDENCE_MIN", "0.85"))
+EVENT_TYPES = ["click", "navigate", "input", "screen_switch"]
+
+
+def make_workflow(rng: random.Random, steps: int, screens: int, selectors: int) -> list[dict]:
+    return [
+        {"event_type": rng.choice(EVENT_TYPES), "screen_name": f"SCREEN_{rng.randrange(screens)}",
+         "element_selector": f"field_{chr(97 + rng.randrange(26))}{chr(97 + rng.randrange(selectors // 26 + 1))}"}
+        for _ in range(steps)
+    ]
+
+
+def replay(rng: random.Random, workflow: list[dict], noise: float, screens: int, selectors: int) -> list[dict]:
+    out = []
+    for step in workflow:
+        roll = rng.random()
+        if roll < noise / 2:
+            continue  # dropped step
+        if roll < noise:
+            out.extend(make_workflow(rng, 1, screens, selectors))  # detour
+        out.append(step)
+    return out
+
+
+def timed(fn, repeats: int) -> list[float]:
+    out = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return sorted(out)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--candidates", type=int, default=10_000)
+    parser.add_argument("--workflows", type=int, default=200)
+    parser.add_argument("--steps", default="20,60")
+    parser.add_argument("--screens", type=int, default=12)
+    parser.add_argument("--selectors", type=int, default=300)
+    parser.add_argument("--noise", type=float, default=0.1, help="chance per step of a detour or drop")
+    parser.add_argument("--repeats", type=int, default=15)
+    args = parser.parse_args()
+    rng = random.Random(21)
+
+    vectors = np.random.default_rng(21).standard_normal((args.candidates, 768)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    cos = timed(lambda: vectors @ vectors[0], args.repeats)
+    print(f"float32 cosine, 1 vs {args.candidates}: median {statistics.median(cos):.2f}ms (excludes the embed call)")
+
+    for steps in (int(s) for s in args.steps.split(",")):
+        scorer = SequenceScorer(max_steps=max(200, steps * 2))
+        workflows = [make_workflow(rng, steps, args.screens, args.selectors) for _ in range(args.workflows)]
+        labels = [rng.randrange(args.workflows) for _ in range(args.candidates)]
+        candidates = [scorer.encode(replay(rng, workflows[w], args.noise, args.screens, args.selectors))
+                      for w in labels]
+        target = rng.randrange(args.workflows)
+        query = scorer.encode(replay(rng, workflows[target], args.noise, args.screens, args.selectors))
+
+        runs = timed(lambda: scorer.one_vs_many(query, candidates), args.repeats)
+        sims = scorer.one_vs_many(query, candidates)
+        same = np.array([w == target for w in labels])
+        median = statistics.median(runs)
+        print(
+            f"steps~{steps}: 1 vs {args.candidates} median {median:.1f}ms  "
+            f"p90 {runs[int(len(runs) * 0.9)]:.1f}ms  ({args.candidates / median * 1000:,.0f} comparisons/s)"
+        )
+        print(
+            f"  same workflow ({same.sum()}): mean {sims[same].mean():.3f}, "
+            f"{(sims[same] >= THRESHOLD).mean():.0%} >= {THRESHOLD}  |  "
+            f"other ({(~same).sum()}): mean {sims[~same].mean():.3f}, "
+            f"{(sims[~same] >= THRESHOLD).mean():.1%} >= {THRESHOLD}"
+        )
+
+
+if __name__ == "__main__":
+    main()
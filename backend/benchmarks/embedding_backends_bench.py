@@ -0,0 +1,138 @@
+"""
+Local feature hashing vs Gemini embeddings on the seeded workflows.
+
+For every seeded permit type, builds the two seed sessions (main._make_events)
+plus live-style variants: new parcel ids and values, a repeated step, a
+skipped step. It also builds off-pattern sessions of the same permit type
+(steps reordered, a different constraint field) that should not match.
+Every same-permit-type pair is scored with each backend, the way
+PatternDetector scores them. The output is per-text latency, the score
+distributions, and how often the two backends agree on
+score >= PATTERN_CONFIDENCE_MIN.
+
+The Gemini half runs only when GEMINI_API_KEY holds a real key.
+
+    cd backend && python -m benchmarks.embedding_backends_bench [--variants 6] [--threshold 0.85]
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import time
+from datetime import datetime
+
+_HAVE_KEY = bool(os.environ.get("GEMINI_API_KEY"))
+os.environ.setdefault("GEMINI_API_KEY", "offline")  # other agents build clients at import
+
+from main import _make_events  # noqa: E402
+from models.event import ActionTrace  # noqa: E402
+from services.embedding_providers import GeminiEmbeddingProvider, LocalHashingProvider  # noqa: E402
+from services.embedding_service import EmbeddingService  # noqa: E402
+
+SEEDED = {
+    "fence_variance": ("max_permitted_height", "6 ft"),
+    "solar_permit": ("max_permitted_height", "20 kW max system size"),
+    "home_occupation": ("max_permitted_height", "Allowed — no exterior alterations"),
+    "tree_removal": ("max_permitted_height", "Removal approved — replacement required 1:1"),
+    "deck_permit": ("max_permitted_height", "30 in max height without railing permit"),
+}
+
+
+def build_traces(variants: int, rng: random.Random) -> list[tuple[str, bool, str]]:
+    """(permit_type, on_pattern, serialized trace) for seeds, variants and off-pattern sessions."""
+    serializer = EmbeddingService(provider=LocalHashingProvider())
+    out = []
+    base = datetime(2024, 3, 10, 9, 0, 0)
+    for permit_type, (field, value) in SEEDED.items():
+        for i in range(2 + variants + 2):
+            sid = f"{permit_type}-{i:02d}"
+            parcel = f"R2-{rng.randint(100, 999)}"
+            on_pattern = i < 2 + variants
+            events = _make_events(sid, "permit-tech-001", base, parcel, "R-2",
+                                  field, value if i < 2 else f"{value} ({rng.randint(1, 9)})")
+            if 2 <= i < 2 + variants:
+                op = i % 3
+                if op == 0:
+                    events.insert(3, events[2].model_copy())   # re-typed parcel id
+                elif op == 1:
+                    del events[5]                               # skipped policy tab
+            elif not on_pattern:
+                rng.shuffle(events)                             # same steps, no workflow
+                if i % 2:
+                    for e in events:
+                        if e.event_type == "input":
+                            e.element_selector = "decision_notes"
+            trace = ActionTrace(session_id=sid, user_id="permit-tech-001",
+                                permit_type=permit_type, events=events, completed_at=base)
+            out.append((permit_type, on_pattern, serializer.serialize_trace(trace)))
+    return out
+
+
+def pair_scores(traces, vectors, service: EmbeddingService) -> list[tuple[bool, float]]:
+    """(both on-pattern, cosine) for every same-permit-type pair."""
+    scores = []
+    for (a, b) in itertools.combinations(range(len(traces)), 2):
+        if traces[a][0] != traces[b][0]:
+            continue
+        same = traces[a][1] and traces[b][1]
+        scores.append((same, service.cosine_similarity(vectors[a], vectors[b])))
+    return scores
+
+
+def summarise(name: str, scores, per_text_ms: float, threshold: float) -> list[bool]:
+    on = [s for same, s in scores if same]
+    off = [s for same, s in scores if not same]
+    hits = [s >= threshold for _, s in scores]
+    recall = sum(s >= threshold for s in on) / len(on)
+    false_pos = sum(s >= threshold for s in off) / len(off)
+    print(f"{name:<22} {per_text_ms:>9.3f} {statistics.mean(on):>8.3f} {min(on):>8.3f} "
+          f"{statistics.mean(off):>8.3f} {max(off):>8.3f} {recall:>7.1%} {false_pos:>7.1%}")
+    return hits
+
+
+async def main_async(args) -> None:
+    rng = random.Random(args.seed)
+    traces = build_traces(args.variants, rng)
+    texts = [t for _, _, t in traces]
+    print(f"{len(traces)} traces, {len(SEEDED)} permit types, threshold {args.threshold}\n")
+    print(f"{'backend':<22} {'ms/text':>9} {'on mean':>8} {'on min':>8} "
+          f"{'off mean':>8} {'off max':>8} {'recall':>7} {'FP':>7}")
+
+    local = EmbeddingService(provider=LocalHashingProvider())
+    t0 = time.perf_counter()
+    local_vecs = await local.provider.embed_texts(texts)  # uncached: vectorising cost only
+    local_ms = (time.perf_counter() - t0) * 1000 / len(texts)
+    local_hits = summarise(local.provider.model, pair_scores(traces, local_vecs, local),
+                           local_ms, args.threshold)
+
+    if not _HAVE_KEY:
+        print("\nGEMINI_API_KEY not set — Gemini comparison skipped.")
+        return
+
+    gemini = GeminiEmbeddingProvider()
+    t0 = time.perf_counter()
+    gemini_vecs = []
+    for text in texts:  # one call per text, as embed() did before coalescing
+        gemini_vecs.extend(await gemini.embed_texts([text]))
+    gemini_ms = (time.perf_counter() - t0) * 1000 / len(texts)
+    gemini_hits = summarise("gemini-embedding-001", pair_scores(traces, gemini_vecs, local),
+                            gemini_ms, args.threshold)
+
+    agree = sum(a == b for a, b in zip(local_hits, gemini_hits)) / len(local_hits)
+    print(f"\nDecision agreement (score >= {args.threshold}): {agree:.1%} of {len(local_hits)} pairs")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variants", type=int, default=6)
+    parser.add_argument("--threshold", type=float,
+                        default=float(os.getenv("PATTERN_CONFIDENCE_MIN", "0.85")))
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+IVF-flat market index vs exact scan over spec embeddings.
+
+Specs are synthetic 768-dim vectors drawn around --clusters centres, like
+forks of a few hundred base workflows. Half of the queries are noisy copies
+of existing specs (true matches, cosine ~0.9). The other half are fresh
+draws (no match). For each nprobe the script reports:
+  - median query latency
+  - recall@1 against the exact scan, over match queries and over all queries
+  - threshold agreement: the share of queries where ANN and exact give the
+    same match/no-match decision at AGENTVERSE_MATCH_THRESHOLD
+It also reports training, save and restore time.
+
+    cd backend && python -m benchmarks.market_ann_bench [--sizes 10000,50000] [--nprobe 1,2,4,8,16,32]
+"""
+from __future__ import annotations
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+
+from services.ann_index import IVFIndex  # noqa: E402
+from services.similarity_index import SimilarityPartition  # noqa: E402
+
+DIMS = 768
+THRESHOLD = float(os.getenv("AGENTVERSE_MATCH_THRESHOLD", "0.85"))
+
+
+def make_specs(n: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centres = rng.standard_normal((clusters, DIMS), dtype=np.float32)
+    out = np.empty((n, DIMS), dtype=np.float32)
+    for start in range(0, n, 50_000):
+        size = min(50_000, n - start)
+        out[start:start + size] = (
+            centres[rng.integers(0, clusters, size)]
+            + 0.6 * rng.standard_normal((size, DIMS), dtype=np.float32)
+        )
+    return out
+
+
+def make_queries(specs: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    near = specs[rng.integers(0, len(specs), count // 2)]
+    near = near + 0.35 * np.linalg.norm(near, axis=1, keepdims=True) / np.sqrt(DIMS) * \
+        rng.standard_normal(near.shape, dtype=np.float32)
+    far = rng.standard_normal((count - len(near), DIMS), dtype=np.float32)
+    return np.vstack([near, far])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,50000")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32")
+    parser.add_argument("--clusters", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    rng = np.random.default_rng(14)
+
+    for n in (int(s) for s in args.sizes.split(",")):
+        specs = make_specs(n, args.clusters, rng)
+        partition = SimilarityPartition(dims=DIMS)
+        partition.reserve(n)
+        partition.add_many([f"spec-{i}" for i in range(n)], specs)
+        queries = make_queries(specs, args.queries, rng)
+
+        t0 = time.perf_counter()
+        ivf = IVFIndex.train(partition)
+        train_s = time.perf_counter() - t0
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ann.npz")
+            ids, lists = ivf.assignments()
+            t0 = time.perf_counter()
+            np.savez(path, ids=np.array(partition.ids), matrix=partition.matrix,
+                     centroids=ivf.centroids, assigned_ids=np.array(ids), assigned_lists=lists)
+            save_ms = (time.perf_counter() - t0) * 1000
+            t0 = time.perf_counter()
+            with np.load(path) as f:
+                restored = SimilarityPartition(dims=DIMS)
+                restored.reserve(n)
+                restored.add_many(f["ids"].tolist(), f["matrix"])
+                back = IVFIndex(f["centroids"])
+                for item_id, list_no in zip(f["assigned_ids"].tolist(), f["assigned_lists"].tolist()):
+                    back.assign(item_id, list_no)
+            restore_ms = (time.perf_counter() - t0) * 1000
+
+        exact, exact_ms = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            exact.append(partition.query(q, k=1)[0])
+            exact_ms.append((time.perf_counter() - t0) * 1000)
+
+        matching = sum(s >= THRESHOLD for _, s in exact)
+        print(f"\nN={n}  nlist={ivf.nlist}  train {train_s:.2f}s  save {save_ms:.0f}ms  "
+              f"restore {restore_ms:.0f}ms  queries with a match >= {THRESHOLD}: "
+              f"{matching}/{len(queries)}")
+        print(f"{'nprobe':>7} {'ms/query':>9} {'recall@1 match':>15} {'recall@1 all':>13} {'decision agree':>15}")
+        print(f"{'exact':>7} {statistics.median(exact_ms):>9.2f} {1:>15.1%} {1:>13.1%} {1:>15.1%}")
+        for nprobe in (int(s) for s in args.nprobe.split(",")):
+            hits = match_hits = agree = 0
+            times = []
+            for q, (best_id, best_score) in zip(queries, exact):
+                t0 = time.perf_counter()
+                found = ivf.search(partition, q, k=1, nprobe=nprobe)
+                times.append((time.perf_counter() - t0) * 1000)
+                ann_id, ann_score = found[0] if found else (None, 0.0)
+                hits += ann_id == best_id
+                match_hits += ann_id == best_id and best_score >= THRESHOLD
+                agree += (ann_score >= THRESHOLD) == (best_score >= THRESHOLD)
+            print(f"{nprobe:>7} {statistics.median(times):>9.2f} "
+                  f"{match_hits / max(matching, 1):>15.1%} {hits / len(queries):>13.1%} "
+                  f"{agree / len(queries):>15.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Matryoshka prefix filter vs the exhaustive full-dimension scan.
+
+Vectors are synthetic 768-dim draws around --clusters workflow centres. In
+real Matryoshka embeddings the leading dimensions carry most of the signal.
+To mimic that, per-dimension scale decays as 1 / sqrt(1 + i / --decay).
+With --decay 0 the spectrum is flat, which is closer to a non-Matryoshka
+model such as the local hashing provider. On flat data the prefix is only a
+random subset of coordinates, and agreement drops.
+
+For each prefix size and margin the script reports, over --queries fresh
+draws:
+  - median latency of the detector query (top 20 plus every row >=
+    PATTERN_CONFIDENCE_MIN) and of the market query (top 5, decision on the
+    best score vs AGENTVERSE_MATCH_THRESHOLD)
+  - detector agreement: share of queries with the same count of rows >=
+    threshold, and the share of exact matches found
+  - market agreement: share of queries with the same match/no-match
+    decision and the same best id
+  - rows scored at full dimension per detector query
+
+    cd backend && python -m benchmarks.matryoshka_bench [--n 100000] [--prefix 64,128,256] [--margin 0.05,0.1,0.15]
+"""
+from __future__ import annotations
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+
+from services.similarity_index import SimilarityPartition  # noqa: E402
+
+DIMS = 768
+PATTERN_THRESHOLD = float(os.getenv("PATTERN_CONFIDENCE_MIN", "0.85"))
+MARKET_THRESHOLD = float(os.getenv("AGENTVERSE_MATCH_THRESHOLD", "0.85"))
+CHUNK = 50_000
+
+
+def make_vectors(n: int, centres: np.ndarray, noise: float, spectrum: np.ndarray,
+                 rng: np.random.Generator) -> np.ndarray:
+    out = np.empty((n, DIMS), dtype=np.float32)
+    for start in range(0, n, CHUNK):
+        size = min(CHUNK, n - start)
+        block = centres[rng.integers(0, len(centres), size)] + \
+            noise * rng.standard_normal((size, DIMS), dtype=np.float32)
+        out[start:start + size] = block * spectrum
+    return out
+
+
+def build(vectors: np.ndarray, ids: list[str], prefix_dims: int, margin: float) -> SimilarityPartition:
+    partition = SimilarityPartition(dims=DIMS, prefix_dims=prefix_dims, prefix_margin=margin)
+    partition.reserve(len(ids))
+    for start in range(0, len(ids), CHUNK):
+        partition.add_many(ids[start:start + CHUNK], vectors[start:start + CHUNK])
+    return partition
+
+
+def run_queries(partition: SimilarityPartition, queries: np.ndarray):
+    detector, market, det_ms, mkt_ms = [], [], [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        detector.append(partition.query(q, k=20, threshold=PATTERN_THRESHOLD))
+        det_ms.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        market.append(partition.query(q, k=5, threshold=MARKET_THRESHOLD)[:5])
+        mkt_ms.append((time.perf_counter() - t0) * 1000)
+    return detector, market, statistics.median(det_ms), statistics.median(mkt_ms)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--prefix", default="64,128,256")
+    parser.add_argument("--margin", default="0.05,0.1,0.15")
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--noise", type=float, default=0.38)
+    parser.add_argument("--decay", type=float, default=64.0)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+    rng = np.random.default_rng(16)
+
+    spectrum = (1.0 / np.sqrt(1.0 + np.arange(DIMS) / args.decay) if args.decay
+                else np.ones(DIMS)).astype(np.float32)
+    centres = rng.standard_normal((args.clusters, DIMS), dtype=np.float32)
+    vectors = make_vectors(args.n, centres, args.noise, spectrum, rng)
+    ids = [f"s{i}" for i in range(args.n)]
+    queries = make_vectors(args.queries, centres, args.noise, spectrum, rng)
+
+    exact = build(vectors, ids, 0, 0.0)
+    ref_det, ref_mkt, ref_det_ms, ref_mkt_ms = run_queries(exact, queries)
+    ref_counts = [{i for i, s in r if s >= PATTERN_THRESHOLD} for r in ref_det]
+    ref_total = max(1, sum(len(m) for m in ref_counts))
+
+    print(f"N={args.n}  decay={args.decay or 'flat'}  mean detector matches/query="
+          f"{ref_total / len(queries):.0f}  market queries with a match="
+          f"{sum(r[0][1] >= MARKET_THRESHOLD for r in ref_mkt)}/{len(queries)}")
+    print(f"{'prefix':>6} {'margin':>6} {'det ms':>7} {'count agree':>12} {'match recall':>13} "
+          f"{'full rows':>10} {'mkt ms':>7} {'decision':>9} {'best id':>8} {'MB':>6}")
+    print(f"{'full':>6} {'-':>6} {ref_det_ms:>7.2f} {1:>12.1%} {1:>13.2%} {args.n:>10} "
+          f"{ref_mkt_ms:>7.2f} {1:>9.1%} {1:>8.1%} {exact.nbytes / 1e6:>6.0f}")
+    for prefix_dims in (int(p) for p in args.prefix.split(",")):
+        for margin in (float(m) for m in args.margin.split(",")):
+            partition = build(vectors, ids, prefix_dims, margin)
+            det, mkt, det_ms, mkt_ms = run_queries(partition, queries)
+            full_rows = statistics.mean(
+                len(partition._prefix_candidates(q, 20, PATTERN_THRESHOLD)) for q in queries
+            )
+            agree = found = decision = best = 0
+            for got, want in zip(det, ref_counts):
+                got = {i for i, s in got if s >= PATTERN_THRESHOLD}
+                agree += got == want
+                found += len(got & want)
+            for got, want in zip(mkt, ref_mkt):
+                decision += (got[0][1] >= MARKET_THRESHOLD) == (want[0][1] >= MARKET_THRESHOLD)
+                best += got[0][0] == want[0][0]
+            n_q = len(queries)
+            print(f"{prefix_dims:>6} {margin:>6.2f} {det_ms:>7.2f} {agree / n_q:>12.1%} "
+                  f"{found / ref_total:>13.2%} {full_rows:>10.0f} {mkt_ms:>7.2f} "
+                  f"{decision / n_q:>9.1%} {best / n_q:>8.1%} {partition.nbytes / 1e6:>6.0f}")
+
+
+if __name__ == "__main__":
+    main()
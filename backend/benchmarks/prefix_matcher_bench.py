@@ -0,0 +1,110 @@
+"""
+Per-event cost of the streaming prefix matcher on the observe path.
+
+--patterns synthetic workflows are indexed through PrefixMatcher._add. Each
+one is a --steps long walk over a shared vocabulary of screens and
+selectors, with per-record ids that the matcher normalises away. Live
+sessions then replay either a known workflow (with a few random detours)
+or a random walk. The script reports:
+  - index build time and size
+  - mean and p99 observe() time per event
+  - share of replayed sessions matched early, and the mean step at which
+    the match fired
+  - share of random sessions with a false early match
+
+    cd backend && python -m benchmarks.prefix_matcher_bench [--patterns 2000] [--sessions 2000]
+"""
+from __future__ import annotations
+import argparse
+import os
+import random
+import statistics
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+
+from services.prefix_matcher import PrefixMatcher  # noqa: E402
+
+EVENT_TYPES = ["click", "navigate", "input", "screen_switch"]
+
+
+def name(i: int) -> str:
+    """Letters-only label; digits would be normalised away as ids."""
+    out = ""
+    while True:
+        i, r = divmod(i, 26)
+        out += chr(ord("a") + r)
+        if not i:
+            return out
+
+
+def make_workflow(rng: random.Random, steps: int, screens: int, selectors: int) -> list[tuple[str, str, str]]:
+    return [
+        (rng.choice(EVENT_TYPES), f"SCREEN_{name(rng.randrange(screens))}",
+         f"field_{name(rng.randrange(selectors))}")
+        for _ in range(steps)
+    ]
+
+
+def with_ids(step: tuple[str, str, str], rng: random.Random) -> dict:
+    event_type, screen, selector = step
+    return {"event_type": event_type, "screen_name": screen,
+            "element_selector": f"{selector}_{rng.randrange(10**6)}"}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patterns", type=int, default=2000)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--screens", type=int, default=40)
+    parser.add_argument("--selectors", type=int, default=200)
+    parser.add_argument("--detour", type=float, default=0.1, help="chance of a random step per replayed step")
+    args = parser.parse_args()
+    rng = random.Random(18)
+
+    workflows = [make_workflow(rng, args.steps, args.screens, args.selectors) for _ in range(args.patterns)]
+    matcher = PrefixMatcher()
+    t0 = time.perf_counter()
+    for i, wf in enumerate(workflows):
+        matcher._add("session", f"p{i}", "bench", [with_ids(step, rng) for step in wf])
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    timings: list[int] = []
+    fired_at: list[int] = []
+    false_matches = 0
+    for n in range(args.sessions):
+        replay = n % 2 == 0
+        if replay:
+            steps = []
+            for step in workflows[rng.randrange(len(workflows))]:
+                if rng.random() < args.detour:
+                    steps.append(make_workflow(rng, 1, args.screens, args.selectors)[0])
+                steps.append(step)
+        else:
+            steps = make_workflow(rng, args.steps, args.screens, args.selectors)
+        state = matcher.new_state()
+        for pos, step in enumerate(steps):
+            e = with_ids(step, rng)
+            t = time.perf_counter_ns()
+            match = matcher.observe(state, e["event_type"], e["screen_name"], e["element_selector"])
+            timings.append(time.perf_counter_ns() - t)
+            if match is not None:
+                if replay:
+                    fired_at.append(pos + 1)
+                else:
+                    false_matches += 1
+                break
+
+    timings.sort()
+    replays = (args.sessions + 1) // 2
+    print(f"patterns={len(matcher.patterns)}  n-grams={len(matcher._table)}  build {build_ms:.0f}ms")
+    print(f"observe(): mean {statistics.mean(timings) / 1000:.1f}us  "
+          f"p99 {timings[int(len(timings) * 0.99)] / 1000:.1f}us  over {len(timings)} events")
+    print(f"replayed sessions matched early: {len(fired_at)}/{replays}  "
+          f"mean step {statistics.mean(fired_at) if fired_at else 0:.1f} of ~{args.steps}")
+    print(f"random sessions falsely matched: {false_matches}/{args.sessions - replays}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+int8 session partition with float32 rescoring vs the float32 partition.
+
+Sessions are synthetic 768-dim vectors around --clusters workflow centres,
+with noise tuned so that many same-workflow pairs land near
+PATTERN_CONFIDENCE_MIN. Each query is a fresh draw from a centre, as a newly
+completed session would be. For each size the script reports:
+  - memory: JSON-style Python float lists (the pre-BLOB representation),
+    the float32 matrix, and int8 codes plus per-row scales
+  - median latency of the detector query (top SIMILARITY_LOG_PAIRS plus every
+    row >= threshold) for exact float32, int8 only, and int8 + rescore
+  - threshold decisions: how often the number of priors >= threshold matches
+    the exact count, and the share of exact matches each mode finds
+  - recall@1 against the exact top hit
+
+The rescore loader reads from an in-memory dict here; in the service it
+reads the embedding BLOBs from SQLite, so rescore latency there also
+includes one indexed SELECT per query.
+
+    cd backend && python -m benchmarks.quantization_bench [--sizes 10000,100000]
+"""
+from __future__ import annotations
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+os.environ.setdefault("GEMINI_API_KEY", "offline")
+
+from services.similarity_index import SimilarityPartition  # noqa: E402
+
+DIMS = 768
+THRESHOLD = float(os.getenv("PATTERN_CONFIDENCE_MIN", "0.85"))
+TOP_K = 20
+CHUNK = 50_000
+
+
+def make_sessions(n: int, centres: np.ndarray, noise: float, rng: np.random.Generator) -> np.ndarray:
+    out = np.empty((n, DIMS), dtype=np.float32)
+    for start in range(0, n, CHUNK):
+        size = min(CHUNK, n - start)
+        out[start:start + size] = (
+            centres[rng.integers(0, len(centres), size)]
+            + noise * rng.standard_normal((size, DIMS), dtype=np.float32)
+        )
+    return out
+
+
+def list_bytes(dims: int) -> int:
+    """Size of one embedding held as a Python list of floats."""
+    sample = [float(i) + 0.5 for i in range(dims)]
+    return sys.getsizeof(sample) + sum(sys.getsizeof(x) for x in sample)
+
+
+def int8_only(partition: SimilarityPartition, q: np.ndarray) -> list[tuple[str, float]]:
+    """Detector query answered from the codes alone, with no rescoring."""
+    scores = partition.scores(q)
+    top = np.argpartition(-scores, TOP_K - 1)[:TOP_K]
+    keep = np.union1d(top, np.flatnonzero(scores >= THRESHOLD))
+    keep = keep[np.argsort(-scores[keep])]
+    return [(partition.ids[i], float(scores[i])) for i in keep]
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    out = fn()
+    return out, (time.perf_counter() - t0) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--clusters", type=int, default=50)
+    parser.add_argument("--noise", type=float, default=0.38)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+    rng = np.random.default_rng(15)
+    centres = rng.standard_normal((args.clusters, DIMS), dtype=np.float32)
+
+    for n in (int(s) for s in args.sizes.split(",")):
+        vectors = make_sessions(n, centres, args.noise, rng)
+        ids = [f"s{i}" for i in range(n)]
+        originals = dict(zip(ids, vectors))
+        loads = []
+
+        def loader(wanted: list[str]) -> dict[str, np.ndarray]:
+            loads.append(len(wanted))
+            return {i: originals[i] for i in wanted}
+
+        exact = SimilarityPartition(dims=DIMS)
+        quant = SimilarityPartition(dims=DIMS, quantization="int8", loader=loader)
+        for partition in (exact, quant):
+            partition.reserve(n)
+            for start in range(0, n, CHUNK):
+                partition.add_many(ids[start:start + CHUNK], vectors[start:start + CHUNK])
+        queries = make_sessions(args.queries, centres, args.noise, rng)
+
+        modes = {
+            "float32": lambda q: exact.query(q, k=TOP_K, threshold=THRESHOLD),
+            "int8": lambda q: int8_only(quant, q),
+            "int8+rescore": lambda q: quant.query(q, k=TOP_K, threshold=THRESHOLD),
+        }
+        truth = [modes["float32"](q) for q in queries]
+        truth_matches = [{i for i, s in r if s >= THRESHOLD} for r in truth]
+
+        print(f"\nN={n}  threshold={THRESHOLD}  mean exact matches/query="
+              f"{statistics.mean(len(m) for m in truth_matches):.0f}")
+        print(f"  memory: float lists {n * list_bytes(DIMS) / 1e6:,.0f} MB | "
+              f"float32 {exact.nbytes / 1e6:,.0f} MB | int8+scales {quant.nbytes / 1e6:,.0f} MB "
+              f"({exact.nbytes / quant.nbytes:.1f}x smaller than float32)")
+        print(f"  {'mode':<13} {'ms/query':>9} {'count agree':>12} {'match recall':>13} "
+              f"{'false match':>12} {'recall@1':>9}")
+        for name, fn in modes.items():
+            loads.clear()
+            times, agree, found, extra, top1 = [], 0, 0, 0, 0
+            for q, ref, ref_matches in zip(queries, truth, truth_matches):
+                got, ms = timed(lambda: fn(q))
+                times.append(ms)
+                got_matches = {i for i, s in got if s >= THRESHOLD}
+                agree += len(got_matches) == len(ref_matches)
+                found += len(got_matches & ref_matches)
+                extra += len(got_matches - ref_matches)
+                top1 += bool(got) and got[0][0] == ref[0][0]
+            total = max(1, sum(len(m) for m in truth_matches))
+            rescored = f"  ({sum(loads) / len(queries):.0f} originals fetched/query)" if loads else ""
+            print(f"  {name:<13} {statistics.median(times):>9.2f} {agree / len(queries):>12.1%} "
+                  f"{found / total:>13.2%} {extra:>12} {top1 / len(queries):>9.1%}{rescored}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+SimilarityIndex vs the per-pair cosine loop it replaced.
+
+For each partition size, random 768-dim float32 vectors are added in chunks.
+The script then times:
+  - build: add_many into a reserved partition
+  - 1×N: a full score vector plus top-10 for one query. The old loop is timed
+    on up to --loop-sample rows and extrapolated linearly to N.
+  - N×N: pairwise() over an evidence-sized id subset vs the nested loop
+  - incremental: single add() and remove() calls on the full partition
+
+    cd backend && python -m benchmarks.similarity_index_bench [--sizes 10000,100000,1000000]
+
+1M × 768 float32 is ~3 GB of matrix; use smaller --sizes on small machines.
+"""
+from __future__ import annotations
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+
+os.environ.setdefault("GEMINI_API_KEY", "offline")  # embedding_service is only used for the loop baseline
+
+from services.embedding_service import embedding_service  # noqa: E402
+from services.similarity_index import SimilarityPartition  # noqa: E402
+
+DIMS = 768
+CHUNK = 50_000
+
+
+def timed(fn, repeat: int) -> float:
+    """Median wall time of fn in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def run(n: int, args, rng: np.random.Generator) -> dict:
+    partition = SimilarityPartition(dims=DIMS)
+    partition.reserve(n + 1000)
+    t0 = time.perf_counter()
+    for start in range(0, n, CHUNK):
+        size = min(CHUNK, n - start)
+        block = rng.standard_normal((size, DIMS), dtype=np.float32)
+        partition.add_many([f"s{start + i}" for i in range(size)], block)
+    build_s = time.perf_counter() - t0
+
+    query = rng.standard_normal(DIMS, dtype=np.float32)
+    scores_ms = timed(lambda: partition.scores(query), args.repeat)
+    topk_ms = timed(lambda: partition.query(query, k=10), args.repeat)
+
+    sample = min(n, args.loop_sample)
+    rows = [partition.matrix[i].tolist() for i in range(sample)]  # JSON-list rows, as before
+    q_list = query.tolist()
+    loop_ms = timed(lambda: [embedding_service.cosine_similarity(q_list, r) for r in rows], 3)
+    loop_ms *= n / sample
+
+    subset = [f"s{i}" for i in range(min(n, args.pairwise))]
+    pair_ms = timed(lambda: partition.pairwise(subset), 3)
+    sub_rows = rows[:min(len(rows), 200)]
+    nested_ms = timed(
+        lambda: [[embedding_service.cosine_similarity(a, b) for b in sub_rows] for a in sub_rows], 1
+    ) * (len(subset) / len(sub_rows)) ** 2
+
+    extra = rng.standard_normal((1000, DIMS), dtype=np.float32)
+    t0 = time.perf_counter()
+    for i in range(1000):
+        partition.add(f"x{i}", extra[i])
+    add_us = (time.perf_counter() - t0) * 1e6 / 1000
+    t0 = time.perf_counter()
+    for i in range(1000):
+        partition.remove(f"x{i}")
+    remove_us = (time.perf_counter() - t0) * 1e6 / 1000
+
+    return {
+        "n": n,
+        "build_s": build_s,
+        "scores_ms": scores_ms,
+        "topk_ms": topk_ms,
+        "loop_ms": loop_ms,
+        "pairs": len(subset),
+        "pair_ms": pair_ms,
+        "nested_ms": nested_ms,
+        "add_us": add_us,
+        "remove_us": remove_us,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--loop-sample", type=int, default=10_000)
+    parser.add_argument("--pairwise", type=int, default=1000)
+    args = parser.parse_args()
+    rng = np.random.default_rng(13)
+
+    print(f"{'N':>9} {'build s':>8} {'1xN ms':>8} {'top10 ms':>9} {'loop ms':>10} {'speedup':>8} "
+          f"{'NxN':>6} {'NxN ms':>8} {'loop ms':>10} {'add us':>7} {'rm us':>6}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        r = run(n, args, rng)
+        print(f"{r['n']:>9} {r['build_s']:>8.2f} {r['scores_ms']:>8.2f} {r['topk_ms']:>9.2f} "
+              f"{r['loop_ms']:>10.0f} {r['loop_ms'] / r['topk_ms']:>7.0f}x "
+              f"{r['pairs']:>6} {r['pair_ms']:>8.2f} {r['nested_ms']:>10.0f} "
+              f"{r['add_us']:>7.1f} {r['remove_us']:>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Bytes-on-wire and server parse time for /api/observe/batch encodings.
+
+Simulates teach-mode sessions as capture.js sends them: clicks, inputs,
+screen switches and copies with element_context, a screenshot on every click
+and screen switch, flushed in batches of 20. Screenshots are random bytes
+(JPEG output is effectively incompressible), sized like the html2canvas
+0.5-scale / q0.6 captures.
+
+    cd backend && python -m benchmarks.wire_format_bench [--sessions 20] [--screenshot-kb 45]
+"""
+from __future__ import annotations
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from pydantic import TypeAdapter
+
+from models.event import UIEvent
+from services.wire_format import decode_body, encode_tuples, msgpack, TUPLES_TYPE
+
+SCREENS = ["APPLICATION_INBOX", "GIS_LOOKUP", "APPLICATION_FORM", "POLICY_REFERENCE", "OWNER_REGISTRY"]
+FIELDS = ["parcel_id_input", "zone_classification", "max_permitted_height", "decision_notes"]
+BATCH_SIZE = 20
+
+
+def make_session(i: int, screenshot_kb: int, rng: random.Random) -> list[dict]:
+    session_id = f"bench-session-{i:04d}"
+    t = datetime(2024, 3, 10, 9, 0, 0)
+    events = []
+    screen = SCREENS[0]
+    for step in range(rng.randint(30, 60)):
+        kind = rng.choices(["click", "input", "screen_switch", "copy"], [5, 3, 2, 1])[0]
+        if kind == "screen_switch":
+            screen = rng.choice(SCREENS)
+        field = rng.choice(FIELDS)
+        e = {
+            "session_id": session_id,
+            "user_id": "permit-tech-001",
+            "timestamp": (t + timedelta(seconds=step * 7)).isoformat() + "Z",
+            "event_type": kind,
+            "screen_name": screen,
+            "element_selector": f"#{field}" if kind == "input" else f"button.tab-{screen.lower()}",
+            "element_value": f"value-{rng.randint(0, 9999)}" if kind in ("input", "copy") else None,
+            "permit_type": "fence_variance",
+            "capture_mode": "teach",
+            "element_context": {
+                "label": field.replace("_", " ").title(),
+                "role": "textbox" if kind == "input" else "button",
+                "text": f"value-{rng.randint(0, 9999)}",
+                "position": {"x": rng.randint(0, 1400), "y": rng.randint(0, 900)},
+                "landmark": "form",
+            },
+            "step_description": None,
+        }
+        if kind in ("click", "screen_switch"):
+            e["screenshot_b64"] = base64.b64encode(os.urandom(screenshot_kb * 1024 * 3 // 4)).decode()
+        events.append(e)
+    return events
+
+
+def encodings(batch: list[dict]) -> dict[str, tuple[bytes, str, str]]:
+    """name -> (body, content_type, content_encoding)"""
+    as_json = json.dumps(batch, separators=(",", ":")).encode()
+    as_tuples = json.dumps(encode_tuples(batch), separators=(",", ":")).encode()
+    out = {
+        "json": (as_json, "application/json", ""),
+        "json+gzip": (gzip.compress(as_json, 6), "application/json", "gzip"),
+        "tuples": (as_tuples, TUPLES_TYPE, ""),
+        "tuples+gzip": (gzip.compress(as_tuples, 6), TUPLES_TYPE, "gzip"),
+    }
+    if msgpack is not None:
+        packed = msgpack.packb(encode_tuples(batch))
+        out["msgpack-tuples"] = (packed, "application/msgpack", "")
+        out["msgpack-tuples+gzip"] = (gzip.compress(packed, 6), "application/msgpack", "gzip")
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=20)
+    ap.add_argument("--screenshot-kb", type=int, default=45)
+    ap.add_argument("--no-screenshots", action="store_true")
+    args = ap.parse_args()
+
+    rng = random.Random(42)
+    batches: list[list[dict]] = []
+    total_events = 0
+    for i in range(args.sessions):
+        events = make_session(i, args.screenshot_kb, rng)
+        if args.no_screenshots:
+            for e in events:
+                e.pop("screenshot_b64", None)
+        total_events += len(events)
+        batches += [events[j:j + BATCH_SIZE] for j in range(0, len(events), BATCH_SIZE)]
+
+    validator = TypeAdapter(list[UIEvent])
+    encoded = [encodings(b) for b in batches]
+    names = list(encoded[0])
+
+    print(f"{args.sessions} sessions, {total_events} events, {len(batches)} batches "
+          f"(screenshots: {'off' if args.no_screenshots else f'{args.screenshot_kb} KB'})")
+    print(f"{'encoding':<22}{'bytes':>14}{'vs json':>10}{'decode ms':>12}{'decode+validate ms':>20}")
+    baseline = sum(len(e["json"][0]) for e in encoded)
+    for name in names:
+        size = sum(len(e[name][0]) for e in encoded)
+        t0 = time.perf_counter()
+        decoded = [decode_body(*e[name]) for e in encoded]
+        t1 = time.perf_counter()
+        for d in decoded:
+            validator.validate_python(d)
+        t2 = time.perf_counter()
+        print(f"{name:<22}{size:>14,}{size / baseline:>10.1%}"
+              f"{(t1 - t0) * 1000:>12.1f}{(t2 - t0) * 1000:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 import asyncio
+import json
 import os
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
@@ -14,12 +15,33 @@ from sqlalchemy import text
 
 from db import create_db_and_tables, engine
 from services.log_streamer import logger
-from models.session import SessionRecord, PatternState, AgentCorrection  # noqa: F401
+from services.event_log import event_log
+from services.ingest_queue import ingest_queue
+from services.blob_store import blob_store
+from services.similarity_index import similarity_index
+from services.ann_index import spec_ann_index
+from services.detector_state import detector_state
+from services.prefix_matcher import prefix_matcher
+from services.fingerprint import trace_fingerprinter
+from services.similarity_view import similarity_view
+from services.workflow_clusterer import workflow_clusterer
+from services.job_queue import job_queue
+from services.pattern_detector import PATTERN_CONFIDENCE_MIN
+from agents.observer_agent import session_cache
+from models.session import SessionRecord, PatternState, AgentCorrection, UIEventRecord  # noqa: F401
 from models.agent_spec import NarrowAgentSpec  # noqa: F401
+from models.embedding_cache import EmbeddingCacheEntry  # noqa: F401
+from models.detector_state import DetectorStateRecord  # noqa: F401
+from models.fingerprint import TraceFingerprint, LshBucket  # noqa: F401
+from models.workflow_cluster import WorkflowCluster, ClusterMember  # noqa: F401
+from models.job import JobRecord  # noqa: F401
+from models.ingest_dead_letter import IngestDeadLetter  # noqa: F401
+from models.session_similarity import SessionSimilarity
 from models.event import UIEvent, ActionTrace
+from models.vector import pack_vector
 
 # ── routers ──────────────────────────────────────────────────────────────────
-from routers import observe, session, agents, evidence, stubs, sse, logs, chat, kanban
+from routers import observe, session, agents, evidence, stubs, sse, logs, chat, kanban, blobs, imports, metrics, clusters, jobs
 
 
 def _make_events(session_id: str, user_id: str, base_time: datetime,
@@ -74,6 +96,7 @@ async def _seed_sessions_for_type(
     constraint_value: str,
     knowledge_source: dict,
 ):
+    pending = []
     for session_id, parcel_id, base_time in zip(session_ids, parcel_ids, base_times):
         existing = db.get(SessionRecord, session_id)
         if existing:
@@ -83,30 +106,44 @@ async def _seed_sessions_for_type(
         events = _make_events(session_id, "permit-tech-001", base_time,
                               parcel_id, zone, constraint_field, constraint_value)
         completed_at = base_time + timedelta(minutes=9, seconds=30)
+        pending.append((session_id, events, completed_at))
 
-        trace = ActionTrace(
-            session_id=session_id,
-            user_id="permit-tech-001",
-            permit_type=permit_type,
-            events=events,
-            completed_at=completed_at,
-        )
-        trace_text = embedding_service.serialize_trace(trace)
-        vector = await embedding_service.embed(trace_text, cache_key=f"session:{session_id}")
+    # One embed_batch per permit type; concurrent types share a coalesced upstream call
+    vectors = await embedding_service.embed_batch(
+        [
+            embedding_service.serialize_trace(ActionTrace(
+                session_id=session_id,
+                user_id="permit-tech-001",
+                permit_type=permit_type,
+                events=events,
+                completed_at=completed_at,
+            ))
+            for session_id, events, completed_at in pending
+        ],
+        [f"session:{session_id}" for session_id, _, _ in pending],
+    )
 
+    for (session_id, events, completed_at), vector in zip(pending, vectors):
         record = SessionRecord(
             session_id=session_id,
             user_id="permit-tech-001",
             permit_type=permit_type,
             state=PatternState.CANDIDATE,
-            events=[e.model_dump(mode="json") for e in events],
             embedding=vector,
             knowledge_sources=[knowledge_source],
             completed_at=completed_at,
             is_seeded=True,
         )
-        db.add(record)
+        payloads = [e.model_dump(mode="json") for e in events]
+        event_log.append_many(record, payloads, db)
+        trace_fingerprinter.store(
+            session_id, permit_type, trace_fingerprinter.fingerprint(permit_type, payloads), db
+        )
         db.commit()
+        similarity_index.add_session(record)
+        similarity_view.record(permit_type, [session_id], db)
+        db.commit()
+        detector_state.observe(record, vector, db, PATTERN_CONFIDENCE_MIN)
         logger.info(
             f"[Seed] Session {session_id} seeded "
             f"(permit_type={permit_type}, {len(events)} events)"
@@ -205,12 +242,14 @@ async def _seed_demo_sessions():
     ]
 
     with Session(engine) as db:
-        for seed in WORKFLOW_SEEDS:
-            await _seed_sessions_for_type(
+        await asyncio.gather(*(
+            _seed_sessions_for_type(
                 db=db,
                 embedding_service=embedding_service,
                 **seed,
             )
+            for seed in WORKFLOW_SEEDS
+        ))
 
 
 
@@ -219,6 +258,7 @@ def _migrate_db():
     new_columns = [
         ("sessions", "matched_spec_id", "TEXT"),
         ("sessions", "candidate_spec_draft", "JSON"),
+        ("sessions", "event_count", "INTEGER DEFAULT 0"),
     ]
     with engine.connect() as conn:
         for table, col, col_type in new_columns:
@@ -228,6 +268,103 @@ def _migrate_db():
                 logger.info(f"[DB] Migration: added {table}.{col}")
             except Exception:
                 pass  # column already exists
+    _migrate_session_events()
+    _migrate_inline_screenshots()
+    _migrate_packed_embeddings()
+    _migrate_trace_fingerprints()
+    _migrate_session_similarity()
+
+
+def _migrate_session_events():
+    """Split legacy inline sessions.events blobs into append-only ui_events rows."""
+    with Session(engine) as db:
+        legacy = db.exec(
+            select(SessionRecord).where(SessionRecord.event_count == 0)
+        ).all()
+        migrated = 0
+        for record in legacy:
+            if not record.events:
+                continue
+            event_log.delete_session(record.session_id, db)
+            event_log.append_many(record, record.events, db)
+            record.events = []
+            db.add(record)
+            db.commit()
+            migrated += 1
+        if migrated:
+            logger.info(f"[DB] Migration: split events of {migrated} sessions into ui_events")
+
+
+def _migrate_inline_screenshots():
+    """Move screenshot_b64 still inlined in ui_events payloads into the blob store."""
+    with Session(engine) as db:
+        rows = db.exec(
+            select(UIEventRecord).where(
+                text("json_extract(payload, '$.screenshot_b64') IS NOT NULL")
+            )
+        ).all()
+        for row in rows:
+            payload = dict(row.payload)
+            # Malformed screenshots are dropped with a warning, as on ingest
+            payload["screenshot_ref"] = blob_store.event_ref(
+                row.session_id, payload.pop("screenshot_b64"), payload.get("screenshot_ref")
+            )
+            row.payload = payload
+            db.add(row)
+        db.commit()
+        if rows:
+            logger.info(f"[DB] Migration: moved {len(rows)} inline screenshots to blob store")
+
+
+def _migrate_packed_embeddings():
+    """Rewrite JSON float-list embeddings as packed float32 bytes (see models/vector.py)."""
+    with engine.connect() as conn:
+        for table, pk in (("sessions", "session_id"), ("narrow_agent_specs", "id")):
+            rows = conn.execute(
+                text(f"SELECT {pk}, embedding FROM {table} WHERE typeof(embedding) = 'text'")
+            ).all()
+            if not rows:
+                continue
+            conn.execute(
+                text(f"UPDATE {table} SET embedding = :embedding WHERE {pk} = :pk"),
+                [{"pk": pk_value, "embedding": pack_vector(json.loads(raw))} for pk_value, raw in rows],
+            )
+            conn.commit()
+            logger.info(f"[DB] Migration: packed {len(rows)} {table} embeddings as float32")
+
+
+def _migrate_trace_fingerprints():
+    """Fingerprint completed sessions recorded before trace_fingerprints existed."""
+    with Session(engine) as db:
+        missing = db.exec(
+            select(SessionRecord.session_id, SessionRecord.permit_type)
+            .outerjoin(TraceFingerprint, TraceFingerprint.session_id == SessionRecord.session_id)
+            .where(SessionRecord.completed_at != None, TraceFingerprint.session_id == None)
+        ).all()
+        for start in range(0, len(missing), 500):
+            batch = missing[start:start + 500]
+            events = event_log.load_events_for([sid for sid, _ in batch], db)
+            for session_id, permit_type in batch:
+                trace_fingerprinter.store(
+                    session_id, permit_type,
+                    trace_fingerprinter.fingerprint(permit_type, events[session_id]), db,
+                )
+            db.commit()
+        if missing:
+            logger.info(f"[DB] Migration: fingerprinted {len(missing)} completed sessions")
+
+
+def _migrate_session_similarity():
+    """Fill the session_similarity view when it is empty but embedded sessions exist."""
+    with Session(engine) as db:
+        if db.exec(select(SessionSimilarity.session_id).limit(1)).first() is not None:
+            return
+        if db.exec(
+            select(SessionRecord.session_id).where(SessionRecord.embedding != None).limit(1)
+        ).first() is None:
+            return
+        written = similarity_view.rebuild(db)
+        logger.info(f"[DB] Migration: materialised {written} session_similarity pairs")
 
 
 @asynccontextmanager
@@ -245,9 +382,15 @@ async def lifespan(app: FastAPI):
             stale_sessions = db.exec(
                 select(SessionRecord).where(SessionRecord.is_seeded != True)
             ).all()
+            similarity_view.delete([s.session_id for s in stale_sessions], db)
             for s in stale_sessions:
+                event_log.delete_session(s.session_id, db)
+                trace_fingerprinter.delete(s.session_id, db)
                 db.delete(s)
             db.commit()
+            if stale_sessions:
+                detector_state.invalidate(db)
+                workflow_clusterer.invalidate(db)
             if stale_agents or stale_sessions:
                 logger.info(
                     f"[r4mi-ai] Demo cleanup: removed {len(stale_agents)} agents, "
@@ -256,9 +399,22 @@ async def lifespan(app: FastAPI):
         logger.info("[r4mi-ai] DEMO_SESSION_SEED=true — seeding in background (non-blocking)...")
         asyncio.create_task(_seed_demo_sessions())
 
+    with Session(engine) as db:
+        spec_ann_index.start(db)
+        prefix_matcher.start(db)
+    await ingest_queue.start()
+    await session_cache.start()
+    await workflow_clusterer.start()
+    await job_queue.start()
+
     logger.info("[r4mi-ai] Backend started — listening on :8000")
     yield
     logger.info("[r4mi-ai] Backend shutting down")
+    await job_queue.stop()  # in-flight jobs go back to queued
+    await ingest_queue.stop()
+    await session_cache.stop()  # no pending events lost on graceful shutdown
+    await workflow_clusterer.stop()
+    spec_ann_index.save()
 
 
 app = FastAPI(title="r4mi-ai", version="0.1.0", lifespan=lifespan)
@@ -280,6 +436,11 @@ app.include_router(sse.router)
 app.include_router(logs.router)
 app.include_router(chat.router)
 app.include_router(kanban.router)
+app.include_router(blobs.router)
+app.include_router(imports.router)
+app.include_router(metrics.router)
+app.include_router(clusters.router)
+app.include_router(jobs.router)
 
 
 @app.get("/health")
@@ -4,9 +4,12 @@ from enum import Enum
 from typing import Optional
 from uuid import uuid4
 
+import numpy as np
 from sqlmodel import Field, SQLModel, JSON, Column
 import sqlalchemy as sa
 
+from models.vector import Float32Vector
+
 
 class TrustLevel(str, Enum):
     SUPERVISED = "supervised"
@@ -16,6 +19,7 @@ class TrustLevel(str, Enum):
 
 class NarrowAgentSpec(SQLModel, table=True):
     __tablename__ = "narrow_agent_specs"
+    model_config = {"arbitrary_types_allowed": True}
 
     id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
     name: str
@@ -24,7 +28,7 @@ class NarrowAgentSpec(SQLModel, table=True):
     trigger_pattern: dict = Field(default_factory=dict, sa_column=Column(JSON))
     action_sequence: list = Field(default_factory=list, sa_column=Column(JSON))
     knowledge_sources: list = Field(default_factory=list, sa_column=Column(JSON))
-    embedding: list = Field(default_factory=list, sa_column=Column(JSON))
+    embedding: Optional[np.ndarray] = Field(default=None, sa_column=Column(Float32Vector))
     trust_level: TrustLevel = TrustLevel.SUPERVISED
     successful_runs: int = 0
     failed_runs: int = 0
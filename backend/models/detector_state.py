@@ -0,0 +1,18 @@
+from __future__ import annotations
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel, Column, JSON
+
+
+class DetectorStateRecord(SQLModel, table=True):
+    """Running PatternDetector state for one permit_type (see services/detector_state.py)."""
+    __tablename__ = "detector_state"
+
+    permit_type: str = Field(primary_key=True)
+    completed_count: int = 0  # completed sessions of this permit_type, all time
+    confidence_min: float  # PATTERN_CONFIDENCE_MIN the match counts were built with
+    # Most recent completed, embedded session ids, oldest first (≤ DETECTOR_WINDOW)
+    window: list = Field(default_factory=list, sa_column=Column(JSON))
+    # session_id → window neighbours seen at or above confidence_min
+    match_counts: dict = Field(default_factory=dict, sa_column=Column(JSON))
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -0,0 +1,15 @@
+from __future__ import annotations
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+
+
+class EmbeddingCacheEntry(SQLModel, table=True):
+    """Persistent embedding cache row: SHA-256(model, dims, text) → float32 bytes."""
+    __tablename__ = "embedding_cache"
+
+    key: str = Field(primary_key=True)
+    model: str
+    dims: int
+    vector: bytes  # little-endian float32
+    created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -18,6 +18,7 @@ class SSEEventType(str, Enum):
     AGENT_PUBLISHED          = "AGENT_PUBLISHED"
     AGENT_RUN_COMPLETE       = "AGENT_RUN_COMPLETE"
     AGENT_EXCEPTION          = "AGENT_EXCEPTION"
+    IMPORT_PROGRESS          = "IMPORT_PROGRESS"
 
 
 class UIEvent(BaseModel):
@@ -31,11 +32,15 @@ class UIEvent(BaseModel):
     permit_type: Optional[str] = None  # explicit permit type, bypasses inference
     backend_call: Optional[dict] = None
     screenshot_b64: Optional[str] = None  # on screen_switch (obs mode) or per-interaction (teach mode)
+    screenshot_ref: Optional[str] = None  # SHA-256 in the blob store; replaces screenshot_b64 once persisted (inbound refs kept only if stored)
     # Teach-me mode fields (populated when capture_mode="teach")
     element_context: Optional[dict] = None  # {label, role, text, position, landmark}
     capture_mode: Optional[Literal["obs", "teach"]] = "obs"
     step_description: Optional[str] = None  # Gemini-generated natural language label
     is_input_variable: Optional[bool] = None  # True = value varies per case
+    # Set when consecutive same-element inputs were coalesced into this event
+    first_timestamp: Optional[datetime] = None
+    coalesced_count: Optional[int] = None
 
 
 class ActionTrace(BaseModel):
@@ -0,0 +1,23 @@
+from __future__ import annotations
+from datetime import datetime
+
+from sqlmodel import Field, SQLModel
+
+
+class TraceFingerprint(SQLModel, table=True):
+    """Structural fingerprint of one completed session (see services/fingerprint.py)."""
+    __tablename__ = "trace_fingerprints"
+
+    session_id: str = Field(primary_key=True)
+    permit_type: str = Field(index=True)
+    digest: str = Field(index=True)  # SHA-256 of the normalised step sequence
+    signature: bytes  # MinHash values, little-endian uint32
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class LshBucket(SQLModel, table=True):
+    """One LSH band bucket a fingerprint falls in; sessions sharing a bucket are candidates."""
+    __tablename__ = "lsh_buckets"
+
+    bucket: int = Field(primary_key=True)  # 63-bit hash of (band, band values)
+    session_id: str = Field(primary_key=True, index=True)
@@ -0,0 +1,24 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Optional
+from uuid import uuid4
+
+from sqlmodel import Field, SQLModel, Column, JSON
+
+
+class IngestDeadLetter(SQLModel, table=True):
+    """
+    Queued /api/observe events that services/ingest_queue.py could not
+    process. Retryable rows (quota or retry budget exhausted, shutdown with
+    retries pending) are replayed when the queue next starts; the rest are
+    kept for inspection.
+    """
+    __tablename__ = "ingest_dead_letters"
+
+    id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
+    session_id: str = Field(index=True)
+    events: list = Field(default_factory=list, sa_column=Column(JSON))  # UIEvent dumps, in order
+    error: Optional[str] = None
+    attempts: int = 0
+    retryable: bool = Field(default=False, index=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
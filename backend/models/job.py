@@ -0,0 +1,33 @@
+from __future__ import annotations
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+from uuid import uuid4
+
+from sqlmodel import Field, SQLModel, Column, JSON
+
+
+class JobStatus(str, Enum):
+    QUEUED    = "queued"
+    RUNNING   = "running"
+    SUCCEEDED = "succeeded"
+    FAILED    = "failed"
+
+
+class JobRecord(SQLModel, table=True):
+    """One background job run by services/job_queue.py."""
+    __tablename__ = "jobs"
+
+    id: str = Field(default_factory=lambda: str(uuid4()), primary_key=True)
+    kind: str = Field(index=True)  # e.g. "spec_pregen", "agent_run"
+    # At most one queued/running job per (kind, dedup_key); e.g. the session_id
+    dedup_key: Optional[str] = Field(default=None, index=True)
+    status: JobStatus = Field(default=JobStatus.QUEUED, index=True)
+    payload: dict = Field(default_factory=dict, sa_column=Column(JSON))
+    result: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    attempts: int = 0
+    last_error: Optional[str] = None
+    run_after: datetime = Field(default_factory=datetime.utcnow, index=True)  # retry backoff
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
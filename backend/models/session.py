@@ -4,8 +4,11 @@ from enum import Enum
 from typing import Optional
 from uuid import uuid4
 
+import numpy as np
 from sqlmodel import Field, SQLModel, JSON, Column
 
+from models.vector import Float32Vector
+
 
 class PatternState(str, Enum):
     IDLE        = "IDLE"
@@ -22,13 +25,17 @@ class PatternState(str, Enum):
 
 class SessionRecord(SQLModel, table=True):
     __tablename__ = "sessions"
+    model_config = {"arbitrary_types_allowed": True}
 
     session_id: str = Field(primary_key=True)
     user_id: str
     permit_type: str
     state: PatternState = PatternState.COLLECTING
+    # Legacy inline event list — events now live in ui_events (see UIEventRecord).
+    # Left in place so _migrate_db can split pre-existing blobs into rows.
     events: list = Field(default_factory=list, sa_column=Column(JSON))
-    embedding: Optional[list] = Field(default=None, sa_column=Column(JSON))
+    event_count: int = 0  # next UIEventRecord.seq for this session
+    embedding: Optional[np.ndarray] = Field(default=None, sa_column=Column(Float32Vector))
     knowledge_sources: list = Field(default_factory=list, sa_column=Column(JSON))
     confirmed_sequence: Optional[list] = Field(default=None, sa_column=Column(JSON))
     confirmed_sources: Optional[list] = Field(default=None, sa_column=Column(JSON))
@@ -40,6 +47,16 @@ class SessionRecord(SQLModel, table=True):
     is_seeded: bool = False
 
 
+class UIEventRecord(SQLModel, table=True):
+    """One captured UIEvent. Append-only; ordered per session by seq."""
+    __tablename__ = "ui_events"
+
+    session_id: str = Field(primary_key=True)
+    seq: int = Field(primary_key=True)
+    event_type: str
+    payload: dict = Field(default_factory=dict, sa_column=Column(JSON))
+
+
 class AgentCorrection(SQLModel, table=True):
     """Records a human correction made during an agent HITL run."""
     __tablename__ = "agent_corrections"
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from sqlmodel import Field, SQLModel
+
+
+class SessionSimilarity(SQLModel, table=True):
+    """
+    One directed edge of the session similarity view (see
+    services/similarity_view.py): neighbour_id scores at least the view's
+    floor against session_id. Every pair is stored in both directions, so
+    "neighbours of X" is a primary-key range scan.
+    """
+    __tablename__ = "session_similarity"
+
+    session_id: str = Field(primary_key=True)
+    neighbour_id: str = Field(primary_key=True, index=True)
+    permit_type: str = Field(index=True)
+    score: float
@@ -0,0 +1,59 @@
+from __future__ import annotations
+import base64
+import json
+from typing import Any, Optional
+
+import numpy as np
+import sqlalchemy as sa
+
+VECTOR_DTYPE = np.dtype("<f4")  # little-endian float32 on disk and on the wire
+
+
+class Float32Vector(sa.types.TypeDecorator):
+    """
+    Embedding column stored as packed little-endian float32 bytes.
+
+    Binds anything array-like (ndarray, list, bytes); loads as a read-only
+    np.frombuffer view over the row's bytes, so hydrating a row does no
+    parsing or copying. Empty vectors are stored as NULL. Legacy JSON text
+    values still load, so rows left over from before the migration keep
+    working until _migrate_db packs them.
+    """
+
+    impl = sa.LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect) -> Optional[bytes]:
+        return pack_vector(value)
+
+    def process_result_value(self, value: Any, dialect) -> Optional[np.ndarray]:
+        if value is None:
+            return None
+        if isinstance(value, str):  # unmigrated JSON row
+            value = json.loads(value)
+            return np.asarray(value, dtype=VECTOR_DTYPE) if value else None
+        return np.frombuffer(value, dtype=VECTOR_DTYPE) if value else None
+
+    def compare_values(self, x: Any, y: Any) -> bool:
+        if x is None or y is None:
+            return x is y
+        return np.array_equal(np.asarray(x), np.asarray(y))
+
+
+def pack_vector(value: Any) -> Optional[bytes]:
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value) or None
+    arr = np.asarray(value, dtype=VECTOR_DTYPE)
+    return arr.tobytes() if arr.size else None
+
+
+def vector_to_b64(vec: Optional[np.ndarray]) -> Optional[str]:
+    """Base64 of the packed float32 bytes — ~4x smaller than a JSON float list."""
+    packed = pack_vector(vec)
+    return base64.b64encode(packed).decode("ascii") if packed else None
+
+
+def vector_to_json(vec: Optional[np.ndarray]) -> Optional[list[float]]:
+    return None if vec is None else np.asarray(vec).tolist()
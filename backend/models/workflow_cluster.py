@@ -0,0 +1,33 @@
+from __future__ import annotations
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from sqlmodel import Field, SQLModel, Column, JSON
+
+from models.vector import Float32Vector
+
+
+class WorkflowCluster(SQLModel, table=True):
+    """Group of similar completed sessions found across permit types (see services/workflow_clusterer.py)."""
+    __tablename__ = "workflow_clusters"
+    model_config = {"arbitrary_types_allowed": True}
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    label: str  # dominant permit_type, or "cluster_<id>" when no permit_type dominates
+    centroid: Optional[np.ndarray] = Field(default=None, sa_column=Column(Float32Vector))
+    size: int = 0
+    # permit_type → member count; more than one key means the cluster crosses permit types
+    permit_types: dict = Field(default_factory=dict, sa_column=Column(JSON))
+    representative_session_id: Optional[str] = None  # member closest to the centroid
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ClusterMember(SQLModel, table=True):
+    """Assignment of one completed session to a workflow cluster."""
+    __tablename__ = "cluster_members"
+
+    session_id: str = Field(primary_key=True)
+    cluster_id: int = Field(index=True)
+    similarity: float  # cosine to the centroid when assigned
@@ -1,5 +1,4 @@
 from __future__ import annotations
-import asyncio
 import json
 from datetime import datetime
 from typing import Optional
@@ -8,7 +7,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 from sqlmodel import Session, select
 
-from db import get_session
+from db import get_session, engine
 from models.agent_spec import NarrowAgentSpec, TrustLevel
 from models.session import SessionRecord, PatternState, AgentCorrection
 from agents.spec_builder_agent import spec_builder_agent
@@ -18,6 +17,9 @@ from services.trust_engine import apply_trust_transition
 from services.log_streamer import logger
 from services.exceptions import QuotaExhaustedException
 from services.sse_bus import sse_bus
+from services.market_index import market_index
+from services.prefix_matcher import prefix_matcher
+from services.job_queue import job_queue
 
 router = APIRouter()
 
@@ -152,6 +154,8 @@ async def publish_agent(
     db.add(spec)
     db.commit()
     db.refresh(spec)
+    market_index.add_spec(spec)
+    prefix_matcher.add_spec(spec, db)
 
     record.state = PatternState.PUBLISHED
     record.generated_spec_id = spec.id
@@ -222,6 +226,8 @@ async def tune_agent(
     db.add(forked)
     db.commit()
     db.refresh(forked)
+    market_index.add_spec(forked)
+    prefix_matcher.add_spec(forked, db)
 
     logger.info(
         f"[Agentverse] Agent tuned and forked: '{forked.name}' "
@@ -361,16 +367,29 @@ async def run_agent(
         (a for a in applications if a["application_id"] == application_id), {}
     )
 
-    async def _run():
-        from sqlmodel import Session as DBSession
-        from db import engine
-        with DBSession(engine) as task_db:
-            task_spec = task_db.get(NarrowAgentSpec, spec_id)
-            async for payload in narrow_agent.execute(task_spec, application, task_db):
-                await sse_bus.publish(payload["event"], payload["data"])
-            apply_trust_transition(task_spec)
-            task_db.add(task_spec)
-            task_db.commit()
-
-    asyncio.create_task(_run())
-    return {"status": "running", "spec_id": spec_id}
+    job = job_queue.enqueue(
+        "agent_run",
+        {"spec_id": spec_id, "application": application},
+        db,
+        dedup_key=f"{spec_id}:{application_id}",
+    )
+    return {"status": job.status, "spec_id": spec_id, "job_id": job.id}
+
+
+async def _run_agent(payload: dict) -> dict:
+    """"agent_run" job: execute a published agent, broadcasting each step over SSE."""
+    with Session(engine) as task_db:
+        task_spec = task_db.get(NarrowAgentSpec, payload["spec_id"])
+        if not task_spec:
+            raise ValueError(f"Agent {payload['spec_id']} not found")
+        async for event in narrow_agent.execute(task_spec, payload["application"], task_db):
+            await sse_bus.publish(event["event"], event["data"])
+        changed = apply_trust_transition(task_spec)
+        task_db.add(task_spec)
+        task_db.commit()
+        if changed:
+            market_index.update_trust(task_spec)
+        return {"trust_level": task_spec.trust_level}
+
+
+job_queue.register("agent_run", _run_agent, concurrency=2)
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from services.blob_store import blob_store
+
+router = APIRouter()
+
+# Content-addressed: a hash never changes meaning, so clients may cache forever
+_IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+@router.get("/api/blobs/{blob_hash}")
+def get_blob(blob_hash: str, request: Request):
+    """Serve a stored screenshot by its SHA-256 hash."""
+    if not blob_store.is_valid_hash(blob_hash):
+        raise HTTPException(status_code=400, detail="Invalid blob hash")
+
+    etag = f'"{blob_hash}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": _IMMUTABLE})
+
+    data = blob_store.get(blob_hash)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+
+    return Response(
+        content=data,
+        media_type=blob_store.media_type(data),
+        headers={"ETag": etag, "Cache-Control": _IMMUTABLE},
+    )
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session
+
+from db import get_session
+from models.workflow_cluster import WorkflowCluster
+from agents.spec_builder_agent import spec_builder_agent
+from services.exceptions import QuotaExhaustedException
+from services.log_streamer import logger
+from services.pattern_detector import pattern_detector
+from services.sse_bus import sse_bus
+from services.workflow_clusterer import workflow_clusterer, CLUSTER_MIN_SIZE
+
+router = APIRouter()
+
+
+def _summary(cluster: WorkflowCluster) -> dict:
+    return {
+        "id": cluster.id,
+        "label": cluster.label,
+        "size": cluster.size,
+        "permit_types": cluster.permit_types,
+        "cross_permit_type": len(cluster.permit_types) > 1,
+        "representative_session_id": cluster.representative_session_id,
+        "updated_at": cluster.updated_at,
+    }
+
+
+def _get_cluster(cluster_id: int, db: Session) -> WorkflowCluster:
+    cluster = db.get(WorkflowCluster, cluster_id)
+    if not cluster:
+        raise HTTPException(status_code=404, detail="Cluster not found")
+    return cluster
+
+
+@router.get("/api/clusters")
+def list_clusters(min_size: int = CLUSTER_MIN_SIZE, db: Session = Depends(get_session)):
+    """Workflow clusters found across permit types, largest first."""
+    return [_summary(c) for c in workflow_clusterer.workflows(db, min_size)]
+
+
+@router.post("/api/clusters/run")
+def run_clustering(full: bool = False, db: Session = Depends(get_session)):
+    """Cluster sessions completed since the last run now; full=true re-clusters everything."""
+    return workflow_clusterer.run(db, full=full)
+
+
+@router.get("/api/clusters/{cluster_id}")
+def get_cluster(
+    cluster_id: int,
+    limit: int = 50,
+    offset: int = 0,
+    db: Session = Depends(get_session),
+):
+    """A cluster and a page of its member sessions, closest to the centroid first."""
+    cluster = _get_cluster(cluster_id, db)
+    return {
+        **_summary(cluster),
+        "members": [
+            {
+                "session_id": record.session_id,
+                "permit_type": record.permit_type,
+                "state": record.state,
+                "similarity": similarity,
+                "completed_at": record.completed_at,
+            }
+            for record, similarity in workflow_clusterer.members(cluster_id, db, limit, offset)
+        ],
+    }
+
+
+@router.post("/api/clusters/{cluster_id}/detect")
+def detect_cluster(cluster_id: int, db: Session = Depends(get_session)):
+    """Run pattern detection over the cluster's members as if they shared a permit type."""
+    _get_cluster(cluster_id, db)
+    return pattern_detector.detect_for_cluster(cluster_id, db)
+
+
+@router.post("/api/clusters/{cluster_id}/build")
+async def build_cluster_spec(cluster_id: int, db: Session = Depends(get_session)):
+    """
+    Build a spec draft from the cluster's representative session, using the
+    cluster label as permit type. The draft is cached on that session, so
+    POST /api/agents/publish with its session_id publishes it.
+    """
+    cluster = _get_cluster(cluster_id, db)
+    members = workflow_clusterer.members(cluster_id, db, limit=1)
+    if not members:
+        raise HTTPException(status_code=404, detail="Cluster has no sessions")
+    record = members[0][0]
+    try:
+        spec = await spec_builder_agent.build_spec(record, permit_type=cluster.label)
+    except QuotaExhaustedException:
+        await sse_bus.publish("AGENT_EXCEPTION", {"reason": "quota_exhausted"})
+        raise HTTPException(status_code=503, detail="quota_exhausted")
+
+    record.candidate_spec_draft = spec.model_dump(mode="json")
+    db.add(record)
+    db.commit()
+    logger.info(
+        f"[SpecBuilder] Draft for cluster {cluster_id} ({cluster.label}, {cluster.size} sessions) "
+        f"stored on session {record.session_id}"
+    )
+    await sse_bus.publish("SPEC_GENERATED", {
+        "session_id": record.session_id,
+        "cluster_id": cluster_id,
+        "spec": spec.model_dump(mode="json", exclude={"embedding"}),
+    })
+    return {
+        "cluster_id": cluster_id,
+        "session_id": record.session_id,
+        "spec": spec.model_dump(exclude={"embedding"}),
+    }
@@ -1,64 +1,108 @@
 from __future__ import annotations
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import Session, select
 
 from db import get_session
 from models.session import SessionRecord
+from models.vector import vector_to_b64
 from services.embedding_service import embedding_service
+from services.evidence_cache import evidence_cache
+from services.event_log import event_log
+from services.pattern_detector import PATTERN_CONFIDENCE_MIN
+from services.similarity_view import similarity_view
 
 router = APIRouter()
 
 
 @router.get("/api/evidence/{session_id}")
-def get_evidence(session_id: str, db: Session = Depends(get_session)):
+def get_evidence(
+    session_id: str,
+    vector_format: Literal["json", "base64"] = "json",
+    mode: Literal["matrix", "neighbors"] = "matrix",
+    offset: Optional[int] = Query(None, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    col_offset: Optional[int] = Query(None, ge=0),
+    col_limit: Optional[int] = Query(None, ge=1, le=500),
+    k: int = Query(10, ge=1, le=100),
+    include_events: bool = True,
+    db: Session = Depends(get_session),
+):
     """
-    Full proof for judges: action traces, cosine similarity matrix,
-    embedding metadata, raw vectors (truncated to 10 dims for display).
+    Full proof for judges: action traces, cosine similarity, embedding
+    metadata, raw vectors (truncated to 10 dims for display).
+
+    Sessions of the permit type are paged in completed_at order
+    (offset/limit). Without an offset the page is the one holding the target
+    session, so the session the evidence is about is always shown;
+    target_index is its position (None until it has completed). mode=matrix returns the similarity tile for those rows
+    against columns col_offset/col_limit; by default the columns are the
+    same page, so the tile is square and lines up with `sessions`.
+    mode=neighbors returns each paged session's k most similar sessions
+    instead, read from the session_similarity view (pairs below its floor
+    are not listed). include_events=false leaves out the per-session event lists.
+    vector_format=base64 adds each full vector as base64 little-endian float32.
     """
     target = db.get(SessionRecord, session_id)
     if not target:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    all_sessions = db.exec(
-        select(SessionRecord).where(
-            SessionRecord.permit_type == target.permit_type,
-            SessionRecord.completed_at != None,
-        )
-    ).all()
-
-    sessions_out = []
-    for s in all_sessions:
-        sessions_out.append({
-            "session_id": s.session_id,
-            "is_seeded": s.is_seeded,
-            "completed_at": s.completed_at.isoformat() if s.completed_at else None,
-            "event_count": len(s.events or []),
-            "events": s.events or [],
-            "embedding_dims": len(s.embedding or []),
-            "embedding_preview": (s.embedding or [])[:10],
-        })
-
-    # Build cosine matrix
-    matrix = []
-    for a in all_sessions:
-        row = []
-        for b in all_sessions:
-            if a.embedding and b.embedding:
-                score = embedding_service.cosine_similarity(a.embedding, b.embedding)
-            else:
-                score = None
-            row.append(score)
-        matrix.append(row)
+    entry = evidence_cache.get(target.permit_type, db)
+    target_index = entry.index(session_id)
+    if offset is None:
+        offset = (target_index or 0) // limit * limit
+    rows = slice(offset, min(offset + limit, len(entry)))
+    page = entry.meta[rows]
 
-    threshold = float(__import__("os").getenv("PATTERN_CONFIDENCE_MIN", "0.85"))
+    sessions_out = [dict(meta) for meta in page]
+    page_ids = [meta["session_id"] for meta in page]
+    if include_events:
+        events_by_session = event_log.load_events_for(page_ids, db)
+        for out in sessions_out:
+            out["events"] = events_by_session[out["session_id"]]
+    if vector_format == "base64":
+        vectors = dict(db.exec(
+            select(SessionRecord.session_id, SessionRecord.embedding)
+            .where(SessionRecord.session_id.in_(page_ids))
+        ).all()) if page_ids else {}
+        for out in sessions_out:
+            out["embedding_b64"] = vector_to_b64(vectors.get(out["session_id"]))
 
-    return {
+    response = {
         "target_session_id": session_id,
+        "target_index": target_index,
         "permit_type": target.permit_type,
+        "total_sessions": len(entry),
+        "offset": offset,
+        "limit": limit,
         "sessions": sessions_out,
-        "similarity_matrix": matrix,
-        "similarity_threshold": threshold,
-        "embedding_model": "text-embedding-004",
-        "embedding_dims": 768,
+        "mode": mode,
+        "similarity_threshold": PATTERN_CONFIDENCE_MIN,
+        "embedding_model": embedding_service.provider.model,
+        "embedding_dims": embedding_service.provider.dims,
+        "vector_format": vector_format,
+    }
+    if mode == "neighbors":
+        response["k"] = k
+        neighbours = similarity_view.neighbours(page_ids, k, db)
+        response["similarity_floor"] = similarity_view.floor
+        response["neighbors"] = [
+            [{"session_id": sid, "score": score} for sid, score in neighbours[page_id]]
+            for page_id in page_ids
+        ]
+        return response
+
+    c0 = offset if col_offset is None else col_offset
+    cols = slice(c0, min(c0 + (col_limit or limit), len(entry)))
+    tile = entry.tile(rows, cols)
+    response["columns"] = {
+        "offset": c0,
+        "session_ids": entry.ids[cols],
     }
+    response["similarity_matrix"] = [
+        [None if np.isnan(score) else score for score in row]
+        for row in np.round(tile.astype(np.float64), 4).tolist()
+    ]
+    return response
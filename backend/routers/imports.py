@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlmodel import Session
+
+from db import get_session
+from services.trace_importer import trace_importer
+from services.exceptions import QuotaExhaustedException
+from services.sse_bus import sse_bus
+
+router = APIRouter()
+
+
+@router.post("/api/import/traces")
+async def import_traces(
+    request: Request,
+    db: Session = Depends(get_session),
+):
+    """
+    Bulk-load historical workflow logs: an NDJSON body of UIEvents, streamed
+    (optionally gzip-encoded). Progress is broadcast as IMPORT_PROGRESS SSE
+    events; the response is the final import summary.
+    """
+    try:
+        return await trace_importer.import_stream(
+            request.stream(),
+            db,
+            content_encoding=request.headers.get("content-encoding", ""),
+        )
+    except QuotaExhaustedException:
+        await sse_bus.publish("AGENT_EXCEPTION", {"reason": "quota_exhausted"})
+        raise HTTPException(status_code=503, detail="quota_exhausted")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
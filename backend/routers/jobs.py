@@ -0,0 +1,36 @@
+from __future__ import annotations
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session, select
+
+from db import get_session
+from models.job import JobRecord, JobStatus
+from services.job_queue import job_queue
+
+router = APIRouter()
+
+
+@router.get("/api/jobs")
+def list_jobs(
+    kind: Optional[str] = None,
+    status: Optional[JobStatus] = None,
+    limit: int = 50,
+    db: Session = Depends(get_session),
+):
+    """Most recent background jobs, optionally filtered by kind and status."""
+    stmt = select(JobRecord).order_by(JobRecord.created_at.desc()).limit(limit)
+    if kind:
+        stmt = stmt.where(JobRecord.kind == kind)
+    if status:
+        stmt = stmt.where(JobRecord.status == status)
+    return db.exec(stmt).all()
+
+
+@router.get("/api/jobs/{job_id}")
+def get_job(job_id: str, db: Session = Depends(get_session)):
+    """Status, attempts, last error and result of one background job."""
+    job = job_queue.get(job_id, db)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
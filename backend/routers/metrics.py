@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from fastapi import APIRouter
+
+from services.detector_state import detector_state
+from services.embedding_cache import embedding_cache
+from services.embedding_service import embedding_service
+from services.evidence_cache import evidence_cache
+from services.ingest_queue import ingest_queue
+from services.job_queue import job_queue
+from services.prefix_matcher import prefix_matcher
+from services.workflow_clusterer import workflow_clusterer
+
+router = APIRouter()
+
+
+@router.get("/api/metrics/embedding-cache")
+def embedding_cache_metrics():
+    """Hit / miss / eviction counters for the two-tier embedding cache."""
+    return embedding_cache.snapshot()
+
+
+@router.get("/api/metrics/embedding-batcher")
+def embedding_batcher_metrics():
+    """Coalescing counters: requests vs. upstream embed_content calls."""
+    return embedding_service.coalescer_snapshot()
+
+
+@router.get("/api/metrics/detector-state")
+def detector_state_metrics():
+    """Per-permit-type detector window: completed count, window size, threshold."""
+    return detector_state.snapshot()
+
+
+@router.get("/api/metrics/prefix-matcher")
+def prefix_matcher_metrics():
+    """Streaming prefix matcher: indexed patterns, events seen, early matches, µs per event."""
+    return prefix_matcher.snapshot()
+
+
+@router.get("/api/metrics/clusters")
+def cluster_metrics():
+    """Clustering job counters: runs, sessions assigned, clusters created, last run time."""
+    return workflow_clusterer.snapshot()
+
+
+@router.get("/api/metrics/jobs")
+def job_metrics():
+    """Background job counters and per-kind worker concurrency."""
+    return job_queue.snapshot()
+
+
+@router.get("/api/metrics/evidence-cache")
+def evidence_cache_metrics():
+    """Evidence cache: permit types held, cache hits vs rebuilds."""
+    return evidence_cache.snapshot()
+
+
+@router.get("/api/metrics/ingest")
+def ingest_metrics():
+    """Write-behind ingest queue: depth, held retries, dead-lettered events."""
+    return ingest_queue.snapshot()
@@ -1,6 +1,9 @@
 from __future__ import annotations
+from typing import Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter, ValidationError
 from sqlmodel import Session
 
 from db import get_session
@@ -8,40 +11,224 @@ from models.event import UIEvent, SSEEventType
 from models.agent_spec import NarrowAgentSpec
 from agents.observer_agent import observer_agent
 from services.sse_bus import sse_bus
-from services.exceptions import QuotaExhaustedException
+from services.exceptions import BatchInterruptedException, QuotaExhaustedException
+from services.ingest_queue import ingest_queue, OBSERVE_RETRY_AFTER_S
+from services.log_streamer import logger
+from services.wire_format import decode_body, supported_formats, WireFormatError
 
 router = APIRouter()
 
+_event_batch = TypeAdapter(list[UIEvent])
+
+
+async def _read_body(request: Request):
+    """Decode a gzip / keyed-tuple / MessagePack / JSON body (see services/wire_format.py)."""
+    try:
+        return decode_body(
+            await request.body(),
+            content_type=request.headers.get("content-type", ""),
+            content_encoding=request.headers.get("content-encoding", ""),
+        )
+    except WireFormatError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=str(exc)[:500])
+
+
+async def _broadcast(
+    sse_type: Optional[str],
+    session_id: str,
+    session,
+    db: Session,
+) -> None:
+    """Publish the SSE event produced by one processed UIEvent."""
+    if not sse_type:
+        return
+    payload: dict = {"session_id": session_id}
+    if session:
+        payload["permit_type"] = session.permit_type
+        early_match = getattr(session, "early_match", None)  # only live working sets have one
+        if early_match and sse_type in (
+            SSEEventType.AGENT_MATCH_FOUND, SSEEventType.OPTIMIZATION_OPPORTUNITY
+        ):
+            payload["early_match"] = early_match
+        # Enrich AGENT_MATCH_FOUND with matched spec details
+        if sse_type == SSEEventType.AGENT_MATCH_FOUND and session.matched_spec_id:
+            matched = db.get(NarrowAgentSpec, session.matched_spec_id)
+            if matched:
+                payload["matched_spec"] = {
+                    "id": matched.id,
+                    "name": matched.name,
+                    "description": matched.description,
+                    "trust_level": matched.trust_level,
+                    "successful_runs": matched.successful_runs,
+                    "action_sequence": matched.action_sequence,
+                    "knowledge_sources": matched.knowledge_sources,
+                }
+    await sse_bus.publish(sse_type, payload)
+
+
+async def _ingest_session_events(
+    session_id: str,
+    session_events: list[UIEvent],
+    db: Session,
+) -> dict:
+    """
+    Process one session's ordered events, then broadcast. On a quota error
+    the result carries "unprocessed", the index of the first event of
+    session_events that was not handled. Resending from there loses nothing.
+    """
+    results, unprocessed = await observer_agent.handle_batch(session_events, db)
+
+    emitted = []
+    for sse_type, session in results:
+        await _broadcast(sse_type, session_id, session, db)
+        if sse_type:
+            emitted.append(sse_type)
+    if unprocessed is not None:
+        await sse_bus.publish("AGENT_EXCEPTION", {"reason": "quota_exhausted"})
+        return {
+            "session_id": session_id,
+            "status": "quota_exhausted",
+            "events": len(session_events),
+            "unprocessed": unprocessed,
+            "sse_emitted": emitted,
+        }
+    return {
+        "session_id": session_id,
+        "status": "ok",
+        "events": len(session_events),
+        "sse_emitted": emitted,
+    }
+
+
+ingest_queue.set_handler(_ingest_session_events)
+
+
+def _enqueue(events: list[UIEvent]) -> JSONResponse:
+    """
+    Queue-mode acknowledgement: 202 once queued, 429 when the queue is full,
+    413 for a batch larger than a shard can ever hold (split and resend).
+    """
+    if len(events) > ingest_queue.max_batch:
+        return JSONResponse(
+            status_code=413,
+            content={"status": "batch_too_large", "max_batch": ingest_queue.max_batch},
+        )
+    if not ingest_queue.submit(events):
+        logger.warning(
+            f"[Ingest] Queue full ({ingest_queue.depth()} pending) — "
+            f"rejecting {len(events)} events"
+        )
+        return JSONResponse(
+            status_code=429,
+            content={"status": "queue_full", "retry_after": OBSERVE_RETRY_AFTER_S},
+            headers={"Retry-After": str(OBSERVE_RETRY_AFTER_S)},
+        )
+    return JSONResponse(
+        status_code=202,
+        content={"status": "queued", "accepted": len(events)},
+    )
+
+
+def _validation_detail(exc: ValidationError) -> list:
+    # Inputs are left out: they may carry whole screenshots
+    return exc.errors(include_url=False, include_context=False, include_input=False)
+
+
+@router.get("/api/observe/formats")
+def observe_formats():
+    """Wire formats capture.js may use when posting events."""
+    return supported_formats()
+
 
 @router.post("/api/observe")
 async def observe(
-    event: UIEvent,
+    request: Request,
     db: Session = Depends(get_session),
 ):
-    """Receive a UIEvent from the test harness or demo script."""
+    """
+    Receive a UIEvent from the test harness or demo script.
+    Accepts the same encodings as /api/observe/batch.
+    """
+    try:
+        event = UIEvent.model_validate(await _read_body(request))
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=_validation_detail(exc))
+
+    if ingest_queue.enabled:
+        return _enqueue([event])
+
     try:
         sse_type, session = await observer_agent.handle_event(event, db)
     except QuotaExhaustedException:
         await sse_bus.publish("AGENT_EXCEPTION", {"reason": "quota_exhausted"})
         return {"status": "quota_exhausted", "session_id": event.session_id}
 
-    if sse_type:
-        payload: dict = {"session_id": event.session_id}
-        if session:
-            payload["permit_type"] = session.permit_type
-            # Enrich AGENT_MATCH_FOUND with matched spec details
-            if sse_type == SSEEventType.AGENT_MATCH_FOUND and session.matched_spec_id:
-                matched = db.get(NarrowAgentSpec, session.matched_spec_id)
-                if matched:
-                    payload["matched_spec"] = {
-                        "id": matched.id,
-                        "name": matched.name,
-                        "description": matched.description,
-                        "trust_level": matched.trust_level,
-                        "successful_runs": matched.successful_runs,
-                        "action_sequence": matched.action_sequence,
-                        "knowledge_sources": matched.knowledge_sources,
-                    }
-        await sse_bus.publish(sse_type, payload)
+    await _broadcast(sse_type, event.session_id, session, db)
 
     return {"status": "ok", "session_id": event.session_id, "sse_emitted": sse_type}
+
+
+@router.post("/api/observe/batch")
+async def observe_batch(
+    request: Request,
+    db: Session = Depends(get_session),
+):
+    """
+    Receive an ordered array of UIEvents buffered by capture.js.
+
+    The body is parsed by hand rather than declared as a pydantic body because
+    navigator.sendBeacon (used on pagehide) posts as text/plain to avoid a CORS
+    preflight, and because capture.js may send gzip and keyed-tuple encodings.
+    Events are grouped by session and handled in order; SSE events are still
+    published per event, in order. If a group stops on a quota error,
+    "unprocessed" lists the indices (into the posted array) of the events
+    that were not handled, so capture.js can re-queue exactly those. Any
+    other error stops the batch: the rest of that group and every later
+    group are listed too.
+    """
+    try:
+        events = _event_batch.validate_python(await _read_body(request) or [])
+    except ValidationError as exc:
+        raise HTTPException(status_code=422, detail=_validation_detail(exc))
+
+    if ingest_queue.enabled:
+        return _enqueue(events)
+
+    by_session: dict[str, list[int]] = {}
+    for i, event in enumerate(events):
+        by_session.setdefault(event.session_id, []).append(i)
+
+    sessions_out = []
+    unprocessed: list[int] = []
+    groups = list(by_session.items())
+    for n, (session_id, indices) in enumerate(groups):
+        try:
+            out = await _ingest_session_events(session_id, [events[i] for i in indices], db)
+        except BatchInterruptedException as exc:
+            # Events before exc.unprocessed are recorded; resend the rest and every later group
+            logger.error(f"[Observer] Batch stopped on {session_id}: {exc.cause}")
+            sessions_out.append({
+                "session_id": session_id,
+                "status": "error",
+                "events": len(indices),
+                "unprocessed": exc.unprocessed,
+            })
+            unprocessed += indices[exc.unprocessed:]
+            for _, later in groups[n + 1:]:
+                unprocessed += later
+            break
+        sessions_out.append(out)
+        if "unprocessed" in out:
+            unprocessed += indices[out["unprocessed"]:]
+
+    logger.info(
+        f"[Observer] Batch ingested: {len(events) - len(unprocessed)}/{len(events)} events "
+        f"across {len(by_session)} session(s)"
+    )
+    statuses = {out["status"] for out in sessions_out}
+    return {
+        "status": next((s for s in ("error", "quota_exhausted") if s in statuses), "ok"),
+        "accepted": len(events) - len(unprocessed),
+        "unprocessed": sorted(unprocessed),
+        "sessions": sessions_out,
+    }
@@ -9,7 +9,10 @@ from sqlmodel import Session, select
 from db import get_session
 from models.session import SessionRecord, PatternState
 from models.event import UIEvent
+from models.vector import vector_to_json
 from services.log_streamer import logger
+from services.event_log import event_log
+from agents.observer_agent import session_cache
 
 router = APIRouter()
 
@@ -24,15 +27,23 @@ class ConfirmSourcesRequest(BaseModel):
 
 @router.get("/api/session/{session_id}")
 def get_session_record(session_id: str, db: Session = Depends(get_session)):
+    session_cache.flush(session_id, db)
+    db.commit()
     record = db.get(SessionRecord, session_id)
     if not record:
         raise HTTPException(status_code=404, detail="Session not found")
-    return record
+    return {
+        **record.model_dump(exclude={"embedding"}),
+        "embedding": vector_to_json(record.embedding),
+        "events": event_log.load_events(session_id, db),
+    }
 
 
 @router.get("/api/session/{session_id}/replay")
 def get_replay_frames(session_id: str, db: Session = Depends(get_session)):
     """Return replay frames for the Optimization Panel."""
+    session_cache.flush(session_id, db)
+    db.commit()
     record = db.get(SessionRecord, session_id)
     if not record:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -44,7 +55,7 @@ def get_replay_frames(session_id: str, db: Session = Depends(get_session)):
     logger.info(f"[Replay] Session {session_id} — generating replay frames")
 
     frames = []
-    for i, evt in enumerate(record.events or []):
+    for i, evt in enumerate(event_log.iter_events(session_id, db)):
         frames.append({
             "frame_index": i,
             "event_type": evt.get("event_type"),
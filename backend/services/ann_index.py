@@ -0,0 +1,317 @@
+from __future__ import annotations
+import asyncio
+import os
+import time
+from typing import Optional
+
+import numpy as np
+from sqlmodel import Session, select
+
+from models.agent_spec import NarrowAgentSpec
+from services.embedding_service import embedding_service
+from services.log_streamer import logger
+from services.similarity_index import (
+    SIMILARITY_PREFIX_DIMS_SPECS,
+    SIMILARITY_QUANTIZATION,
+    SIMILARITY_RESCORE_OVERSAMPLE,
+    SPECS_PARTITION,
+    SimilarityPartition,
+    similarity_index,
+    spec_originals_loader,
+)
+
+MARKET_ANN_PATH = os.getenv("MARKET_ANN_PATH", "./market_ann.npz")
+MARKET_ANN_MIN_SPECS = int(os.getenv("MARKET_ANN_MIN_SPECS", "2000"))  # exact scan below this
+MARKET_ANN_NLIST = int(os.getenv("MARKET_ANN_NLIST", "0"))  # 0 = ~sqrt(N)
+MARKET_ANN_NPROBE = int(os.getenv("MARKET_ANN_NPROBE", "8"))  # recall/latency knob
+MARKET_ANN_RETRAIN_GROWTH = float(os.getenv("MARKET_ANN_RETRAIN_GROWTH", "2.0"))
+KMEANS_SAMPLE = 20_000
+KMEANS_ITERS = 10
+ASSIGN_CHUNK = 65_536
+
+
+class IVFIndex:
+    """
+    IVF-flat over the rows of a SimilarityPartition.
+
+    Spherical k-means centroids split the vectors into nlist inverted lists.
+    A search reads the nprobe lists whose centroids are closest to the query
+    and scores only their members. Scoring is exact, against the partition's
+    float32 rows, so any returned score is the true cosine. The only
+    approximation is which rows are considered, and nprobe trades that
+    recall against latency. On an int8 partition the list members are
+    ranked on the codes and the best k * SIMILARITY_RESCORE_OVERSAMPLE are
+    rescored on float32 originals.
+    """
+
+    def __init__(self, centroids: np.ndarray):
+        self.centroids = centroids.astype(np.float32, copy=False)
+        self._lists: list[set[str]] = [set() for _ in range(len(centroids))]
+        self._list_of: dict[str, int] = {}
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self._list_of)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._list_of
+
+    @classmethod
+    def train(cls, partition: SimilarityPartition, nlist: int = 0, seed: int = 0) -> "IVFIndex":
+        n = len(partition)
+        nlist = nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(seed)
+        sample_rows = rng.choice(n, size=min(n, KMEANS_SAMPLE), replace=False)
+        data = partition.rows_matrix(sample_rows)
+
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERS):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            if empty.any():  # reseed dead centroids from random samples
+                sums[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms == 0, 1.0, norms)
+
+        index = cls(centroids)
+        index.add_rows(partition, partition.ids)
+        return index
+
+    def add_rows(self, partition: SimilarityPartition, item_ids: list[str]) -> None:
+        """Assign item_ids (already in partition) to their nearest lists."""
+        for start in range(0, len(item_ids), ASSIGN_CHUNK):
+            chunk = item_ids[start:start + ASSIGN_CHUNK]
+            rows = partition.rows_for(chunk)
+            nearest = np.argmax(partition.rows_matrix(rows) @ self.centroids.T, axis=1)
+            for item_id, list_no in zip(chunk, nearest.tolist()):
+                self.assign(item_id, list_no)
+
+    def add(self, item_id: str, vector: np.ndarray) -> None:
+        self.assign(item_id, int(np.argmax(self.centroids @ vector)))
+
+    def remove(self, item_id: str) -> None:
+        list_no = self._list_of.pop(item_id, None)
+        if list_no is not None:
+            self._lists[list_no].discard(item_id)
+
+    def search(
+        self,
+        partition: SimilarityPartition,
+        vector,
+        k: int,
+        nprobe: int = MARKET_ANN_NPROBE,
+    ) -> list[tuple[str, float]]:
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if not norm:
+            return []
+        q = q / norm
+        nprobe = max(1, min(nprobe, self.nlist))
+        probe = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        candidates = [i for list_no in probe.tolist() for i in self._lists[list_no]]
+        if not candidates:
+            return []
+        rows = partition.rows_for(candidates)
+        scores = partition.score_rows(rows, q)
+        k = min(k, len(rows))
+        if partition.quantized:
+            pool = min(len(rows), k * SIMILARITY_RESCORE_OVERSAMPLE)
+            rows = rows[np.argpartition(-scores, pool - 1)[:pool]]
+            scores = partition.exact_scores([partition.ids[r] for r in rows], q)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(partition.ids[rows[i]], round(float(scores[i]), 4)) for i in top]
+
+    def assign(self, item_id: str, list_no: int) -> None:
+        self.remove(item_id)
+        self._lists[list_no].add(item_id)
+        self._list_of[item_id] = list_no
+
+    def assignments(self) -> tuple[list[str], np.ndarray]:
+        ids = list(self._list_of)
+        return ids, np.fromiter((self._list_of[i] for i in ids), dtype=np.int32, count=len(ids))
+
+
+class SpecAnnIndex:
+    """
+    ANN front for the published-spec partition used by MarketMatcher.
+
+    start() restores the spec vectors, centroids and list assignments from
+    MARKET_ANN_PATH, reconciles them with narrow_agent_specs (loading new
+    rows, dropping deleted ones) and installs the partition in
+    similarity_index. With no usable file it loads from the database and
+    trains. Below MARKET_ANN_MIN_SPECS searches stay exact. Once the
+    partition outgrows its training size by MARKET_ANN_RETRAIN_GROWTH,
+    centroids are retrained in a worker thread.
+    """
+
+    def __init__(self, path: str = MARKET_ANN_PATH):
+        self.path = path
+        self.model = embedding_service.provider.model
+        self._ivf: Optional[IVFIndex] = None
+        self._trained_size = 0
+        self._training: Optional[asyncio.Future] = None
+
+    def start(self, db: Session) -> None:
+        t0 = time.time()
+        restored = self._restore(db)
+        partition = similarity_index.specs(db)
+        if not restored and len(partition) >= MARKET_ANN_MIN_SPECS:
+            self._train_now(partition)
+            self.save()
+        logger.info(
+            f"[MarketANN] Ready | {len(partition)} specs | "
+            f"{'ivf nlist=' + str(self._ivf.nlist) if self._ivf else 'exact'} | "
+            f"{'restored' if restored else 'built'} in {int((time.time() - t0) * 1000)}ms"
+        )
+
+    def search(
+        self,
+        vector,
+        db: Session,
+        k: int,
+        nprobe: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ) -> list[tuple[str, float]]:
+        partition = similarity_index.specs(db)
+        if self._ivf is None or len(partition) < MARKET_ANN_MIN_SPECS:
+            return partition.query(vector, k=k, threshold=threshold)[:k]
+        return self._ivf.search(partition, vector, k, nprobe or MARKET_ANN_NPROBE)
+
+    def add_spec(self, spec: NarrowAgentSpec) -> None:
+        """Index a newly published or forked spec."""
+        similarity_index.add_spec(spec)
+        if spec.embedding is None:
+            return
+        if self._ivf is not None:
+            q = np.asarray(spec.embedding, dtype=np.float32)
+            self._ivf.add(spec.id, q / (np.linalg.norm(q) or 1.0))
+        self._maybe_retrain()
+
+    def remove_spec(self, spec_id: str) -> None:
+        similarity_index.remove_spec(spec_id)
+        if self._ivf is not None:
+            self._ivf.remove(spec_id)
+
+    def save(self) -> None:
+        partition = similarity_index.loaded(SPECS_PARTITION)
+        if partition is None or self._ivf is None:
+            return
+        ids, lists = self._ivf.assignments()
+        tmp = self.path + ".tmp.npz"
+        try:
+            np.savez(
+                tmp,
+                model=np.array(self.model),
+                **partition.state(),
+                centroids=self._ivf.centroids,
+                assigned_ids=np.array(ids),
+                assigned_lists=lists,
+                trained_size=np.array(self._trained_size),
+            )
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            logger.warning(f"[MarketANN] Could not persist index: {exc}")
+
+    def _restore(self, db: Session) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path) as f:
+                if str(f["model"]) != self.model:
+                    logger.info("[MarketANN] Persisted index is for another embedding model — rebuilding")
+                    return False
+                partition = SimilarityPartition.from_state(
+                    f, SIMILARITY_QUANTIZATION, spec_originals_loader(), SIMILARITY_PREFIX_DIMS_SPECS
+                )
+                centroids = f["centroids"]
+                assigned = dict(zip(f["assigned_ids"].tolist(), f["assigned_lists"].tolist()))
+                self._trained_size = int(f["trained_size"])
+        except (OSError, KeyError, ValueError) as exc:
+            logger.warning(f"[MarketANN] Ignoring unreadable index file: {exc}")
+            return False
+
+        ids = list(partition.ids)
+        ivf = IVFIndex(centroids)
+        for item_id, list_no in assigned.items():
+            ivf.assign(item_id, list_no)
+
+        live = set(db.exec(
+            select(NarrowAgentSpec.id).where(NarrowAgentSpec.embedding != None)
+        ).all())
+        deleted = set(ids) - live
+        for item_id in deleted:
+            partition.remove(item_id)
+            ivf.remove(item_id)
+        missing = list(live - set(ids))
+        for start in range(0, len(missing), 500):
+            rows = db.exec(
+                select(NarrowAgentSpec.id, NarrowAgentSpec.embedding).where(
+                    NarrowAgentSpec.id.in_(missing[start:start + 500])
+                )
+            ).all()
+            partition.add_many([r[0] for r in rows], np.stack([r[1] for r in rows]))
+        ivf.add_rows(partition, missing)
+
+        similarity_index.set_partition(SPECS_PARTITION, partition)
+        self._ivf = ivf
+        if missing or deleted:
+            logger.info(
+                f"[MarketANN] Reconciled persisted index: +{len(missing)} -{len(deleted)} specs"
+            )
+        return True
+
+    def _train_now(self, partition: SimilarityPartition) -> None:
+        t0 = time.time()
+        self._ivf = IVFIndex.train(partition, MARKET_ANN_NLIST)
+        self._trained_size = len(partition)
+        logger.info(
+            f"[MarketANN] Trained IVF | {len(partition)} specs | nlist={self._ivf.nlist} | "
+            f"{int((time.time() - t0) * 1000)}ms"
+        )
+
+    def _maybe_retrain(self) -> None:
+        partition = similarity_index.loaded(SPECS_PARTITION)
+        if partition is None or len(partition) < MARKET_ANN_MIN_SPECS or self._training:
+            return
+        if self._ivf is not None and len(partition) < self._trained_size * MARKET_ANN_RETRAIN_GROWTH:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._train_now(partition)
+            return
+        snapshot = SimilarityPartition.from_state(
+            partition.state(), partition.quantization, spec_originals_loader()
+        )
+        self._training = loop.run_in_executor(None, IVFIndex.train, snapshot, MARKET_ANN_NLIST)
+        self._training.add_done_callback(lambda fut: self._install(fut, len(snapshot)))
+
+    def _install(self, fut: asyncio.Future, trained_size: int) -> None:
+        self._training = None
+        if fut.exception() is not None:
+            logger.error(f"[MarketANN] Retrain failed: {fut.exception()}")
+            return
+        ivf: IVFIndex = fut.result()
+        partition = similarity_index.loaded(SPECS_PARTITION)
+        if partition is None:
+            return
+        # Specs published or removed while training ran
+        ids, _ = ivf.assignments()
+        for item_id in ids:
+            if item_id not in partition:
+                ivf.remove(item_id)
+        ivf.add_rows(partition, [i for i in partition.ids if i not in ivf])
+        self._ivf = ivf
+        self._trained_size = trained_size
+        logger.info(f"[MarketANN] Retrained IVF | {len(partition)} specs | nlist={ivf.nlist}")
+        self.save()
+
+
+spec_ann_index = SpecAnnIndex()
@@ -0,0 +1,131 @@
+from __future__ import annotations
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+from services.log_streamer import logger
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional — only needed for BLOB_REENCODE_JPEG
+    Image = None
+
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "./blobs")
+BLOB_REENCODE_JPEG = os.getenv("BLOB_REENCODE_JPEG", "false").lower() == "true"
+BLOB_MAX_DIM = int(os.getenv("BLOB_MAX_DIM", "1280"))
+BLOB_JPEG_QUALITY = int(os.getenv("BLOB_JPEG_QUALITY", "70"))
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobStore:
+    """
+    Content-addressed screenshot storage on local disk.
+
+    Blobs are keyed by the SHA-256 of their stored bytes and laid out as
+    <root>/<hash[:2]>/<hash>, so identical screenshots from different sessions
+    are written once. Events keep only the hash (UIEvent.screenshot_ref).
+    """
+
+    def __init__(self, root: str = BLOB_STORE_DIR):
+        self.root = Path(root)
+        if BLOB_REENCODE_JPEG and Image is None:
+            logger.warning("[Blobs] BLOB_REENCODE_JPEG=true but Pillow is not installed — storing as-is")
+
+    def is_valid_hash(self, blob_hash: str) -> bool:
+        return bool(_HASH_RE.match(blob_hash))
+
+    def path_for(self, blob_hash: str) -> Path:
+        return self.root / blob_hash[:2] / blob_hash
+
+    def exists(self, blob_hash: str) -> bool:
+        return self.is_valid_hash(blob_hash) and self.path_for(blob_hash).exists()
+
+    def put_b64(self, data_b64: str) -> str:
+        """
+        Decode, optionally re-encode, and store a base64 screenshot. Returns
+        its hash; raises ValueError when data_b64 is not strict base64.
+        """
+        try:
+            data = base64.b64decode(data_b64, validate=True)
+        except binascii.Error as exc:
+            raise ValueError(f"screenshot is not valid base64: {exc}") from exc
+        return self.put(data)
+
+    def event_ref(
+        self,
+        session_id: str,
+        screenshot_b64: Optional[str],
+        screenshot_ref: Optional[str],
+    ) -> Optional[str]:
+        """
+        The screenshot_ref an inbound event is stored with: the hash of its
+        screenshot, or a client-supplied ref only when that blob is already
+        stored. A malformed screenshot or unknown ref is dropped with a
+        warning instead of failing the event.
+        """
+        if screenshot_b64:
+            try:
+                return self.put_b64(screenshot_b64)
+            except ValueError as exc:
+                logger.warning(f"[Blobs] Dropped screenshot on {session_id}: {exc}")
+                return None
+        if screenshot_ref and not self.exists(screenshot_ref):
+            logger.warning(f"[Blobs] Dropped unknown screenshot_ref on {session_id}: {screenshot_ref[:80]!r}")
+            return None
+        return screenshot_ref
+
+    def put(self, data: bytes) -> str:
+        data = self._reencode(data)
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(blob_hash)
+        if path.exists():
+            return blob_hash
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".tmp{os.getpid()}")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)  # atomic — concurrent writers of the same hash are harmless
+        return blob_hash
+
+    def get(self, blob_hash: str) -> Optional[bytes]:
+        if not self.is_valid_hash(blob_hash):
+            return None
+        path = self.path_for(blob_hash)
+        return path.read_bytes() if path.exists() else None
+
+    def get_b64(self, blob_hash: str) -> Optional[str]:
+        data = self.get(blob_hash)
+        return base64.b64encode(data).decode() if data is not None else None
+
+    @staticmethod
+    def media_type(data: bytes) -> str:
+        if data[:3] == b"\xff\xd8\xff":
+            return "image/jpeg"
+        if data[:8] == b"\x89PNG\r\n\x1a\n":
+            return "image/png"
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return "image/webp"
+        return "application/octet-stream"
+
+    def _reencode(self, data: bytes) -> bytes:
+        """Downscale to BLOB_MAX_DIM and re-encode as JPEG when enabled."""
+        if not BLOB_REENCODE_JPEG or Image is None:
+            return data
+        try:
+            img = Image.open(io.BytesIO(data))
+            img.thumbnail((BLOB_MAX_DIM, BLOB_MAX_DIM))
+            out = io.BytesIO()
+            img.convert("RGB").save(out, format="JPEG", quality=BLOB_JPEG_QUALITY, optimize=True)
+            encoded = out.getvalue()
+        except Exception as exc:
+            logger.warning(f"[Blobs] Re-encode failed, storing original: {exc}")
+            return data
+        return encoded if len(encoded) < len(data) else data
+
+
+blob_store = BlobStore()
@@ -0,0 +1,244 @@
+from __future__ import annotations
+import argparse
+import os
+from datetime import datetime
+from typing import Iterable, NamedTuple
+
+import numpy as np
+from sqlmodel import Session, select, func, delete
+
+from models.detector_state import DetectorStateRecord
+from models.session import SessionRecord
+from services.log_streamer import logger
+from services.similarity_index import similarity_index
+
+DETECTOR_WINDOW = int(os.getenv("DETECTOR_WINDOW", "500"))  # recent sessions compared per submit
+
+
+class Observation(NamedTuple):
+    prior_count: int  # completed sessions of the permit type before this one
+    scored: list[tuple[str, float]]  # (session_id, cosine) vs window + candidates, best first
+    matches: int  # of those, sessions at or above the threshold
+
+
+class _Window:
+    """In-memory mirror of one DetectorStateRecord. Vectors live in the similarity partition."""
+
+    def __init__(self, record: DetectorStateRecord):
+        self.completed_count = record.completed_count
+        self.confidence_min = record.confidence_min
+        self.ids: list[str] = list(record.window)
+        self.match_counts: dict[str, int] = dict(record.match_counts)
+
+    def remove(self, session_id: str) -> None:
+        self.ids.remove(session_id)
+        self.match_counts.pop(session_id, None)
+
+
+class DetectorStateStore:
+    """
+    Per-permit-type running state for PatternDetector.
+
+    A completed session is compared only against the DETECTOR_WINDOW most
+    recent completed sessions of its permit type, not against every prior.
+    Each permit type has a detector_state row holding the all-time completed
+    count, the window ids and each window session's match count. observe()
+    updates both in O(window), so a READY decision does not grow with
+    history. Callers may pass extra candidate ids from outside the window,
+    for example LSH bucket collisions. Those are scored too.
+
+    Scores come from the permit type's similarity partition
+    (SimilarityPartition.scores_for), so live detection uses the same int8
+    codes and prefix filter as every other session query, and the window
+    keeps no vectors of its own.
+
+    Match counts depend on the threshold they were built with. A row whose
+    confidence_min differs from the current threshold is rebuilt from the
+    sessions table on first use. rebuild() (or `python -m
+    services.detector_state`) does the same on demand.
+    """
+
+    def __init__(self, window: int = DETECTOR_WINDOW):
+        self.window = max(1, window)
+        self._windows: dict[str, _Window] = {}
+
+    def observe(
+        self,
+        session: SessionRecord,
+        vector: np.ndarray,
+        db: Session,
+        threshold: float,
+        candidates: Iterable[str] = (),
+    ) -> Observation:
+        """
+        Fold a newly completed, embedded session into its permit type's state.
+        The session must already be committed (completed_at and embedding set).
+        """
+        state, rebuilt = self._get(session.permit_type, db, threshold)
+        if session.session_id in state.ids and not rebuilt:
+            # Re-submit: its neighbours' counts reflect the old vector, so recount
+            self.rebuild(session.permit_type, db, threshold)
+            state, rebuilt = self._windows[session.permit_type], True
+        # A rebuild read this session from the sessions table: it is already in
+        # completed_count and, if in the window, in every neighbour's count
+        counted = rebuilt and session.session_id in state.ids
+
+        partition = similarity_index.sessions(session.permit_type, db)
+        others = [i for i in state.ids if i != session.session_id]
+        scores = partition.scores_for(others, vector, threshold)
+        hits = np.flatnonzero(scores >= threshold)
+        if not counted:
+            for row in hits.tolist():
+                neighbour = others[row]
+                state.match_counts[neighbour] = state.match_counts.get(neighbour, 0) + 1
+        scored = [(others[i], round(float(s), 4)) for i, s in enumerate(scores.tolist())]
+        in_window = set(state.ids)
+        older = [
+            i for i in candidates
+            if i not in in_window and i != session.session_id and i in partition
+        ]
+        matches = len(hits)
+        if older:
+            older_scores = partition.scores_for(older, vector, threshold)
+            scored += [(i, round(float(s), 4)) for i, s in zip(older, older_scores.tolist())]
+            matches += int((older_scores >= threshold).sum())
+        scored.sort(key=lambda pair: -pair[1])
+
+        if not counted:
+            state.ids.append(session.session_id)
+        state.match_counts[session.session_id] = matches
+        while len(state.ids) > self.window:
+            state.remove(state.ids[0])
+        prior_count = state.completed_count - (1 if rebuilt else 0)
+        if not rebuilt:
+            state.completed_count += 1
+        self._persist(session.permit_type, state, db)
+        return Observation(prior_count, scored, matches)
+
+    def rebuild(self, permit_type: str, db: Session, threshold: float) -> DetectorStateRecord:
+        """Recompute one permit type's state from the sessions table."""
+        completed = db.exec(
+            select(func.count()).select_from(SessionRecord).where(
+                SessionRecord.permit_type == permit_type,
+                SessionRecord.completed_at != None,
+            )
+        ).one()
+        recent = db.exec(
+            select(SessionRecord.session_id).where(
+                SessionRecord.permit_type == permit_type,
+                SessionRecord.completed_at != None,
+                SessionRecord.embedding != None,
+            ).order_by(SessionRecord.completed_at.desc()).limit(self.window)
+        ).all()[::-1]
+        partition = similarity_index.sessions(permit_type, db)
+        ids = [i for i in recent if i in partition]
+        sims = partition.pairwise(ids)
+        np.fill_diagonal(sims, -np.inf)
+        counts = (sims >= threshold).sum(axis=1).tolist()
+
+        record = db.get(DetectorStateRecord, permit_type) or DetectorStateRecord(
+            permit_type=permit_type, confidence_min=threshold
+        )
+        record.completed_count = completed
+        record.confidence_min = threshold
+        record.window = ids
+        record.match_counts = dict(zip(ids, counts))
+        record.updated_at = datetime.utcnow()
+        db.add(record)
+        db.commit()
+        self._windows[permit_type] = _Window(record)
+        logger.info(
+            f"[Detector]  Rebuilt state (permit_type={permit_type}): {completed} completed, "
+            f"window {len(ids)}, threshold {threshold}"
+        )
+        return record
+
+    def rebuild_all(self, db: Session, threshold: float) -> list[str]:
+        """Rebuild every permit type with completed sessions; drop rows for the rest."""
+        permit_types = db.exec(
+            select(SessionRecord.permit_type).where(SessionRecord.completed_at != None).distinct()
+        ).all()
+        db.exec(delete(DetectorStateRecord).where(DetectorStateRecord.permit_type.not_in(permit_types)))
+        db.commit()
+        self._windows.clear()
+        for permit_type in permit_types:
+            self.rebuild(permit_type, db, threshold)
+        return list(permit_types)
+
+    def invalidate(self, db: Session) -> None:
+        """Forget all state, e.g. after sessions were deleted; rows rebuild on next use."""
+        db.exec(delete(DetectorStateRecord))
+        db.commit()
+        self._windows.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            permit_type: {
+                "completed_count": state.completed_count,
+                "window": len(state.ids),
+                "confidence_min": state.confidence_min,
+                "max_matches": max(state.match_counts.values(), default=0),
+            }
+            for permit_type, state in self._windows.items()
+        }
+
+    def _get(self, permit_type: str, db: Session, threshold: float) -> tuple[_Window, bool]:
+        """The permit type's window, and whether it was just rebuilt from the sessions table."""
+        state = self._windows.get(permit_type)
+        if state is not None and state.confidence_min == threshold:
+            return state, False
+        record = db.get(DetectorStateRecord, permit_type)
+        if record is None:
+            self.rebuild(permit_type, db, threshold)
+            return self._windows[permit_type], True
+        if record.confidence_min != threshold:
+            logger.info(
+                f"[Detector]  State for {permit_type} was built at threshold "
+                f"{record.confidence_min}, now {threshold} — rebuilding"
+            )
+            self.rebuild(permit_type, db, threshold)
+            return self._windows[permit_type], True
+        self._windows[permit_type] = self._load_window(record, db)
+        return self._windows[permit_type], False
+
+    def _load_window(self, record: DetectorStateRecord, db: Session) -> _Window:
+        """Hydrate a persisted row, dropping sessions that left the partition."""
+        partition = similarity_index.sessions(record.permit_type, db)
+        state = _Window(record)
+        state.ids = [i for i in state.ids if i in partition]
+        kept = set(state.ids)
+        state.match_counts = {i: n for i, n in state.match_counts.items() if i in kept}
+        return state
+
+    def _persist(self, permit_type: str, state: _Window, db: Session) -> None:
+        record = db.get(DetectorStateRecord, permit_type) or DetectorStateRecord(
+            permit_type=permit_type, confidence_min=state.confidence_min
+        )
+        record.completed_count = state.completed_count
+        record.window = list(state.ids)
+        record.match_counts = dict(state.match_counts)
+        record.updated_at = datetime.utcnow()
+        db.add(record)
+        db.commit()
+
+
+detector_state = DetectorStateStore()
+
+
+if __name__ == "__main__":
+    # Rebuild after changing PATTERN_CONFIDENCE_MIN or DETECTOR_WINDOW:
+    #   cd backend && python -m services.detector_state [--permit-type fence_variance]
+    parser = argparse.ArgumentParser(description="Rebuild persisted PatternDetector state")
+    parser.add_argument("--permit-type", help="rebuild one permit type (default: all)")
+    args = parser.parse_args()
+
+    from db import create_db_and_tables, engine
+    from services.pattern_detector import PATTERN_CONFIDENCE_MIN
+
+    create_db_and_tables()
+    with Session(engine) as db:
+        if args.permit_type:
+            detector_state.rebuild(args.permit_type, db, PATTERN_CONFIDENCE_MIN)
+        else:
+            done = detector_state.rebuild_all(db, PATTERN_CONFIDENCE_MIN)
+            logger.info(f"[Detector]  Rebuilt state for {len(done)} permit types")
@@ -0,0 +1,105 @@
+from __future__ import annotations
+import asyncio
+import os
+from typing import Awaitable, Callable, Optional
+
+from services.log_streamer import logger
+
+EMBED_COALESCE_WINDOW_MS = float(os.getenv("EMBED_COALESCE_WINDOW_MS", "5"))
+EMBED_COALESCE_MAX = int(os.getenv("EMBED_COALESCE_MAX", "100"))  # embed_content batch limit
+
+# [(key, text), ...] -> one vector per item, in order
+BatchSender = Callable[[list[tuple[str, str]]], Awaitable[list[list[float]]]]
+
+
+class EmbedCoalescer:
+    """
+    Micro-batcher with single-flight for embedding requests.
+
+    submit() parks the caller on a future. Pending texts are sent together
+    once EMBED_COALESCE_MAX have queued or EMBED_COALESCE_WINDOW_MS have
+    passed since the first one, whichever comes first. A key that is already
+    queued or in flight joins the existing future instead of being sent
+    again. Upstream errors (e.g. QuotaExhaustedException) are raised in
+    every caller that shared the batch.
+    """
+
+    def __init__(
+        self,
+        send: BatchSender,
+        window_ms: float = EMBED_COALESCE_WINDOW_MS,
+        max_items: int = EMBED_COALESCE_MAX,
+    ):
+        self._send = send
+        self.window_s = max(0.0, window_ms) / 1000
+        self.max_items = max(1, max_items)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._queue: list[tuple[str, str]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()  # the loop holds tasks weakly; keep sends alive
+        self.stats = {"requests": 0, "deduplicated": 0, "upstream_calls": 0, "texts_sent": 0}
+
+    async def submit(self, key: str, text: str) -> list[float]:
+        self.stats["requests"] += 1
+        fut = self._inflight.get(key)
+        if fut is None:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            self._inflight[key] = fut
+            self._queue.append((key, text))
+            if len(self._queue) >= self.max_items:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window_s, self._dispatch)
+        else:
+            self.stats["deduplicated"] += 1
+        # shield: one cancelled caller must not cancel the shared result
+        return await asyncio.shield(fut)
+
+    def snapshot(self) -> dict:
+        calls = self.stats["upstream_calls"]
+        return {
+            **self.stats,
+            "pending": len(self._queue),
+            "avg_batch": round(self.stats["texts_sent"] / calls, 2) if calls else None,
+        }
+
+    def _dispatch(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._queue:
+            return
+        batch, self._queue = self._queue, []
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[tuple[str, str]]) -> None:
+        self.stats["upstream_calls"] += 1
+        self.stats["texts_sent"] += len(batch)
+        vectors: list[list[float]] = []
+        error: Optional[Exception] = None
+        try:
+            vectors = await self._send(batch)
+            if len(vectors) != len(batch):
+                raise ValueError(
+                    f"embedding backend returned {len(vectors)} vectors for {len(batch)} texts"
+                )
+        except Exception as exc:
+            error = exc
+            if len(batch) > 1:
+                logger.warning(f"[Embedding] Coalesced batch of {len(batch)} failed: {exc}")
+        finally:
+            # Settle and release every key, so no caller waits forever and the
+            # key can be submitted again
+            for i, (key, _) in enumerate(batch):
+                fut = self._inflight.pop(key, None)
+                if fut is None or fut.done():
+                    continue
+                if error is not None:
+                    fut.set_exception(error)
+                elif i < len(vectors):
+                    fut.set_result(vectors[i])
+                else:
+                    fut.cancel()  # the send itself was cancelled
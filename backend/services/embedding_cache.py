@@ -0,0 +1,103 @@
+from __future__ import annotations
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from sqlmodel import Session
+
+from models.embedding_cache import EmbeddingCacheEntry
+from models.vector import VECTOR_DTYPE
+from services.log_streamer import logger
+
+EMBEDDING_CACHE_MEMORY_MAX = int(os.getenv("EMBEDDING_CACHE_MEMORY_MAX", "4096"))
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "true").lower() == "true"
+
+_WS_RE = re.compile(r"\s+")
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache keyed by content, not by caller-supplied key.
+
+    Tier 1 is a bounded in-memory LRU; tier 2 is the embedding_cache table,
+    which survives restarts. Keys are SHA-256 over (model, dims, normalised
+    text) so two sessions that serialise identically share one entry, and a
+    model or dimension change never returns a stale vector.
+    """
+
+    def __init__(self, max_items: int = EMBEDDING_CACHE_MEMORY_MAX, persist: bool = EMBEDDING_CACHE_PERSIST):
+        self.max_items = max(1, max_items)
+        self.persist = persist
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "writes": 0}
+
+    @staticmethod
+    def key_for(text: str, model: str, dims: int) -> str:
+        normalised = _WS_RE.sub(" ", text).strip()
+        return hashlib.sha256(f"{model}\x00{dims}\x00{normalised}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        vec = self._memory.get(key)
+        if vec is not None:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return vec
+        if self.persist:
+            vec = self._load(key)
+            if vec is not None:
+                self.stats["disk_hits"] += 1
+                self._remember(key, vec)
+                return vec
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, vector, model: str, dims: int) -> np.ndarray:
+        vec = np.array(vector, dtype=VECTOR_DTYPE)
+        vec.setflags(write=False)  # shared by every caller that hits this key
+        self._remember(key, vec)
+        if self.persist:
+            self._store(key, vec, model, dims)
+        self.stats["writes"] += 1
+        return vec
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "memory_items": len(self._memory),
+            "memory_max": self.max_items,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+        }
+
+    def _remember(self, key: str, vec: np.ndarray) -> None:
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _load(self, key: str) -> Optional[np.ndarray]:
+        from db import engine  # avoid circular at module level
+        try:
+            with Session(engine) as db:
+                row = db.get(EmbeddingCacheEntry, key)
+        except Exception as exc:
+            logger.warning(f"[EmbeddingCache] Disk read failed: {exc}")
+            return None
+        return np.frombuffer(row.vector, dtype=VECTOR_DTYPE) if row else None
+
+    def _store(self, key: str, vec: np.ndarray, model: str, dims: int) -> None:
+        from db import engine  # avoid circular at module level
+        try:
+            with Session(engine) as db:
+                db.merge(EmbeddingCacheEntry(key=key, model=model, dims=dims, vector=vec.tobytes()))
+                db.commit()
+        except Exception as exc:
+            logger.warning(f"[EmbeddingCache] Disk write failed: {exc}")
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,147 @@
+from __future__ import annotations
+import math
+import os
+import re
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter
+
+import numpy as np
+
+from services.log_streamer import logger
+from services.exceptions import QuotaExhaustedException
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini")  # gemini | local
+EMBEDDING_DIMS = 768  # match legacy text-embedding-004 output size
+GEMINI_EMBEDDING_MODEL = "gemini-embedding-001"
+LOCAL_EMBEDDING_MODEL = "local-hash-tf-v2"  # bump whenever vectorize() output changes
+# Fixed per-kind feature weights. Transitions weigh most: they separate a
+# workflow from the same steps in another order. Single parts and selector
+# words are shared by many traces, and element_value words vary per session,
+# so they are weak signals.
+LOCAL_FEATURE_WEIGHTS = {"s": 0.7, "t": 1.0, "p": 0.3, "w": 0.3, "v": 0.2}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+# uuids, long hex runs and digit runs in selectors are per-record ids, not structure
+_ID_RE = re.compile(r"[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12}|\b[0-9a-f]{12,}\b|\d+", re.I)
+
+
+def normalise_ids(text: str) -> str:
+    """Replace per-record ids in a trace part with '#' so equal structure compares equal."""
+    return _ID_RE.sub("#", text)
+
+
+class EmbeddingProvider(ABC):
+    """
+    Backend behind EmbeddingService. Providers only turn texts into vectors;
+    caching, batching and similarity stay in EmbeddingService.
+    """
+
+    model: str = ""
+    dims: int = EMBEDDING_DIMS
+    remote: bool = True  # remote providers go through the cache and coalescer
+
+    @abstractmethod
+    async def embed_texts(self, texts: list[str]) -> list:
+        """One float vector (list or ndarray) per text, in order."""
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    model = GEMINI_EMBEDDING_MODEL
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        # Created on first use so the local provider never needs GEMINI_API_KEY
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+        return self._client
+
+    async def embed_texts(self, texts: list[str]) -> list[list[float]]:
+        from google.genai import types
+        try:
+            result = await self.client.aio.models.embed_content(
+                model=self.model,
+                contents=texts,
+                config=types.EmbedContentConfig(output_dimensionality=self.dims),
+            )
+        except Exception as e:
+            msg = str(e)
+            if any(k in msg for k in ("429", "quota", "RESOURCE_EXHAUSTED", "Quota")):
+                logger.warning(f"[Embedding] QUOTA EXHAUSTED — {msg[:120]}")
+                raise QuotaExhaustedException(msg) from e
+            raise
+        return [emb.values for emb in result.embeddings]
+
+
+class LocalHashingProvider(EmbeddingProvider):
+    """
+    CPU-only vectoriser for serialize_trace output.
+
+    Each trace step ("event:screen:selector[:value]") yields features for the
+    whole step, its parts, the words of its selector and value, and the
+    transition from the previous step. Features are hashed (signed, crc32)
+    into `dims` buckets with sublinear TF × LOCAL_FEATURE_WEIGHTS, then
+    L2-normalised.
+
+    The weighting is fixed, so a text always maps to the same vector: stored
+    embeddings stay comparable across restarts and traffic, and vectors can
+    be cached under LOCAL_EMBEDDING_MODEL like any other provider's.
+    """
+
+    model = LOCAL_EMBEDDING_MODEL
+    remote = False
+
+    def __init__(self, dims: int = EMBEDDING_DIMS):
+        self.dims = dims
+
+    async def embed_texts(self, texts: list[str]) -> list[np.ndarray]:
+        return [self.vectorize(text) for text in texts]
+
+    def vectorize(self, text: str) -> np.ndarray:
+        features = self._features(text)
+        idx = np.empty(len(features), dtype=np.int64)
+        weights = np.empty(len(features), dtype=np.float32)
+        for i, (feature, tf) in enumerate(features.items()):
+            h = zlib.crc32(feature.encode())
+            sign = 1.0 if h & 0x80000000 else -1.0
+            idx[i] = h % self.dims
+            weights[i] = sign * LOCAL_FEATURE_WEIGHTS[feature[0]] * (1.0 + math.log(tf))
+
+        vec = np.zeros(self.dims, dtype=np.float32)
+        np.add.at(vec, idx, weights)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    @staticmethod
+    def _features(text: str) -> Counter:
+        """Bag of step, part, selector-word, value-word and transition features."""
+        features: Counter = Counter()
+        prev = "^"
+        for step in text.split(" | "):
+            parts = step.split(":", 3)
+            parts[:3] = [normalise_ids(p) for p in parts[:3]]
+            structural = ":".join(parts[:3])
+            features[f"s:{structural}"] += 1
+            features[f"t:{prev}>{structural}"] += 1
+            for part in parts[:3]:
+                features[f"p:{part}"] += 1
+            if len(parts) > 2:
+                for word in _WORD_RE.findall(parts[2].lower()):
+                    features[f"w:{word}"] += 1
+            if len(parts) > 3:
+                for word in _WORD_RE.findall(normalise_ids(parts[3]).lower()):
+                    features[f"v:{word}"] += 1
+            prev = structural
+        return features
+
+
+def make_provider(name: str = EMBEDDING_PROVIDER) -> EmbeddingProvider:
+    if name == "local":
+        return LocalHashingProvider()
+    if name == "gemini":
+        return GeminiEmbeddingProvider()
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER: {name}")
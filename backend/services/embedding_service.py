@@ -1,55 +1,92 @@
 from __future__ import annotations
-import os
+import asyncio
 import time
 import numpy as np
-from google import genai
-from google.genai import types
 
 from services.log_streamer import logger
-from services.exceptions import QuotaExhaustedException
+from services.embedding_cache import embedding_cache
+from services.embed_coalescer import EmbedCoalescer
+from services.embedding_providers import EmbeddingProvider, make_provider
 from models.event import ActionTrace
-
-EMBEDDING_MODEL = "gemini-embedding-001"
-EMBEDDING_DIMS = 768  # match legacy text-embedding-004 output size
+from models.vector import VECTOR_DTYPE
 
 
 class EmbeddingService:
-    def __init__(self):
-        self.client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
-        self._cache: dict[str, list[float]] = {}
+    """
+    Trace embedding with the backend chosen by EMBEDDING_PROVIDER.
+    Every provider is fronted by the content cache. Misses for remote
+    providers go through the coalescer; the local provider is called inline.
+    """
+
+    def __init__(self, provider: EmbeddingProvider | None = None):
+        self.provider = provider or make_provider()
+        self._coalescer = EmbedCoalescer(self._send_batch)
+        logger.info(f"[Embedding] Provider: {self.provider.model} ({self.provider.dims} dims)")
 
-    async def embed(self, text: str, cache_key: str) -> list[float]:
-        if cache_key in self._cache:
+    async def embed(self, text: str, cache_key: str) -> np.ndarray:
+        """Float32 vector for text. Cached vectors are shared read-only views."""
+        key = embedding_cache.key_for(text, self.provider.model, self.provider.dims)
+        cached = embedding_cache.get(key)
+        if cached is not None:
             logger.info(f"[Embedding] {cache_key} — cache hit")
-            return self._cache[cache_key]
+            return cached
+        if not self.provider.remote:
+            return (await self._send_batch([(key, text)]))[0]
+        return await self._coalescer.submit(key, text)
 
-        t0 = time.time()
-        try:
-            result = await self.client.aio.models.embed_content(
-                model=EMBEDDING_MODEL,
-                contents=text,
-                config=types.EmbedContentConfig(output_dimensionality=EMBEDDING_DIMS),
+    async def embed_batch(self, texts: list[str], cache_keys: list[str]) -> list[np.ndarray]:
+        """
+        Embed many texts at once. Cache semantics match embed(); misses go
+        through the same coalescer, so identical texts are sent once and
+        upstream calls are capped at EMBED_COALESCE_MAX texts each.
+        """
+        out: list = [None] * len(texts)
+        misses: list[tuple[int, str, str]] = []
+        for i, text in enumerate(texts):
+            key = embedding_cache.key_for(text, self.provider.model, self.provider.dims)
+            cached = embedding_cache.get(key)
+            if cached is not None:
+                out[i] = cached
+            else:
+                misses.append((i, key, text))
+        if not misses:
+            return out
+        if not self.provider.remote:
+            vectors = await self._send_batch([(key, text) for _, key, text in misses])
+        else:
+            vectors = await asyncio.gather(
+                *(self._coalescer.submit(key, text) for _, key, text in misses)
             )
-        except Exception as e:
-            msg = str(e)
-            if any(k in msg for k in ("429", "quota", "RESOURCE_EXHAUSTED", "Quota")):
-                logger.warning(f"[Embedding] QUOTA EXHAUSTED — {msg[:120]}")
-                raise QuotaExhaustedException(msg) from e
-            raise
+        for (i, _, _), vector in zip(misses, vectors):
+            out[i] = vector
+        return out
+
+    def coalescer_snapshot(self) -> dict:
+        """Coalescing counters: requests vs. upstream embed_content calls."""
+        return self._coalescer.snapshot()
+
+    async def _send_batch(self, items: list[tuple[str, str]]) -> list[np.ndarray]:
+        """One provider call for every text: the coalescer's sink, and the local provider's miss path."""
+        texts = [text for _, text in items]
+        t0 = time.time()
+        vectors = await self.provider.embed_texts(texts)
         latency_ms = int((time.time() - t0) * 1000)
-        vector = result.embeddings[0].values
-        self._cache[cache_key] = vector
+        vectors = [
+            embedding_cache.put(key, vector, self.provider.model, self.provider.dims)
+            for (key, _), vector in zip(items, vectors)
+        ]
 
-        token_estimate = len(text.split())
+        token_estimate = sum(len(t.split()) for t in texts)
         logger.info(
-            f"[Embedding] {EMBEDDING_MODEL} called | key={cache_key} | "
-            f"~{token_estimate} tokens | {len(vector)} dims | {latency_ms}ms"
+            f"[Embedding] {self.provider.model} called | {len(texts)} text(s) | "
+            f"~{token_estimate} tokens | {self.provider.dims} dims | {latency_ms}ms"
         )
-        return vector
+        return vectors
 
-    def cosine_similarity(self, a: list[float], b: list[float]) -> float:
-        va = np.array(a, dtype=np.float64)
-        vb = np.array(b, dtype=np.float64)
+    def cosine_similarity(self, a, b) -> float:
+        # asarray: no copy for float32 column views and cached vectors
+        va = _as_vector(a)
+        vb = _as_vector(b)
         denom = np.linalg.norm(va) * np.linalg.norm(vb)
         if denom == 0:
             return 0.0
@@ -65,4 +102,8 @@ class EmbeddingService:
         return " | ".join(lines)
 
 
+def _as_vector(value) -> np.ndarray:
+    return np.asarray(value, dtype=VECTOR_DTYPE)
+
+
 embedding_service = EmbeddingService()
@@ -0,0 +1,71 @@
+from __future__ import annotations
+from typing import Iterable, Iterator, Optional
+
+from sqlmodel import Session, select, delete
+
+from models.session import SessionRecord, UIEventRecord
+
+_STREAM_CHUNK = 256
+
+
+class EventLog:
+    """
+    Append-only per-session event storage backed by the ui_events table.
+    Replaces rewriting SessionRecord.events on every captured event.
+    """
+
+    def append(self, session: SessionRecord, event: dict, db: Session) -> int:
+        """Stage one event row for the session. Caller commits. Returns its seq."""
+        seq = session.event_count or 0
+        db.add(UIEventRecord(
+            session_id=session.session_id,
+            seq=seq,
+            event_type=event.get("event_type", ""),
+            payload=event,
+        ))
+        session.event_count = seq + 1
+        db.add(session)
+        return seq
+
+    def append_many(self, session: SessionRecord, events: Iterable[dict], db: Session) -> None:
+        for event in events:
+            self.append(session, event, db)
+
+    def iter_events(self, session_id: str, db: Optional[Session] = None) -> Iterator[dict]:
+        """Stream a session's events in capture order."""
+        if db is None:
+            from db import engine  # avoid circular at module level
+            with Session(engine) as own_db:
+                yield from self.iter_events(session_id, own_db)
+            return
+        stmt = (
+            select(UIEventRecord.payload)
+            .where(UIEventRecord.session_id == session_id)
+            .order_by(UIEventRecord.seq)
+            .execution_options(yield_per=_STREAM_CHUNK)
+        )
+        yield from db.exec(stmt)
+
+    def load_events(self, session_id: str, db: Optional[Session] = None) -> list[dict]:
+        return list(self.iter_events(session_id, db))
+
+    def load_events_for(self, session_ids: list[str], db: Session) -> dict[str, list[dict]]:
+        """Fetch events for several sessions in one query, grouped by session."""
+        grouped: dict[str, list[dict]] = {sid: [] for sid in session_ids}
+        if not session_ids:
+            return grouped
+        stmt = (
+            select(UIEventRecord.session_id, UIEventRecord.payload)
+            .where(UIEventRecord.session_id.in_(session_ids))
+            .order_by(UIEventRecord.session_id, UIEventRecord.seq)
+            .execution_options(yield_per=_STREAM_CHUNK)
+        )
+        for session_id, payload in db.exec(stmt):
+            grouped[session_id].append(payload)
+        return grouped
+
+    def delete_session(self, session_id: str, db: Session) -> None:
+        db.exec(delete(UIEventRecord).where(UIEventRecord.session_id == session_id))
+
+
+event_log = EventLog()
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import os
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from sqlmodel import Session, select
+
+from models.session import SessionRecord
+from models.vector import vector_to_json
+from services.similarity_index import SimilarityPartition, similarity_index
+
+EVIDENCE_CACHE_TYPES = int(os.getenv("EVIDENCE_CACHE_TYPES", "8"))  # permit types kept in memory
+
+
+class EvidenceEntry:
+    """Completed sessions of one permit type, in completed_at order, plus their unit rows."""
+
+    def __init__(self, partition: SimilarityPartition, rows: list):
+        self.partition = partition
+        self.version = partition.version
+        self.ids: list[str] = [r[0] for r in rows]
+        self._positions = {session_id: i for i, session_id in enumerate(self.ids)}
+        self.meta: list[dict] = [
+            {
+                "session_id": session_id,
+                "is_seeded": is_seeded,
+                "completed_at": completed_at.isoformat() if completed_at else None,
+                "event_count": event_count,
+                "embedding_dims": 0 if embedding is None else len(embedding),
+                "embedding_preview": vector_to_json(embedding[:10]) if embedding is not None else [],
+            }
+            for session_id, is_seeded, completed_at, event_count, embedding in rows
+        ]
+        present, block = partition.unit_rows(self.ids)
+        self.present = present
+        self.unit = np.zeros((len(self.ids), block.shape[1] if block.size else 0), dtype=np.float32)
+        self.unit[present] = block
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def index(self, session_id: str) -> Optional[int]:
+        """Position of session_id in completed_at order, or None."""
+        return self._positions.get(session_id)
+
+    def tile(self, rows: slice, cols: slice) -> np.ndarray:
+        """Cosine block rows × cols; NaN where either session has no embedding."""
+        out = self.unit[rows] @ self.unit[cols].T
+        out[~self.present[rows], :] = np.nan
+        out[:, ~self.present[cols]] = np.nan
+        return out
+
+
+class EvidenceCache:
+    """
+    Per-permit-type cache behind GET /api/evidence.
+
+    An entry holds the ordered session metadata and the exact unit rows of
+    that permit type's similarity partition. It is rebuilt when the partition
+    has changed since (its version bumps when a session completes and is
+    added, or is removed), so it is invalidated when sessions complete
+    without any caller having to remember to do it. Similarity tiles are
+    then products of row slices against the cached rows (top-k neighbours
+    come from the session_similarity view instead). The N×N matrix is never
+    materialised, and a page costs O(page × N × dims) at most.
+    """
+
+    def __init__(self, max_types: int = EVIDENCE_CACHE_TYPES):
+        self.max_types = max_types
+        self._entries: OrderedDict[str, EvidenceEntry] = OrderedDict()
+        self.stats = {"hits": 0, "builds": 0}
+
+    def get(self, permit_type: str, db: Session) -> EvidenceEntry:
+        partition = similarity_index.sessions(permit_type, db)
+        entry: Optional[EvidenceEntry] = self._entries.get(permit_type)
+        if entry is not None and entry.partition is partition and entry.version == partition.version:
+            self._entries.move_to_end(permit_type)
+            self.stats["hits"] += 1
+            return entry
+        rows = db.exec(
+            select(
+                SessionRecord.session_id,
+                SessionRecord.is_seeded,
+                SessionRecord.completed_at,
+                SessionRecord.event_count,
+                SessionRecord.embedding,
+            )
+            .where(SessionRecord.permit_type == permit_type, SessionRecord.completed_at != None)
+            .order_by(SessionRecord.completed_at, SessionRecord.session_id)
+        ).all()
+        entry = EvidenceEntry(partition, rows)
+        self._entries[permit_type] = entry
+        self._entries.move_to_end(permit_type)
+        while len(self._entries) > self.max_types:
+            self._entries.popitem(last=False)
+        self.stats["builds"] += 1
+        return entry
+
+    def snapshot(self) -> dict:
+        return {"permit_types": len(self._entries), **self.stats}
+
+
+evidence_cache = EvidenceCache()
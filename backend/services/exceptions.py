@@ -1,3 +1,15 @@
 class QuotaExhaustedException(Exception):
     """Raised when a Gemini API quota/rate-limit error is detected."""
     pass
+
+
+class BatchInterruptedException(Exception):
+    """
+    Raised when an event batch stops on an error. Events before index
+    `unprocessed` were recorded; the rest were not handled.
+    """
+
+    def __init__(self, unprocessed: int, cause: Exception):
+        super().__init__(f"stopped before event {unprocessed}: {cause}")
+        self.unprocessed = unprocessed
+        self.cause = cause
@@ -0,0 +1,185 @@
+from __future__ import annotations
+import hashlib
+import os
+import zlib
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+from sqlmodel import Session, select, delete
+
+from models.fingerprint import LshBucket, TraceFingerprint
+from models.session import SessionRecord
+from services.embedding_providers import normalise_ids
+
+FINGERPRINT_SHINGLE = int(os.getenv("FINGERPRINT_SHINGLE", "3"))  # steps per shingle
+FINGERPRINT_BANDS = int(os.getenv("FINGERPRINT_BANDS", "16"))
+FINGERPRINT_ROWS = int(os.getenv("FINGERPRINT_ROWS", "4"))  # MinHash values per band
+FINGERPRINT_MAX_CANDIDATES = int(os.getenv("FINGERPRINT_MAX_CANDIDATES", "200"))
+
+# Steps that carry workflow structure; hover/scroll/copy are noise, submit ends the trace
+STRUCTURAL_EVENTS = frozenset({"click", "navigate", "input", "screen_switch"})
+_PRIME = 4_294_967_311  # smallest prime above 2**32; a * x stays inside uint64
+
+
+def step_token(event_type: str, screen_name: str, element_selector: str) -> str:
+    """Normalised structural step: ids in the screen or selector become '#'."""
+    return normalise_ids(f"{event_type}:{screen_name}:{element_selector}")
+
+
+def structural_steps(events: Iterable[dict]) -> list[str]:
+    """Structural steps of a stored trace, with consecutive repeats collapsed."""
+    steps: list[str] = []
+    for e in events:
+        if e.get("event_type") not in STRUCTURAL_EVENTS:
+            continue
+        token = step_token(e["event_type"], e.get("screen_name", ""), e.get("element_selector", ""))
+        if not steps or steps[-1] != token:
+            steps.append(token)
+    return steps
+
+
+class Fingerprint(NamedTuple):
+    digest: str  # exact structure: identical traces share it
+    signature: np.ndarray  # MinHash, uint32[bands * rows]
+    buckets: list[int]  # one LSH bucket key per band
+
+
+class TraceFingerprinter:
+    """
+    Local MinHash + LSH fingerprint of a session's structural trace.
+
+    A trace is reduced to its normalised (event_type, screen_name,
+    element_selector) steps. The steps are cut into FINGERPRINT_SHINGLE-step
+    shingles, and bands * rows MinHash values are taken over the shingle
+    hashes. Two things are stored in SQLite:
+      - digest, a SHA-256 of the permit_type plus the exact step sequence.
+        A structurally identical trace is one indexed lookup away, and
+        PatternDetector reuses its embedding instead of calling the model.
+      - one lsh_buckets row per band. Sessions that share any bucket are
+        likely to have Jaccard similarity above roughly
+        (1 / bands) ** (1 / rows), about 0.5 with the defaults. candidates()
+        returns them from an indexed IN lookup, without a scan.
+    """
+
+    def __init__(
+        self,
+        shingle: int = FINGERPRINT_SHINGLE,
+        bands: int = FINGERPRINT_BANDS,
+        rows: int = FINGERPRINT_ROWS,
+        seed: int = 19,
+    ):
+        self.shingle = max(1, shingle)
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=bands * rows, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=bands * rows, dtype=np.uint64)
+
+    def fingerprint(self, permit_type: str, events: Iterable[dict]) -> Fingerprint:
+        steps = structural_steps(events)
+        digest = hashlib.sha256("\n".join([permit_type, *steps]).encode()).hexdigest()
+        signature = self.minhash(steps)
+        return Fingerprint(digest, signature, self.band_buckets(signature))
+
+    def minhash(self, steps: list[str]) -> np.ndarray:
+        k = self.shingle
+        shingles = {
+            zlib.crc32("\x1f".join(steps[i:i + k]).encode())
+            for i in range(max(1, len(steps) - k + 1))
+        }
+        x = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+        # (a * x + b) mod p for every hash function × shingle, then the min per function
+        hashed = (np.outer(self._a, x) % _PRIME + self._b[:, None]) % _PRIME
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def band_buckets(self, signature: np.ndarray) -> list[int]:
+        bands = signature.reshape(self.bands, self.rows)
+        return [
+            int.from_bytes(
+                hashlib.blake2b(bytes([band]) + bands[band].tobytes(), digest_size=8).digest(), "little"
+            ) >> 1  # keep it a positive signed 64-bit SQLite integer
+            for band in range(self.bands)
+        ]
+
+    @staticmethod
+    def similarity(a: np.ndarray, b: np.ndarray) -> float:
+        """Estimated Jaccard similarity of the two traces' shingle sets."""
+        return float(np.mean(a == b))
+
+    def store(self, session_id: str, permit_type: str, fp: Fingerprint, db: Session) -> None:
+        """Upsert a session's fingerprint and buckets; the caller commits."""
+        db.exec(delete(LshBucket).where(LshBucket.session_id == session_id))
+        db.merge(TraceFingerprint(
+            session_id=session_id,
+            permit_type=permit_type,
+            digest=fp.digest,
+            signature=fp.signature.astype("<u4").tobytes(),
+        ))
+        for bucket in set(fp.buckets):
+            db.add(LshBucket(bucket=bucket, session_id=session_id))
+
+    def delete(self, session_id: str, db: Session) -> None:
+        db.exec(delete(LshBucket).where(LshBucket.session_id == session_id))
+        db.exec(delete(TraceFingerprint).where(TraceFingerprint.session_id == session_id))
+
+    def identical_embedding(
+        self,
+        digest: str,
+        db: Session,
+        exclude: Optional[str] = None,
+    ) -> Optional[tuple[str, np.ndarray]]:
+        """(session_id, embedding) of an embedded session with exactly this structure."""
+        stmt = (
+            select(SessionRecord.session_id, SessionRecord.embedding)
+            .join(TraceFingerprint, TraceFingerprint.session_id == SessionRecord.session_id)
+            .where(TraceFingerprint.digest == digest, SessionRecord.embedding != None)
+        )
+        if exclude is not None:
+            stmt = stmt.where(TraceFingerprint.session_id != exclude)
+        row = db.exec(stmt.limit(1)).first()
+        return (row[0], row[1]) if row else None
+
+    def embeddings_for_digests(self, digests: set[str], db: Session) -> dict[str, np.ndarray]:
+        """One known embedding per digest, for the digests that have one."""
+        out: dict[str, np.ndarray] = {}
+        wanted = list(digests)
+        for start in range(0, len(wanted), 500):
+            rows = db.exec(
+                select(TraceFingerprint.digest, SessionRecord.embedding)
+                .join(SessionRecord, TraceFingerprint.session_id == SessionRecord.session_id)
+                .where(
+                    TraceFingerprint.digest.in_(wanted[start:start + 500]),
+                    SessionRecord.embedding != None,
+                )
+            ).all()
+            for digest, vector in rows:
+                out.setdefault(digest, vector)
+        return out
+
+    def candidates(
+        self,
+        session_id: str,
+        permit_type: str,
+        fp: Fingerprint,
+        db: Session,
+    ) -> list[tuple[str, float]]:
+        """Prior sessions of the permit type sharing an LSH bucket, by estimated Jaccard."""
+        rows = db.exec(
+            select(TraceFingerprint.session_id, TraceFingerprint.signature)
+            .join(LshBucket, LshBucket.session_id == TraceFingerprint.session_id)
+            .where(
+                LshBucket.bucket.in_(fp.buckets),
+                TraceFingerprint.permit_type == permit_type,
+                TraceFingerprint.session_id != session_id,
+            )
+            .distinct()
+        ).all()
+        scored = [
+            (sid, self.similarity(fp.signature, np.frombuffer(sig, dtype="<u4")))
+            for sid, sig in rows
+        ]
+        scored.sort(key=lambda pair: -pair[1])
+        return scored[:FINGERPRINT_MAX_CANDIDATES]
+
+
+trace_fingerprinter = TraceFingerprinter()
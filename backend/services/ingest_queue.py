@@ -0,0 +1,319 @@
+from __future__ import annotations
+import asyncio
+import os
+import zlib
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from sqlmodel import Session, select
+
+from models.event import UIEvent
+from models.ingest_dead_letter import IngestDeadLetter
+from services.exceptions import BatchInterruptedException
+from services.log_streamer import logger
+
+OBSERVE_INGEST_MODE = os.getenv("OBSERVE_INGEST_MODE", "sync")  # sync | queue
+OBSERVE_QUEUE_MAXSIZE = int(os.getenv("OBSERVE_QUEUE_MAXSIZE", "1000"))
+OBSERVE_QUEUE_WORKERS = int(os.getenv("OBSERVE_QUEUE_WORKERS", "4"))
+OBSERVE_GROUP_COMMIT_MAX = int(os.getenv("OBSERVE_GROUP_COMMIT_MAX", "50"))
+OBSERVE_RETRY_AFTER_S = int(os.getenv("OBSERVE_RETRY_AFTER_S", "1"))
+OBSERVE_RETRY_MAX = int(os.getenv("OBSERVE_RETRY_MAX", "5"))  # attempts without progress before dead-lettering
+OBSERVE_RETRY_BASE_S = float(os.getenv("OBSERVE_RETRY_BASE_S", "2"))  # doubles per failed attempt
+OBSERVE_RETRY_MAX_S = 60.0
+
+# (session_id, ordered events for that session, db) -> per-session result
+GroupHandler = Callable[[str, list[UIEvent], Session], Awaitable[dict]]
+
+
+@dataclass
+class _Held:
+    """A session's events waiting for a retry, oldest first."""
+    events: list[UIEvent]
+    attempts: int
+    retry_at: float
+    error: str
+
+
+class IngestQueue:
+    """
+    Bounded write-behind queue for /api/observe (OBSERVE_INGEST_MODE=queue).
+
+    Events are sharded by session_id so each session is always drained by the
+    same worker, preserving per-session order. A worker takes everything
+    already waiting on its shard (up to OBSERVE_GROUP_COMMIT_MAX), groups it by
+    session and hands each group to the handler in its own database session,
+    so one failing group does not affect the others.
+
+    Events were acknowledged with a 202, so a group that stops part-way is
+    not dropped:
+      - Quota errors and interrupted batches hold the unprocessed tail on the
+        worker and retry it with exponential backoff. Later events for that
+        session queue up behind it to keep the order. After OBSERVE_RETRY_MAX
+        attempts without progress the tail is dead-lettered.
+      - Any other error dead-letters the group for inspection.
+    Dead letters go to the ingest_dead_letters table. Retryable ones (and
+    anything still held at shutdown) are replayed by the next start().
+    """
+
+    def __init__(
+        self,
+        maxsize: int = OBSERVE_QUEUE_MAXSIZE,
+        workers: int = OBSERVE_QUEUE_WORKERS,
+        group_commit_max: int = OBSERVE_GROUP_COMMIT_MAX,
+    ):
+        self.workers = max(1, workers)
+        self.group_commit_max = max(1, group_commit_max)
+        # A batch for one session lands on one shard, so this is the largest batch submit() can take
+        self.max_batch = max(1, maxsize // self.workers)
+        self._shards: list[asyncio.Queue] = [
+            asyncio.Queue(maxsize=self.max_batch) for _ in range(self.workers)
+        ]
+        self._held: list[dict[str, _Held]] = [{} for _ in range(self.workers)]
+        self._tasks: list[asyncio.Task] = []
+        self._handler: Optional[GroupHandler] = None
+        self.stats = {"groups": 0, "failed_groups": 0, "retried": 0, "dead_lettered": 0, "replayed": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return OBSERVE_INGEST_MODE == "queue"
+
+    def set_handler(self, handler: GroupHandler) -> None:
+        self._handler = handler
+
+    def _shard_index(self, session_id: str) -> int:
+        return zlib.crc32(session_id.encode()) % self.workers
+
+    def submit(self, events: list[UIEvent]) -> bool:
+        """
+        Enqueue events all-or-nothing. Returns False when any target shard lacks
+        room, so the caller can answer 429 without a partially accepted batch.
+        Callers reject batches over max_batch first: those never fit.
+        """
+        needed: dict[int, int] = {}
+        for event in events:
+            idx = self._shard_index(event.session_id)
+            needed[idx] = needed.get(idx, 0) + 1
+        for idx, count in needed.items():
+            q = self._shards[idx]
+            if count > q.maxsize - q.qsize():
+                return False
+        for event in events:
+            self._shards[self._shard_index(event.session_id)].put_nowait(event)
+        return True
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._shards)
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "depth": self.depth(),
+            "max_batch": self.max_batch,
+            "held_sessions": sum(len(held) for held in self._held),
+            "held_events": sum(len(h.events) for held in self._held for h in held.values()),
+        }
+
+    async def start(self) -> None:
+        if not self.enabled or self._tasks:
+            return
+        self._replay_dead_letters()
+        self._tasks = [
+            asyncio.create_task(self._worker(i, q)) for i, q in enumerate(self._shards)
+        ]
+        logger.info(
+            f"[Ingest] Write-behind queue started | workers={self.workers} "
+            f"capacity={sum(q.maxsize for q in self._shards)}"
+        )
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        Drain outstanding events and stop the workers. Whatever is still held
+        or queued after the timeout was acknowledged with a 202, so it is
+        dead-lettered as retryable for the next start().
+        """
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for q in self._shards)), timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"[Ingest] Shutdown with {self.depth()} events undrained")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for held, q in zip(self._held, self._shards):
+            while not q.empty():
+                event = q.get_nowait()
+                self._hold_back(held, event.session_id, [event], 0, "shutdown")
+                q.task_done()
+            for session_id, h in held.items():
+                self._dead_letter(session_id, h.events, h.error, h.attempts, retryable=True)
+            held.clear()
+
+    async def _worker(self, index: int, q: asyncio.Queue) -> None:
+        held = self._held[index]
+        while True:
+            batch = await self._take(q, held)
+
+            # Held sessions that are due go first; new events for a held session wait behind it
+            now = asyncio.get_running_loop().time()
+            groups: dict[str, tuple[list[UIEvent], int]] = {}
+            for session_id in [sid for sid, h in held.items() if h.retry_at <= now]:
+                h = held.pop(session_id)
+                groups[session_id] = (h.events, h.attempts)
+            for event in batch:
+                if event.session_id in held:
+                    held[event.session_id].events.append(event)
+                else:
+                    groups.setdefault(event.session_id, ([], 0))[0].append(event)
+
+            pending = list(groups.items())
+            try:
+                while pending:
+                    session_id, (session_events, attempts) = pending[0]
+                    await self._run_group(index, session_id, session_events, attempts)
+                    pending.pop(0)
+            except asyncio.CancelledError:
+                # Shutdown: groups not started yet go back on hold so stop() persists them.
+                # The interrupted group may be partly recorded, so it is not replayed.
+                if pending:
+                    logger.warning(
+                        f"[Ingest] Worker {index} stopped during {len(pending[0][1][0])} "
+                        f"events of {pending[0][0]}"
+                    )
+                for session_id, (session_events, attempts) in pending[1:]:
+                    self._hold_back(held, session_id, session_events, attempts, "shutdown")
+                raise
+            finally:
+                for _ in batch:
+                    q.task_done()
+
+    @staticmethod
+    def _hold_back(
+        held: dict[str, _Held],
+        session_id: str,
+        events: list[UIEvent],
+        attempts: int,
+        error: str,
+    ) -> None:
+        """Queue events behind anything already held for the session."""
+        if session_id in held:
+            held[session_id].events += events
+        else:
+            held[session_id] = _Held(events=list(events), attempts=attempts, retry_at=0.0, error=error)
+
+    async def _take(self, q: asyncio.Queue, held: dict[str, _Held]) -> list[UIEvent]:
+        """Wait for events, or until the next held retry is due (then possibly empty)."""
+        timeout = None
+        if held:
+            due = min(h.retry_at for h in held.values())
+            timeout = max(0.0, due - asyncio.get_running_loop().time())
+        try:
+            batch = [await asyncio.wait_for(q.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while len(batch) < self.group_commit_max and not q.empty():
+            batch.append(q.get_nowait())
+        return batch
+
+    async def _run_group(
+        self,
+        index: int,
+        session_id: str,
+        events: list[UIEvent],
+        attempts: int,
+    ) -> None:
+        """Handle one session's events; hold or dead-letter whatever was not processed."""
+        from db import engine  # avoid circular at module level
+
+        self.stats["groups"] += 1
+        try:
+            with Session(engine) as db:
+                out = await self._handler(session_id, events, db)
+            unprocessed, error = out.get("unprocessed"), out.get("status", "")
+        except BatchInterruptedException as exc:
+            unprocessed, error = exc.unprocessed, str(exc.cause)
+            logger.error(
+                f"[Ingest] Worker {index} stopped on {session_id} at event "
+                f"{unprocessed + 1}/{len(events)}: {exc.cause}"
+            )
+        except Exception as exc:
+            self.stats["failed_groups"] += 1
+            logger.error(f"[Ingest] Worker {index} failed on {len(events)} events of {session_id}: {exc}")
+            self._dead_letter(session_id, events, str(exc), attempts + 1, retryable=False)
+            return
+
+        rest = events[unprocessed:] if unprocessed is not None else []
+        if not rest:
+            return
+        self.stats["failed_groups"] += 1
+        attempts = 1 if unprocessed > 0 else attempts + 1  # progress resets the budget
+        if attempts >= OBSERVE_RETRY_MAX:
+            self._dead_letter(session_id, rest, error, attempts, retryable=True)
+            return
+        delay = min(OBSERVE_RETRY_BASE_S * 2 ** (attempts - 1), OBSERVE_RETRY_MAX_S)
+        self._held[index][session_id] = _Held(
+            events=rest,
+            attempts=attempts,
+            retry_at=asyncio.get_running_loop().time() + delay,
+            error=error,
+        )
+        self.stats["retried"] += 1
+        logger.warning(
+            f"[Ingest] {len(rest)} events of {session_id} held for retry "
+            f"{attempts + 1}/{OBSERVE_RETRY_MAX} in {delay:g}s ({error})"
+        )
+
+    def _dead_letter(
+        self,
+        session_id: str,
+        events: list[UIEvent],
+        error: str,
+        attempts: int,
+        retryable: bool,
+    ) -> None:
+        from db import engine  # avoid circular at module level
+
+        try:
+            with Session(engine) as db:
+                db.add(IngestDeadLetter(
+                    session_id=session_id,
+                    events=[e.model_dump(mode="json") for e in events],
+                    error=error[:500],
+                    attempts=attempts,
+                    retryable=retryable,
+                ))
+                db.commit()
+        except Exception as exc:
+            logger.error(f"[Ingest] Could not dead-letter {len(events)} events of {session_id}: {exc}")
+            return
+        self.stats["dead_lettered"] += len(events)
+        logger.warning(
+            f"[Ingest] Dead-lettered {len(events)} events of {session_id} "
+            f"({'retryable' if retryable else 'failed'}): {error[:200]}"
+        )
+
+    def _replay_dead_letters(self) -> None:
+        """Hold retryable dead letters on their shards, due now, and delete the rows."""
+        from db import engine  # avoid circular at module level
+
+        with Session(engine) as db:
+            rows = db.exec(
+                select(IngestDeadLetter)
+                .where(IngestDeadLetter.retryable == True)  # noqa: E712
+                .order_by(IngestDeadLetter.created_at)
+            ).all()
+            for row in rows:
+                events = [UIEvent.model_validate(e) for e in row.events]
+                held = self._held[self._shard_index(row.session_id)]
+                self._hold_back(held, row.session_id, events, 0, row.error or "")
+                db.delete(row)
+                self.stats["replayed"] += len(events)
+            db.commit()
+        if rows:
+            logger.info(f"[Ingest] Replaying {self.stats['replayed']} dead-lettered events")
+
+
+ingest_queue = IngestQueue()
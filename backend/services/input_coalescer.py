@@ -0,0 +1,41 @@
+from __future__ import annotations
+import os
+from typing import Optional
+
+# Debug mode: persist every raw input event instead of one per typing run
+OBSERVE_RAW_EVENTS = os.getenv("OBSERVE_RAW_EVENTS", "false").lower() == "true"
+
+
+class InputCoalescer:
+    """
+    Collapses consecutive `input` events on the same element into one event
+    carrying the final value. The merged event keeps the last event's
+    timestamp, records the run's first timestamp in `first_timestamp` and the
+    number of raw events in `coalesced_count`.
+    """
+
+    def __init__(self, enabled: bool = not OBSERVE_RAW_EVENTS):
+        self.enabled = enabled
+
+    def opens_run(self, event: dict) -> bool:
+        return self.enabled and event.get("event_type") == "input"
+
+    def merge(self, run: dict, event: dict) -> Optional[dict]:
+        """Return the run extended by event, or None if event ends the run."""
+        if not (
+            self.opens_run(event)
+            and event.get("element_selector") == run.get("element_selector")
+            and event.get("screen_name") == run.get("screen_name")
+        ):
+            return None
+        return {
+            **event,
+            "first_timestamp": run.get("first_timestamp") or run.get("timestamp"),
+            "coalesced_count": (run.get("coalesced_count") or 1) + 1,
+            # Narration / labels / screenshots may land on any keystroke of the run
+            "step_description": event.get("step_description") or run.get("step_description"),
+            "screenshot_ref": event.get("screenshot_ref") or run.get("screenshot_ref"),
+        }
+
+
+input_coalescer = InputCoalescer()
@@ -0,0 +1,233 @@
+from __future__ import annotations
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import update
+from sqlmodel import Session, select, delete
+
+from models.job import JobRecord, JobStatus
+from services.exceptions import QuotaExhaustedException
+from services.log_streamer import logger
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_BASE_S = float(os.getenv("JOB_BACKOFF_BASE_S", "5"))  # doubles per quota retry
+JOB_BACKOFF_MAX_S = float(os.getenv("JOB_BACKOFF_MAX_S", "300"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))  # finished jobs pruned at startup
+JOB_POLL_S = 2.0  # idle workers re-check for retries that came due
+
+Handler = Callable[[dict], Awaitable[Optional[dict]]]
+
+
+class JobQueue:
+    """
+    SQLite-backed queue for background work that used to be a bare
+    asyncio.create_task: spec pre-generation and agent runs.
+
+    Each job is a row in the jobs table. Every registered kind gets its own
+    pool of workers, sized by register() or JOB_CONCURRENCY_<KIND>, so a
+    burst of READY sessions queues up instead of starting dozens of
+    concurrent Gemini calls. Workers claim the oldest due job with a
+    conditional UPDATE, so two workers never run the same row.
+      - enqueue() with a dedup_key returns the queued or running job that
+        already has that (kind, dedup_key) instead of adding another.
+      - A handler that raises QuotaExhaustedException is retried with
+        exponential backoff, up to JOB_MAX_ATTEMPTS attempts. Any other
+        exception fails the job.
+      - On startup, jobs left running by a crash go back to queued. On
+        shutdown, in-flight jobs are cancelled and re-queued.
+    Status is served by GET /api/jobs/{id}.
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, tuple[Handler, int]] = {}
+        self._wake: dict[str, asyncio.Event] = {}
+        self._tasks: list[asyncio.Task] = []
+        self._running: dict[str, int] = {}
+        self.stats = {"enqueued": 0, "deduplicated": 0, "succeeded": 0, "failed": 0, "retried": 0, "recovered": 0}
+
+    def register(self, kind: str, handler: Handler, concurrency: int = 1) -> None:
+        concurrency = int(os.getenv(f"JOB_CONCURRENCY_{kind.upper()}", str(concurrency)))
+        self._handlers[kind] = (handler, max(1, concurrency))
+        self._wake.setdefault(kind, asyncio.Event())
+        self._running.setdefault(kind, 0)
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: dict,
+        db: Session,
+        dedup_key: Optional[str] = None,
+    ) -> JobRecord:
+        """Persist a job and wake a worker; commits db."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        if dedup_key is not None:
+            existing = db.exec(
+                select(JobRecord).where(
+                    JobRecord.kind == kind,
+                    JobRecord.dedup_key == dedup_key,
+                    JobRecord.status.in_([JobStatus.QUEUED, JobStatus.RUNNING]),
+                )
+            ).first()
+            if existing is not None:
+                self.stats["deduplicated"] += 1
+                logger.info(f"[Jobs] {kind} for {dedup_key} already {existing.status.value} ({existing.id[:8]})")
+                return existing
+        job = JobRecord(kind=kind, dedup_key=dedup_key, payload=payload)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self.stats["enqueued"] += 1
+        self._wake[kind].set()
+        return job
+
+    def get(self, job_id: str, db: Session) -> Optional[JobRecord]:
+        return db.get(JobRecord, job_id)
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "kinds": {
+                kind: {"concurrency": concurrency, "running": self._running.get(kind, 0)}
+                for kind, (_, concurrency) in self._handlers.items()
+            },
+        }
+
+    async def start(self) -> None:
+        """Re-queue jobs a crash left running, prune old finished jobs, start the workers."""
+        if self._tasks:
+            return
+        from db import engine  # avoid circular at module level
+
+        with Session(engine) as db:
+            recovered = db.exec(
+                update(JobRecord)
+                .where(JobRecord.status == JobStatus.RUNNING)
+                .values(status=JobStatus.QUEUED, run_after=datetime.utcnow())
+            ).rowcount
+            db.exec(delete(JobRecord).where(
+                JobRecord.status.in_([JobStatus.SUCCEEDED, JobStatus.FAILED]),
+                JobRecord.finished_at < datetime.utcnow() - timedelta(days=JOB_RETENTION_DAYS),
+            ))
+            db.commit()
+        if recovered:
+            self.stats["recovered"] += recovered
+            logger.info(f"[Jobs] Recovered {recovered} job(s) interrupted by a restart")
+
+        for kind, (handler, concurrency) in self._handlers.items():
+            self._tasks += [asyncio.create_task(self._worker(kind, handler)) for _ in range(concurrency)]
+        logger.info(
+            "[Jobs] Workers started | "
+            + ", ".join(f"{kind}={concurrency}" for kind, (_, concurrency) in self._handlers.items())
+        )
+
+    async def stop(self) -> None:
+        """Cancel the workers; jobs they were running are re-queued for the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, kind: str, handler: Handler) -> None:
+        wake = self._wake[kind]
+        while True:
+            wake.clear()
+            try:
+                job = self._claim(kind)
+            except Exception as exc:
+                logger.error(f"[Jobs] Could not claim a {kind} job: {exc}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(wake.wait(), JOB_POLL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._execute(job, handler)
+
+    def _claim(self, kind: str) -> Optional[JobRecord]:
+        """Mark the oldest due queued job of this kind running; None if there is none."""
+        from db import engine  # avoid circular at module level
+
+        now = datetime.utcnow()
+        with Session(engine) as db:
+            while True:
+                job_id = db.exec(
+                    select(JobRecord.id)
+                    .where(JobRecord.kind == kind, JobRecord.status == JobStatus.QUEUED, JobRecord.run_after <= now)
+                    .order_by(JobRecord.run_after, JobRecord.created_at)
+                    .limit(1)
+                ).first()
+                if job_id is None:
+                    return None
+                claimed = db.exec(
+                    update(JobRecord)
+                    .where(JobRecord.id == job_id, JobRecord.status == JobStatus.QUEUED)
+                    .values(status=JobStatus.RUNNING, started_at=now, attempts=JobRecord.attempts + 1)
+                ).rowcount
+                db.commit()
+                if claimed:
+                    job = db.get(JobRecord, job_id)
+                    db.expunge(job)
+                    return job
+
+    async def _execute(self, job: JobRecord, handler: Handler) -> None:
+        self._running[job.kind] += 1
+        try:
+            result = await handler(dict(job.payload))
+        except asyncio.CancelledError:
+            self._finish(job.id, JobStatus.QUEUED, error="interrupted by shutdown")
+            raise
+        except QuotaExhaustedException as exc:
+            if job.attempts < JOB_MAX_ATTEMPTS:
+                delay = min(JOB_BACKOFF_BASE_S * 2 ** (job.attempts - 1), JOB_BACKOFF_MAX_S)
+                self.stats["retried"] += 1
+                logger.warning(
+                    f"[Jobs] {job.kind} {job.id[:8]} hit the quota — retry "
+                    f"{job.attempts + 1}/{JOB_MAX_ATTEMPTS} in {delay:g}s"
+                )
+                self._finish(job.id, JobStatus.QUEUED, error=str(exc)[:500], retry_in=delay)
+                asyncio.get_running_loop().call_later(delay, self._wake[job.kind].set)
+            else:
+                self.stats["failed"] += 1
+                logger.error(f"[Jobs] {job.kind} {job.id[:8]} failed after {job.attempts} attempts: quota exhausted")
+                self._finish(job.id, JobStatus.FAILED, error=str(exc)[:500])
+        except Exception as exc:
+            self.stats["failed"] += 1
+            logger.error(f"[Jobs] {job.kind} {job.id[:8]} failed: {exc}")
+            self._finish(job.id, JobStatus.FAILED, error=str(exc)[:500])
+        else:
+            self.stats["succeeded"] += 1
+            self._finish(job.id, JobStatus.SUCCEEDED, result=result)
+        finally:
+            self._running[job.kind] -= 1
+
+    def _finish(
+        self,
+        job_id: str,
+        status: JobStatus,
+        error: Optional[str] = None,
+        result: Optional[dict] = None,
+        retry_in: float = 0.0,
+    ) -> None:
+        from db import engine  # avoid circular at module level
+
+        now = datetime.utcnow()
+        with Session(engine) as db:
+            job = db.get(JobRecord, job_id)
+            if job is None:
+                return
+            job.status = status
+            job.last_error = error
+            job.result = result
+            if status == JobStatus.QUEUED:
+                job.run_after = now + timedelta(seconds=retry_in)
+            else:
+                job.finished_at = now
+            db.add(job)
+            db.commit()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,93 @@
+from __future__ import annotations
+from typing import NamedTuple, Optional
+
+from sqlmodel import Session, select
+
+from models.agent_spec import NarrowAgentSpec, TrustLevel
+from services.ann_index import spec_ann_index
+
+
+class SpecMeta(NamedTuple):
+    id: str
+    name: str
+    permit_type: str
+    trust_level: TrustLevel
+
+
+class MarketIndex:
+    """
+    Process-wide view of the agent market used by MarketMatcher.
+
+    The normalised spec vectors are the ones already held by the specs
+    similarity partition and spec_ann_index. This class keeps only the
+    metadata a match decision needs (id, name, permit_type, trust_level), so
+    ranking and logging a query do not touch the database. The metadata is
+    loaded on first use. After that it is kept current by add_spec (publish
+    and tune) and update_trust (trust transitions). STALE specs stay indexed
+    but are never returned as matches.
+    """
+
+    def __init__(self):
+        self._meta: Optional[dict[str, SpecMeta]] = None
+        self._stale: set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._meta) - len(self._stale) if self._meta is not None else 0
+
+    def search(
+        self,
+        vector,
+        db: Session,
+        k: int,
+        threshold: Optional[float] = None,
+    ) -> list[tuple[SpecMeta, float]]:
+        """Best k non-stale specs for vector, best first."""
+        meta = self._entries(db)
+        ranked = spec_ann_index.search(vector, db, k=k + len(self._stale), threshold=threshold)
+        return [
+            (meta[spec_id], score)
+            for spec_id, score in ranked
+            if spec_id in meta and spec_id not in self._stale
+        ][:k]
+
+    def add_spec(self, spec: NarrowAgentSpec) -> None:
+        """Index a newly published or forked spec (vectors and metadata)."""
+        spec_ann_index.add_spec(spec)
+        if self._meta is not None and spec.embedding is not None:
+            self._put(spec)
+
+    def update_trust(self, spec: NarrowAgentSpec) -> None:
+        """Record a trust transition; a spec that went STALE stops matching."""
+        if self._meta is not None and spec.id in self._meta:
+            self._put(spec)
+
+    def invalidate(self) -> None:
+        """Drop the metadata; it reloads from the database on next use."""
+        self._meta = None
+        self._stale = set()
+
+    def _entries(self, db: Session) -> dict[str, SpecMeta]:
+        if self._meta is None:
+            self._meta = {}
+            self._stale = set()
+            rows = db.exec(
+                select(
+                    NarrowAgentSpec.id,
+                    NarrowAgentSpec.name,
+                    NarrowAgentSpec.permit_type,
+                    NarrowAgentSpec.trust_level,
+                ).where(NarrowAgentSpec.embedding != None)
+            ).all()
+            for row in rows:
+                self._put(SpecMeta(*row))
+        return self._meta
+
+    def _put(self, spec) -> None:
+        self._meta[spec.id] = SpecMeta(spec.id, spec.name, spec.permit_type, spec.trust_level)
+        if spec.trust_level == TrustLevel.STALE:
+            self._stale.add(spec.id)
+        else:
+            self._stale.discard(spec.id)
+
+
+market_index = MarketIndex()
@@ -1,19 +1,35 @@
 from __future__ import annotations
-import asyncio
 import os
 from typing import Optional
 
+import numpy as np
 from sqlmodel import Session, select
 
 from models.session import SessionRecord, PatternState
 from models.agent_spec import NarrowAgentSpec, TrustLevel
 from models.event import ActionTrace, UIEvent, SSEEventType
 from services.embedding_service import embedding_service
+from services.event_log import event_log
 from services.log_streamer import logger
+from services.detector_state import detector_state
+from services.fingerprint import trace_fingerprinter
+from services.job_queue import job_queue
+from services.prefix_matcher import prefix_matcher
+from services.sequence_scorer import sequence_scorer
+from services.similarity_index import similarity_index
+from services.similarity_view import SIMILARITY_VIEW_FLOOR, similarity_view
+from services.workflow_clusterer import workflow_clusterer
 from agents.market_matcher import market_matcher
 
 PATTERN_THRESHOLD = int(os.getenv("PATTERN_THRESHOLD", "3"))
 PATTERN_CONFIDENCE_MIN = float(os.getenv("PATTERN_CONFIDENCE_MIN", "0.85"))
+PATTERN_SCORER = os.getenv("PATTERN_SCORER", "embedding")  # embedding | alignment | blend
+PATTERN_BLEND_ALIGNMENT = float(os.getenv("PATTERN_BLEND_ALIGNMENT", "0.5"))  # alignment weight in blend
+SIMILARITY_LOG_PAIRS = 20  # per-pair log lines per detection; the rest are summarised
+
+_SCORE_NAMES = {"embedding": "cosine", "alignment": "alignment", "blend": "blended"}
+if PATTERN_SCORER not in _SCORE_NAMES:
+    raise ValueError(f"Unknown PATTERN_SCORER: {PATTERN_SCORER}")
 
 
 class PatternDetector:
@@ -28,71 +44,86 @@ class PatternDetector:
         db: Session,
     ) -> Optional[str]:
         """
-        Called when a session is marked complete. Embeds the trace, compares
-        against prior completed sessions for the same permit_type, and advances
-        state. Returns SSEEventType string if an event should be broadcast.
+        Called when a session is marked complete. Fingerprints the trace,
+        embeds it (or reuses the embedding of a structurally identical trace),
+        compares against prior completed sessions for the same permit_type, and
+        advances state. Returns SSEEventType string if an event should be broadcast.
         """
-        trace = ActionTrace(
-            session_id=session.session_id,
-            user_id=session.user_id,
-            permit_type=session.permit_type,
-            events=[UIEvent(**e) for e in session.events],
-            completed_at=session.completed_at,
-        )
-
-        trace_text = embedding_service.serialize_trace(trace)
-        vector = await embedding_service.embed(
-            trace_text, cache_key=f"session:{session.session_id}"
+        events = event_log.load_events(session.session_id, db)
+        fingerprint = trace_fingerprinter.fingerprint(session.permit_type, events)
+        twin = trace_fingerprinter.identical_embedding(
+            fingerprint.digest, db, exclude=session.session_id
         )
+        if twin is not None:
+            vector = twin[1]
+            logger.info(
+                f"[Fingerprint] Structurally identical to {twin[0]} — reusing its embedding"
+            )
+        else:
+            trace = ActionTrace(
+                session_id=session.session_id,
+                user_id=session.user_id,
+                permit_type=session.permit_type,
+                events=[UIEvent(**e) for e in events],
+                completed_at=session.completed_at,
+            )
+            vector = await embedding_service.embed(
+                embedding_service.serialize_trace(trace),
+                cache_key=f"session:{session.session_id}",
+            )
         session.embedding = vector
         session.state = PatternState.FINGERPRINTING
         db.add(session)
+        trace_fingerprinter.store(session.session_id, session.permit_type, fingerprint, db)
         db.commit()
+        similarity_index.add_session(session)
+        similarity_view.record(session.permit_type, [session.session_id], db)
 
-        # Compare against prior completed sessions (same permit_type, not seeded context)
-        prior_sessions = db.exec(
-            select(SessionRecord).where(
-                SessionRecord.permit_type == session.permit_type,
-                SessionRecord.session_id != session.session_id,
-                SessionRecord.completed_at != None,
-            )
-        ).all()
+        # Compare against the recent window plus older LSH bucket collisions (same permit_type)
+        threshold = PATTERN_CONFIDENCE_MIN
+        lsh = trace_fingerprinter.candidates(session.session_id, session.permit_type, fingerprint, db)
+        prior_count, scored, matches = detector_state.observe(
+            session, vector, db, threshold, candidates=[sid for sid, _ in lsh]
+        )
+
+        if PATTERN_SCORER != "embedding" and scored:
+            scored, matches = self._rescore(session.session_id, scored, threshold, db, events)
 
         logger.info(
-            f"[Similarity] Comparing against {len(prior_sessions)} prior sessions "
-            f"(permit_type={session.permit_type})"
+            f"[Similarity] Comparing against {len(scored)} of {prior_count} prior sessions "
+            f"(recent window + {len(lsh)} LSH candidates, permit_type={session.permit_type}, "
+            f"scorer={PATTERN_SCORER})"
         )
 
         session.state = PatternState.COMPARING
         db.add(session)
         db.commit()
 
-        matches = 0
-        for prior in prior_sessions:
-            if not prior.embedding:
-                continue
-            score = embedding_service.cosine_similarity(vector, prior.embedding)
-            threshold = PATTERN_CONFIDENCE_MIN
+        for prior_id, score in scored[:SIMILARITY_LOG_PAIRS]:
             flag = "✓" if score >= threshold else "✗"
             logger.info(
-                f"[Similarity] vs {prior.session_id}: cosine={score} {flag} "
+                f"[Similarity] vs {prior_id}: {_SCORE_NAMES[PATTERN_SCORER]}={score} {flag} "
                 f"(threshold: {threshold})"
             )
-            if score >= threshold:
-                matches += 1
+        if len(scored) > SIMILARITY_LOG_PAIRS:
+            logger.info(
+                f"[Similarity] ... {len(scored) - SIMILARITY_LOG_PAIRS} lower-scoring "
+                f"sessions not shown"
+            )
 
-        total_sessions = len(prior_sessions) + 1  # include current
+        total_sessions = prior_count + 1  # include current
         logger.info(
-            f"[Detector]  Pattern matches: {matches}/{len(prior_sessions)} "
-            f"sessions exceed similarity threshold"
+            f"[Detector]  Pattern matches: {matches}/{len(scored)} "
+            f"compared sessions exceed similarity threshold"
         )
 
-        if total_sessions >= PATTERN_THRESHOLD and matches >= PATTERN_THRESHOLD - 1:
+        if _is_ready(total_sessions, matches):
             session.state = PatternState.READY
             db.add(session)
             db.commit()
+            prefix_matcher.add_session(session.session_id, session.permit_type, db)
             logger.info(
-                f"[Detector]  Pattern READY — {matches}/{len(prior_sessions)} sessions "
+                f"[Detector]  Pattern READY — {matches}/{len(scored)} compared sessions "
                 f"exceed similarity threshold"
             )
 
@@ -112,7 +143,7 @@ class PatternDetector:
                 if existing:
                     score = (
                         embedding_service.cosine_similarity(vector, existing.embedding)
-                        if existing.embedding
+                        if existing.embedding is not None
                         else 0.0
                     )
                     match_result = (existing, score)
@@ -133,8 +164,10 @@ class PatternDetector:
                 return SSEEventType.AGENT_MATCH_FOUND
 
             logger.info(f"[SSE]       → OPTIMIZATION_OPPORTUNITY sent to frontend")
-            # Kick off spec pre-generation so the panel has a draft ready immediately
-            asyncio.create_task(_pre_generate_spec(session.session_id))
+            # Queue spec pre-generation so the panel has a draft ready immediately
+            job_queue.enqueue(
+                "spec_pregen", {"session_id": session.session_id}, db, dedup_key=session.session_id
+            )
             return SSEEventType.OPTIMIZATION_OPPORTUNITY
         else:
             session.state = PatternState.CANDIDATE
@@ -147,15 +180,134 @@ class PatternDetector:
             return SSEEventType.PATTERN_CANDIDATE
 
 
+    def detect_for_permit_type(self, permit_type: str, db: Session) -> dict:
+        """
+        Batch counterpart of process_session_complete, run once per permit type
+        after a bulk import. Reads each completed, embedded session's match
+        count from the session_similarity view (the alignment and blend
+        scorers still score one pairwise matrix) and moves each
+        still-undecided session to READY or CANDIDATE with the same rule as the
+        live path. Does not notify clerks or pre-generate specs.
+        """
+        sessions = db.exec(
+            select(SessionRecord).where(
+                SessionRecord.permit_type == permit_type,
+                SessionRecord.completed_at != None,
+            )
+        ).all()
+        embedded = [s for s in sessions if s.embedding is not None]
+        if not embedded:
+            return {"permit_type": permit_type, "sessions": 0, "ready": 0}
+
+        ids = [s.session_id for s in embedded]
+        if PATTERN_SCORER == "embedding" and SIMILARITY_VIEW_FLOOR <= PATTERN_CONFIDENCE_MIN:
+            counts = similarity_view.match_counts(permit_type, PATTERN_CONFIDENCE_MIN, db)
+            match_counts = [counts.get(sid, 0) for sid in ids]
+        else:
+            match_counts = self._match_counts(ids, similarity_index.sessions(permit_type, db).pairwise(ids), db)
+        ready = self._apply_batch(embedded, len(sessions), match_counts, db)
+        detector_state.rebuild(permit_type, db, PATTERN_CONFIDENCE_MIN)
+
+        logger.info(
+            f"[Detector]  Batch detection (permit_type={permit_type}): "
+            f"{ready}/{len(embedded)} sessions READY"
+        )
+        return {"permit_type": permit_type, "sessions": len(embedded), "ready": ready}
+
+    def detect_for_cluster(self, cluster_id: int, db: Session) -> dict:
+        """
+        detect_for_permit_type over the members of a workflow cluster, which
+        may span several permit types. Members are compared with each other
+        regardless of their permit_type label, with the same READY rule.
+        """
+        members = [record for record, _ in workflow_clusterer.members(cluster_id, db)]
+        embedded = [s for s in members if s.embedding is not None]
+        if not embedded:
+            return {"cluster_id": cluster_id, "sessions": 0, "ready": 0}
+
+        matrix = np.stack([s.embedding for s in embedded]).astype(np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        match_counts = self._match_counts([s.session_id for s in embedded], matrix @ matrix.T, db)
+        ready = self._apply_batch(embedded, len(members), match_counts, db)
+        for permit_type in {s.permit_type for s in embedded}:
+            detector_state.rebuild(permit_type, db, PATTERN_CONFIDENCE_MIN)
+
+        logger.info(
+            f"[Detector]  Batch detection (cluster={cluster_id}): "
+            f"{ready}/{len(embedded)} sessions READY"
+        )
+        return {"cluster_id": cluster_id, "sessions": len(embedded), "ready": ready}
+
+    def _rescore(
+        self,
+        session_id: str,
+        scored: list[tuple[str, float]],
+        threshold: float,
+        db: Session,
+        events: list[dict],
+    ) -> tuple[list[tuple[str, float]], int]:
+        """Replace window cosines with the configured scorer; returns (scored, matches)."""
+        ids = [sid for sid, _ in scored]
+        cosine = np.array([score for _, score in scored], dtype=np.float32)
+        combined = _combine(cosine, sequence_scorer.score(session_id, ids, db, events=events))
+        rescored = sorted(
+            ((sid, round(float(score), 4)) for sid, score in zip(ids, combined)),
+            key=lambda pair: -pair[1],
+        )
+        return rescored, int((combined >= threshold).sum())
+
+    def _match_counts(self, session_ids: list[str], sims: np.ndarray, db: Session) -> list[int]:
+        """Per-session count of others at or above the threshold, from pairwise cosines."""
+        if PATTERN_SCORER != "embedding":
+            sims = _combine(sims, sequence_scorer.pairwise(session_ids, db))
+        np.fill_diagonal(sims, -1.0)
+        return (sims >= PATTERN_CONFIDENCE_MIN).sum(axis=1).tolist()
+
+    def _apply_batch(
+        self,
+        embedded: list[SessionRecord],
+        total_sessions: int,
+        match_counts: list[int],
+        db: Session,
+    ) -> int:
+        """Move undecided sessions to READY or CANDIDATE from their match counts."""
+        ready = 0
+        for record, matches in zip(embedded, match_counts):
+            if record.state not in (PatternState.COLLECTING, PatternState.FINGERPRINTING,
+                                    PatternState.COMPARING, PatternState.CANDIDATE):
+                continue  # already READY or further along
+            if _is_ready(total_sessions, matches):
+                record.state = PatternState.READY
+                prefix_matcher.add_session(record.session_id, record.permit_type, db)
+                ready += 1
+            else:
+                record.state = PatternState.CANDIDATE
+            db.add(record)
+        db.commit()
+        return ready
+
+
+def _combine(cosine: np.ndarray, alignment: np.ndarray) -> np.ndarray:
+    if PATTERN_SCORER == "alignment":
+        return alignment
+    return (1.0 - PATTERN_BLEND_ALIGNMENT) * cosine + PATTERN_BLEND_ALIGNMENT * alignment
+
+
+def _is_ready(total_sessions: int, matches: int) -> bool:
+    return total_sessions >= PATTERN_THRESHOLD and matches >= PATTERN_THRESHOLD - 1
+
+
 pattern_detector = PatternDetector()
 
 
-async def _pre_generate_spec(session_id: str) -> None:
+async def _pre_generate_spec(payload: dict) -> Optional[dict]:
     """
-    Background task: build a NarrowAgentSpec draft from the completed session and
+    "spec_pregen" job: build a NarrowAgentSpec draft from the completed session and
     store it on SessionRecord.candidate_spec_draft. Fires SPEC_GENERATED SSE when done.
     Uses its own DB session — safe to run after the originating request has completed.
+    Errors propagate so the job queue can retry on quota and record failures.
     """
+    session_id = payload["session_id"]
     from db import engine  # avoid circular at module level
     from agents.spec_builder_agent import spec_builder_agent
     from services.sse_bus import sse_bus
@@ -166,7 +318,7 @@ async def _pre_generate_spec(session_id: str) -> None:
             session = db.get(SessionRecord, session_id)
             if not session:
                 logger.warning(f"[SpecBuilder] Session {session_id} not found for pre-generation")
-                return
+                return None
 
             spec = await spec_builder_agent.build_spec(session)
 
@@ -179,5 +331,10 @@ async def _pre_generate_spec(session_id: str) -> None:
             SSEEventType.SPEC_GENERATED,
             {"session_id": session_id, "spec": spec.model_dump(mode="json")},
         )
+        return {"spec_name": spec.name}
     except Exception as exc:
         logger.error(f"[SpecBuilder] Pre-generation failed for {session_id}: {exc}")
+        raise
+
+
+job_queue.register("spec_pregen", _pre_generate_spec, concurrency=2)
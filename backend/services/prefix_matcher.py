@@ -0,0 +1,201 @@
+from __future__ import annotations
+import os
+import time
+from collections import deque
+from typing import Iterable, NamedTuple, Optional
+
+from sqlmodel import Session, select
+
+from models.agent_spec import NarrowAgentSpec, TrustLevel
+from models.event import SSEEventType
+from models.session import SessionRecord, PatternState
+from services.event_log import event_log
+from services.fingerprint import STRUCTURAL_EVENTS, step_token, structural_steps
+from services.log_streamer import logger
+
+PREFIX_MATCH_ENABLED = os.getenv("PREFIX_MATCH_ENABLED", "true").lower() == "true"
+PREFIX_MATCH_THRESHOLD = float(os.getenv("PREFIX_MATCH_THRESHOLD", "0.8"))  # share of live n-grams in the pattern
+PREFIX_MATCH_MIN_COVERAGE = float(os.getenv("PREFIX_MATCH_MIN_COVERAGE", "0.5"))  # share of the pattern seen
+PREFIX_MATCH_NGRAM = int(os.getenv("PREFIX_MATCH_NGRAM", "3"))
+PREFIX_MATCH_MAX_PATTERNS = int(os.getenv("PREFIX_MATCH_MAX_PATTERNS", "5000"))
+PREFIX_MATCH_MIN_NGRAMS = 3  # never emit on fewer matched steps than this
+
+_START = -1  # token id padding the start of every trace
+# Session states that mean the detector found a repeated workflow
+_READY_STATES = (PatternState.READY, PatternState.REPLAYING, PatternState.BUILDING, PatternState.PUBLISHED)
+
+
+class PrefixPattern(NamedTuple):
+    kind: str  # "spec" | "session"
+    ref_id: str  # spec id or READY session id
+    permit_type: str
+    size: int  # distinct n-grams in the reference trace
+
+
+class PrefixMatch(NamedTuple):
+    sse_type: str
+    pattern: PrefixPattern
+    confidence: float  # share of the live session's n-grams that occur in the pattern
+    coverage: float  # share of the pattern's n-grams the live session has produced
+
+
+class PrefixState:
+    """Per-live-session matcher state; lives on the observer's SessionWorkingSet."""
+
+    __slots__ = ("recent", "last", "seen", "hits", "emitted")
+
+    def __init__(self, n: int):
+        self.recent: deque[int] = deque([_START] * (n - 1), maxlen=n)
+        self.last: Optional[int] = None
+        self.seen: set[tuple[int, ...]] = set()
+        self.hits: dict[int, int] = {}
+        self.emitted: set[str] = set()
+
+
+class PrefixMatcher:
+    """
+    Streaming matcher that spots a known workflow before the clerk submits.
+
+    Reference traces are the event sequences of READY sessions and of the
+    sessions that published specs were built from. Each event becomes a
+    structural token, "event_type:screen:selector", with ids normalised and
+    consecutive repeats collapsed. The token-id n-grams of every reference
+    go into one table: n-gram → pattern indexes.
+
+    For a live session, observe() forms the newest n-gram, looks it up and
+    bumps the hit counters of the patterns that contain it. That is one
+    dict lookup plus a few increments per event, with no I/O and no model
+    call. A pattern matches when enough of the session's n-grams occur in
+    it (PREFIX_MATCH_THRESHOLD) and the session has covered enough of the
+    pattern (PREFIX_MATCH_MIN_COVERAGE). Spec patterns raise an early
+    AGENT_MATCH_FOUND. READY-session patterns raise OPTIMIZATION_OPPORTUNITY.
+    Each fires at most once per session, and a spec match suppresses a
+    later opportunity.
+    """
+
+    def __init__(self, n: int = PREFIX_MATCH_NGRAM, max_patterns: int = PREFIX_MATCH_MAX_PATTERNS):
+        self.n = max(1, n)
+        self.max_patterns = max_patterns
+        self.patterns: list[PrefixPattern] = []
+        self._table: dict[tuple[int, ...], list[int]] = {}
+        self._vocab: dict[str, int] = {}
+        self._signatures: dict[tuple[str, tuple[int, ...]], int] = {}
+        self.stats = {"events": 0, "matches": 0, "observe_ns": 0}
+
+    def start(self, db: Session) -> None:
+        """Index READY sessions and published specs that are already in the database."""
+        t0 = time.time()
+        specs = db.exec(
+            select(NarrowAgentSpec).where(
+                NarrowAgentSpec.source_session_id != None,
+                NarrowAgentSpec.trust_level != TrustLevel.STALE,
+            )
+        ).all()
+        for spec in specs:
+            self.add_spec(spec, db)
+        ready = db.exec(
+            select(SessionRecord.session_id, SessionRecord.permit_type)
+            .where(SessionRecord.state.in_(_READY_STATES))
+            .order_by(SessionRecord.completed_at.desc())
+            .limit(self.max_patterns)
+        ).all()
+        for session_id, permit_type in ready:
+            self.add_session(session_id, permit_type, db)
+        logger.info(
+            f"[PrefixMatcher] Ready | {len(self.patterns)} patterns, {len(self._table)} "
+            f"{self.n}-grams | {int((time.time() - t0) * 1000)}ms"
+        )
+
+    def add_session(self, session_id: str, permit_type: str, db: Session) -> None:
+        """Index a session the detector marked READY."""
+        self._add("session", session_id, permit_type, event_log.iter_events(session_id, db))
+
+    def add_spec(self, spec: NarrowAgentSpec, db: Session) -> None:
+        """Index a published spec by the trace of the session it was built from."""
+        if spec.source_session_id:
+            self._add("spec", spec.id, spec.permit_type, event_log.iter_events(spec.source_session_id, db))
+
+    def new_state(self) -> PrefixState:
+        return PrefixState(self.n)
+
+    def observe(
+        self,
+        state: PrefixState,
+        event_type: str,
+        screen_name: str,
+        element_selector: str,
+    ) -> Optional[PrefixMatch]:
+        """Advance a live session by one event; returns a match the first time one qualifies."""
+        if not PREFIX_MATCH_ENABLED or event_type not in STRUCTURAL_EVENTS or not self._table:
+            return None
+        t0 = time.perf_counter_ns()
+        self.stats["events"] += 1
+        token = self._vocab.get(step_token(event_type, screen_name, element_selector))
+        if token is None:
+            token = -2  # unseen step: breaks n-grams, matches nothing
+        if token == state.last:
+            return None
+        state.last = token
+        state.recent.append(token)
+        gram = tuple(state.recent)
+        if gram in state.seen:
+            return None
+        state.seen.add(gram)
+
+        best: Optional[PrefixMatch] = None
+        observed = len(state.seen)
+        for idx in self._table.get(gram, ()):
+            hits = state.hits.get(idx, 0) + 1
+            state.hits[idx] = hits
+            pattern = self.patterns[idx]
+            sse_type = (
+                SSEEventType.AGENT_MATCH_FOUND if pattern.kind == "spec"
+                else SSEEventType.OPTIMIZATION_OPPORTUNITY
+            )
+            if sse_type in state.emitted or SSEEventType.AGENT_MATCH_FOUND in state.emitted:
+                continue
+            confidence = hits / observed
+            coverage = hits / pattern.size
+            if (
+                hits >= min(PREFIX_MATCH_MIN_NGRAMS, pattern.size)
+                and confidence >= PREFIX_MATCH_THRESHOLD
+                and coverage >= PREFIX_MATCH_MIN_COVERAGE
+                # "spec" sorts after "session", so a spec match wins over a READY session
+                and (best is None or (pattern.kind, confidence) > (best.pattern.kind, best.confidence))
+            ):
+                best = PrefixMatch(sse_type, pattern, round(confidence, 3), round(coverage, 3))
+        if best is not None:
+            state.emitted.add(best.sse_type)
+            self.stats["matches"] += 1
+        self.stats["observe_ns"] += time.perf_counter_ns() - t0
+        return best
+
+    def snapshot(self) -> dict:
+        events = self.stats["events"]
+        return {
+            "patterns": len(self.patterns),
+            "ngrams": len(self._table),
+            "events": events,
+            "matches": self.stats["matches"],
+            "avg_observe_us": round(self.stats["observe_ns"] / events / 1000, 2) if events else 0.0,
+        }
+
+    def _add(self, kind: str, ref_id: str, permit_type: str, events: Iterable[dict]) -> None:
+        if len(self.patterns) >= self.max_patterns:
+            return
+        tokens = [self._vocab.setdefault(step, len(self._vocab)) for step in structural_steps(events)]
+        if not tokens:
+            return
+        signature = (kind, tuple(tokens))
+        if signature in self._signatures:
+            return  # same structure as an indexed pattern; the first one stands for both
+        padded = [_START] * (self.n - 1) + tokens
+        grams = {tuple(padded[i:i + self.n]) for i in range(len(tokens))}
+        idx = len(self.patterns)
+        self.patterns.append(PrefixPattern(kind, ref_id, permit_type, len(grams)))
+        self._signatures[signature] = idx
+        for gram in grams:
+            self._table.setdefault(gram, []).append(idx)
+
+
+prefix_matcher = PrefixMatcher()
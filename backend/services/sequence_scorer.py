@@ -0,0 +1,144 @@
+from __future__ import annotations
+import os
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import numpy as np
+from sqlmodel import Session
+
+from services.event_log import event_log
+from services.fingerprint import structural_steps
+
+ALIGNMENT_MAX_STEPS = int(os.getenv("ALIGNMENT_MAX_STEPS", "200"))  # longer traces are truncated
+ALIGNMENT_CACHE_MAX = int(os.getenv("ALIGNMENT_CACHE_MAX", "20000"))  # encoded sessions kept in memory
+ALIGNMENT_CHUNK = 1024  # candidates per DP block, grouped by length so padding stays small
+
+
+class SequenceScorer:
+    """
+    Normalised edit-distance similarity between the structural step
+    sequences of two sessions. It is a local alternative to embedding cosine.
+
+    Each trace is reduced to the same normalised
+    (event_type, screen_name, element_selector) steps the fingerprinter uses,
+    so free-text element_values play no part. The steps are integer-encoded
+    once against a shared vocabulary, and the encoded sequence is cached by
+    session id. one_vs_many() runs the Levenshtein dynamic program for one
+    query against a block of candidates at once. Candidates are padded into
+    an int32 matrix, and each query step updates the whole block with a
+    handful of NumPy ops. Within a DP row, the insertion chain
+    new[j] = min(base[j], new[j-1] + 1) is solved with a running minimum:
+    new = cummin(base - j) + j. So a block costs O(len(query)) vectorised
+    steps over (candidates × max candidate length) cells, with no Python
+    loop over candidates or columns.
+
+    Similarity is 1 - distance / max(len(a), len(b)), which is 1.0 for
+    identical traces and 0.0 for traces with nothing in common.
+    """
+
+    def __init__(self, max_steps: int = ALIGNMENT_MAX_STEPS, cache_max: int = ALIGNMENT_CACHE_MAX):
+        self.max_steps = max_steps
+        self.cache_max = cache_max
+        self._vocab: dict[str, int] = {}
+        self._cache: OrderedDict[str, np.ndarray] = OrderedDict()
+
+    def encode(self, events: Iterable[dict]) -> np.ndarray:
+        steps = structural_steps(events)[: self.max_steps]
+        return np.fromiter(
+            (self._vocab.setdefault(step, len(self._vocab)) for step in steps),
+            dtype=np.int32,
+            count=len(steps),
+        )
+
+    def sequences(self, session_ids: list[str], db: Session) -> list[np.ndarray]:
+        """Encoded sequences in session_ids order; uncached sessions are read in one query."""
+        missing = [sid for sid in session_ids if sid not in self._cache]
+        if missing:
+            for sid, events in event_log.load_events_for(missing, db).items():
+                self._put(sid, self.encode(events))
+        out = []
+        for sid in session_ids:
+            seq = self._cache.get(sid)
+            if seq is None:  # evicted while loading a very large batch
+                seq = self.encode(event_log.iter_events(sid, db))
+            else:
+                self._cache.move_to_end(sid)
+            out.append(seq)
+        return out
+
+    def score(
+        self,
+        session_id: str,
+        others: list[str],
+        db: Session,
+        events: Optional[list[dict]] = None,
+    ) -> np.ndarray:
+        """Similarity of one session to each of others; pass events if already loaded."""
+        if events is not None:
+            self._put(session_id, self.encode(events))
+        query = self.sequences([session_id], db)[0]
+        return self.one_vs_many(query, self.sequences(others, db))
+
+    def pairwise(self, session_ids: list[str], db: Session) -> np.ndarray:
+        """Symmetric (n, n) similarity matrix with 1.0 on the diagonal."""
+        seqs = self.sequences(session_ids, db)
+        n = len(seqs)
+        out = np.eye(n, dtype=np.float32)
+        for i in range(n - 1):
+            row = self.one_vs_many(seqs[i], seqs[i + 1:])
+            out[i, i + 1:] = row
+            out[i + 1:, i] = row
+        return out
+
+    def one_vs_many(self, query: np.ndarray, candidates: list[np.ndarray]) -> np.ndarray:
+        lengths = np.fromiter((len(c) for c in candidates), dtype=np.int32, count=len(candidates))
+        out = np.empty(len(candidates), dtype=np.float32)
+        order = np.argsort(lengths, kind="stable")
+        for start in range(0, len(order), ALIGNMENT_CHUNK):
+            block = order[start:start + ALIGNMENT_CHUNK]
+            block_lengths = lengths[block]
+            padded = np.full((len(block), int(block_lengths.max(initial=0))), -1, dtype=np.int32)
+            for row, idx in enumerate(block.tolist()):
+                padded[row, :block_lengths[row]] = candidates[idx]
+            distance = _edit_distance(query, padded, block_lengths)
+            longest = np.maximum(np.maximum(block_lengths, len(query)), 1)
+            out[block] = 1.0 - distance / longest
+        return out
+
+    def _put(self, session_id: str, seq: np.ndarray) -> None:
+        self._cache[session_id] = seq
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_max:
+            self._cache.popitem(last=False)
+
+
+def _edit_distance(query: np.ndarray, padded: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Levenshtein distance from query to each row of padded, read off at that
+    row's length. Padding (-1) never matches a token. Cells past a row's
+    length only depend on cells to their left and above, so they never
+    affect the answer. The DP table is laid out (column, candidate), so the
+    running minimum runs over contiguous rows. It is int16 when distances
+    fit, to halve memory traffic.
+    """
+    m, width = padded.shape
+    dtype = np.int16 if max(width, len(query)) < np.iinfo(np.int16).max else np.int32
+    cand = np.ascontiguousarray(padded.T)
+    cols = np.arange(width + 1, dtype=dtype)[:, None]
+    prev = np.repeat(cols, m, axis=1)
+    base = np.empty_like(prev)
+    step = np.empty((width, m), dtype=dtype)
+    mismatch = np.empty((width, m), dtype=bool)
+    for i, token in enumerate(query.tolist(), 1):
+        base[0] = i
+        np.not_equal(cand, token, out=mismatch)
+        np.add(prev[:-1], mismatch, out=base[1:])  # substitute / match
+        np.add(prev[1:], 1, out=step)  # delete
+        np.minimum(base[1:], step, out=base[1:])
+        base -= cols  # insert: new[j] = cummin(base[k] - k) + j
+        np.minimum.accumulate(base, axis=0, out=prev)
+        prev += cols
+    return prev[lengths, np.arange(m)]
+
+
+sequence_scorer = SequenceScorer()
@@ -0,0 +1,592 @@
+from __future__ import annotations
+import os
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+from sqlmodel import Session, select
+
+from models.agent_spec import NarrowAgentSpec
+from models.session import SessionRecord
+from services.log_streamer import logger
+
+SPECS_PARTITION = "specs"
+SIMILARITY_QUANTIZATION = os.getenv("SIMILARITY_QUANTIZATION", "none")  # none | int8
+SIMILARITY_RESCORE_OVERSAMPLE = int(os.getenv("SIMILARITY_RESCORE_OVERSAMPLE", "4"))
+ORIGINALS_CACHE_MAX = int(os.getenv("SIMILARITY_ORIGINALS_CACHE", "4096"))
+SCORE_CHUNK = 2048  # int8 rows dequantised per matmul block; stays cache-sized
+LOAD_CHUNK = 50_000  # rows stacked at a time when a partition loads
+# Matryoshka coarse pass: 0 disables, else the leading dims kept per partition kind
+SIMILARITY_PREFIX_DIMS_SESSIONS = int(os.getenv("SIMILARITY_PREFIX_DIMS_SESSIONS", "0"))
+SIMILARITY_PREFIX_DIMS_SPECS = int(os.getenv("SIMILARITY_PREFIX_DIMS_SPECS", "0"))
+SIMILARITY_PREFIX_MARGIN = float(os.getenv("SIMILARITY_PREFIX_MARGIN", "0.1"))
+PREFIX_MIN_CANDIDATES = 256  # full-dimension rows verified per query at least
+
+# ids -> {id: float32 vector}; used by int8 partitions to fetch originals
+OriginalsLoader = Callable[[list[str]], dict[str, np.ndarray]]
+
+
+class SimilarityPartition:
+    """
+    Pre-normalised matrix of one comparable set of vectors.
+
+    Rows are L2-normalised on insert, so a cosine query is one matrix-vector
+    product. Storage grows by doubling; remove() moves the last row into the
+    freed slot, so row order is not stable but adds and removes are O(dims).
+
+    With quantization="int8" each row is stored as int8 codes plus one
+    float32 scale (about a quarter of float32). Scores from the codes are
+    approximate and only pick candidates. Every score returned by query() or
+    pairwise() is recomputed from the float32 originals, which `loader`
+    fetches on demand and an LRU keeps. Each int8 score has a known error
+    bound, scale/2 * ||q||_1, so threshold queries rescore every row whose
+    bound reaches the threshold and never miss a match.
+
+    With prefix_dims set, the partition also keeps the re-normalised leading
+    prefix_dims of every row (the Matryoshka truncation of the embedding) as
+    a small float32 matrix. query() scores that first. Only the top
+    max(PREFIX_MIN_CANDIDATES, k * SIMILARITY_RESCORE_OVERSAMPLE) rows, plus
+    rows whose prefix score is within prefix_margin of the threshold, are
+    scored at full dimension.
+    Unlike the int8 bound this filter is heuristic: a row whose prefix
+    cosine falls more than the margin below its full cosine is missed.
+    """
+
+    def __init__(
+        self,
+        dims: Optional[int] = None,
+        quantization: str = "none",
+        loader: Optional[OriginalsLoader] = None,
+        prefix_dims: int = 0,
+        prefix_margin: float = SIMILARITY_PREFIX_MARGIN,
+    ):
+        if quantization not in ("none", "int8"):
+            raise ValueError(f"Unknown quantization: {quantization}")
+        if quantization == "int8" and loader is None:
+            raise ValueError("int8 partitions need a loader for float32 originals")
+        self.dims = dims
+        self.quantization = quantization
+        self._loader = loader
+        self.prefix_dims = prefix_dims
+        self.prefix_margin = prefix_margin
+        self.ids: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._matrix = self._empty(0)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._prefix = np.empty((0, prefix_dims), dtype=np.float32)
+        self._originals: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.version = 0  # bumped on every add/remove; lets callers cache derived data
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._rows
+
+    @property
+    def quantized(self) -> bool:
+        return self.quantization == "int8"
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Stored rows: float32, or int8 codes for quantised partitions."""
+        return self._matrix[:len(self.ids)]
+
+    @property
+    def nbytes(self) -> int:
+        n = len(self.ids)
+        return (
+            self.matrix.nbytes
+            + (self._scales[:n].nbytes if self.quantized else 0)
+            + self._prefix[:n].nbytes
+        )
+
+    def reserve(self, capacity: int) -> None:
+        if capacity <= self._matrix.shape[0]:
+            return
+        n = len(self.ids)
+        grown = self._empty(capacity)
+        grown[:n] = self.matrix
+        self._matrix = grown
+        if self.quantized:
+            scales = np.empty(capacity, dtype=np.float32)
+            scales[:n] = self._scales[:n]
+            self._scales = scales
+        if self.prefix_dims:
+            prefix = np.empty((capacity, self.prefix_dims), dtype=np.float32)
+            prefix[:n] = self._prefix[:n]
+            self._prefix = prefix
+
+    def add(self, item_id: str, vector) -> None:
+        self.add_many([item_id], [vector])
+
+    def add_many(self, item_ids: list[str], vectors) -> None:
+        """Insert or replace rows. vectors is any (n, dims) array-like."""
+        if not item_ids:
+            return
+        self.version += 1
+        block = np.asarray(vectors, dtype=np.float32).reshape(len(item_ids), -1)
+        if self.dims is None:
+            self.dims = block.shape[1]
+            self._matrix = self._empty(0)
+        elif block.shape[1] != self.dims:
+            raise ValueError(f"Vector has {block.shape[1]} dims, partition has {self.dims}")
+        if self.prefix_dims >= self.dims:
+            self.prefix_dims = 0  # nothing to truncate
+
+        needed = len(self.ids) + len({i for i in item_ids if i not in self._rows})
+        if needed > self._matrix.shape[0]:
+            self.reserve(max(needed, 2 * self._matrix.shape[0], 16))
+
+        rows = np.empty(len(item_ids), dtype=np.int64)
+        for n, item_id in enumerate(item_ids):
+            row = self._rows.get(item_id)
+            if row is None:
+                row = len(self.ids)
+                self._rows[item_id] = row
+                self.ids.append(item_id)
+            else:
+                self._originals.pop(item_id, None)
+            rows[n] = row
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        block = block / np.where(norms == 0, 1.0, norms)
+        if self.quantized:
+            scales = np.abs(block).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            self._matrix[rows] = np.rint(block / scales[:, None]).astype(np.int8)
+            self._scales[rows] = scales
+        else:
+            self._matrix[rows] = block
+        if self.prefix_dims:
+            self._prefix[rows] = _normalise_rows(block[:, :self.prefix_dims])
+
+    def remove(self, item_id: str) -> None:
+        row = self._rows.pop(item_id, None)
+        if row is None:
+            return
+        self.version += 1
+        self._originals.pop(item_id, None)
+        last = len(self.ids) - 1
+        if row != last:
+            moved = self.ids[last]
+            self._matrix[row] = self._matrix[last]
+            if self.quantized:
+                self._scales[row] = self._scales[last]
+            if self.prefix_dims:
+                self._prefix[row] = self._prefix[last]
+            self.ids[row] = moved
+            self._rows[moved] = row
+        self.ids.pop()
+
+    def state(self) -> dict[str, np.ndarray]:
+        """Stored rows as arrays, for persisting alongside other indexes."""
+        n = len(self.ids)
+        out = {"ids": np.array(self.ids), "matrix": self.matrix}
+        if self.quantized:
+            out["scales"] = self._scales[:n]
+        return out
+
+    @classmethod
+    def from_state(
+        cls,
+        state,
+        quantization: str = "none",
+        loader: Optional[OriginalsLoader] = None,
+        prefix_dims: int = 0,
+    ) -> "SimilarityPartition":
+        """Rebuild from state(); rows are converted if the quantization changed."""
+        ids = state["ids"].tolist()
+        matrix = state["matrix"]
+        stored = "int8" if matrix.dtype == np.int8 else "none"
+        if stored == "int8":
+            matrix = matrix.astype(np.float32) * state["scales"][:, None]
+        partition = cls(
+            dims=matrix.shape[1], quantization=quantization, loader=loader, prefix_dims=prefix_dims
+        )
+        partition.reserve(len(ids))
+        if stored == quantization == "int8":
+            partition.ids = list(ids)
+            partition._rows = {item_id: row for row, item_id in enumerate(ids)}
+            partition._matrix[:len(ids)] = state["matrix"]
+            partition._scales[:len(ids)] = state["scales"]
+            if partition.prefix_dims:
+                partition._prefix[:len(ids)] = _normalise_rows(matrix[:, :partition.prefix_dims])
+        else:
+            partition.add_many(ids, matrix)
+        return partition
+
+    def rows_for(self, item_ids: Iterable[str]) -> np.ndarray:
+        """Current matrix rows of the indexed ids among item_ids."""
+        rows = self._rows
+        return np.fromiter((rows[i] for i in item_ids if i in rows), dtype=np.int64)
+
+    def vector(self, item_id: str) -> Optional[np.ndarray]:
+        """Stored unit vector for item_id (dequantised for int8 partitions)."""
+        row = self._rows.get(item_id)
+        return None if row is None else self.rows_matrix(np.array([row]))[0]
+
+    def rows_matrix(self, rows: np.ndarray) -> np.ndarray:
+        """float32 rows (dequantised for int8 partitions — approximate)."""
+        if self.quantized:
+            return self._matrix[rows].astype(np.float32) * self._scales[rows, None]
+        return self._matrix[rows]
+
+    def score_rows(self, rows: np.ndarray, q: np.ndarray) -> np.ndarray:
+        """Scores of a unit query against the given rows (approximate for int8)."""
+        if self.quantized:
+            return (self._matrix[rows].astype(np.float32) @ q) * self._scales[rows]
+        return self._matrix[rows] @ q
+
+    def scores(self, vector) -> np.ndarray:
+        """Cosine of vector against every row, in self.ids order (approximate for int8)."""
+        q = _unit(vector)
+        n = len(self.ids)
+        if not n or q is None:
+            return np.zeros(n, dtype=np.float32)
+        if not self.quantized:
+            return self.matrix @ q
+        out = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SCORE_CHUNK):
+            stop = min(n, start + SCORE_CHUNK)
+            out[start:stop] = (self._matrix[start:stop].astype(np.float32) @ q) * self._scales[start:stop]
+        return out
+
+    def exact_scores(self, item_ids: list[str], vector) -> np.ndarray:
+        """Full-precision cosine for indexed item_ids, in the given order."""
+        q = _unit(vector)
+        if q is None or not item_ids:
+            return np.zeros(len(item_ids), dtype=np.float32)
+        if not self.quantized:
+            return self._matrix[self.rows_for(item_ids)] @ q
+        return _normalise_rows(self._original_matrix(item_ids)) @ q
+
+    def scores_for(self, item_ids: list[str], vector, threshold: float) -> np.ndarray:
+        """
+        Cosine of vector against the given ids (all indexed), in order.
+
+        Which rows score >= threshold is decided as in query(). With a prefix
+        matrix, rows whose prefix cosine is below threshold - prefix_margin
+        keep that prefix cosine as their score. On int8 partitions, rows whose
+        error bound reaches the threshold are rescored from the originals;
+        the rest keep their approximate score.
+        """
+        rows = self.rows_for(item_ids)
+        out = np.zeros(len(rows), dtype=np.float32)
+        q = _unit(vector)
+        if q is None or not len(rows):
+            return out
+        todo = np.arange(len(rows))
+        if self.prefix_dims:
+            qp = q[:self.prefix_dims]
+            norm = np.linalg.norm(qp)
+            if norm:
+                out[:] = self._prefix[rows] @ (qp / norm)
+                todo = np.flatnonzero(out >= threshold - self.prefix_margin)
+        if not len(todo):
+            return out
+        full = self.score_rows(rows[todo], q)
+        out[todo] = full
+        if self.quantized:
+            bound = self._scales[rows[todo]] * 0.5 * float(np.abs(q).sum())
+            near = todo[full + bound >= threshold]
+            if len(near):
+                out[near] = self.exact_scores([self.ids[r] for r in rows[near]], vector)
+        return out
+
+    def query(
+        self,
+        vector,
+        k: Optional[int] = None,
+        exclude: Iterable[str] = (),
+        threshold: Optional[float] = None,
+    ) -> list[tuple[str, float]]:
+        """
+        (id, cosine) by descending score: the top k (every row when k is None)
+        plus, when threshold is given, every row scoring >= threshold.
+        """
+        excluded = [self._rows[i] for i in exclude if i in self._rows]
+        n = len(self.ids) - len(excluded)
+        if n <= 0:
+            return []
+        rows = None
+        if self.prefix_dims:
+            rows = self._prefix_candidates(vector, None if k is None else k + len(excluded), threshold)
+        if rows is None:
+            rows = np.arange(len(self.ids))
+            scores = self.scores(vector)
+        else:
+            q = _unit(vector)
+            scores = self.score_rows(rows, q) if q is not None else np.zeros(len(rows), np.float32)
+        if excluded:
+            keep = ~np.isin(rows, excluded)
+            rows, scores = rows[keep], scores[keep]
+        if not len(rows):
+            return []
+        k = len(rows) if k is None else min(k, len(rows))
+        if self.quantized:
+            return self._rescored_query(vector, rows, scores, k, threshold)
+
+        if k >= len(rows):
+            order = np.argsort(-scores)
+        else:
+            top = np.argpartition(-scores, k - 1)[:k]
+            if threshold is not None:
+                top = np.union1d(top, np.flatnonzero(scores >= threshold))
+            order = top[np.argsort(-scores[top])]
+        return [(self.ids[rows[i]], round(float(scores[i]), 4)) for i in order]
+
+    def pairwise(self, item_ids: list[str]) -> np.ndarray:
+        """N×N cosine matrix for item_ids; NaN wherever an id is not indexed."""
+        present, block = self.unit_rows(item_ids)
+        out = np.full((len(item_ids), len(item_ids)), np.nan, dtype=np.float32)
+        if present.any():
+            out[np.ix_(present, present)] = block @ block.T
+        return out
+
+    def top_neighbours(
+        self,
+        item_ids: list[str],
+        k: int,
+        floor: float,
+    ) -> dict[str, list[tuple[str, float]]]:
+        """
+        For each indexed id in item_ids: up to k other rows scoring >= floor,
+        best first. float32 partitions score a block of ids per matrix
+        product. int8 partitions go through query() so the kept scores are
+        rescored exactly.
+        """
+        ids = [i for i in item_ids if i in self._rows]
+        out: dict[str, list[tuple[str, float]]] = {}
+        if self.quantized:
+            for item_id in ids:
+                hits = self.query(self.vector(item_id), k=k + 1, exclude=[item_id])
+                out[item_id] = [(i, s) for i, s in hits[:k] if s >= floor]
+            return out
+        n = len(self.ids)
+        step = max(1, SCORE_CHUNK * 256 // max(n, 1))  # keeps each block ~2 MB of scores
+        for start in range(0, len(ids), step):
+            chunk = ids[start:start + step]
+            rows = self.rows_for(chunk)
+            scores = self._matrix[rows] @ self.matrix.T
+            scores[np.arange(len(rows)), rows] = -np.inf  # not its own neighbour
+            kk = min(k, n - 1)
+            if kk <= 0:
+                out.update({item_id: [] for item_id in chunk})
+                continue
+            top = np.argpartition(-scores, kk - 1, axis=1)[:, :kk]
+            for item_id, row_scores, cand in zip(chunk, scores, top):
+                cand = cand[np.argsort(-row_scores[cand])]
+                out[item_id] = [
+                    (self.ids[j], round(float(row_scores[j]), 4))
+                    for j in cand.tolist()
+                    if row_scores[j] >= floor
+                ]
+        return out
+
+    def unit_rows(self, item_ids: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (mask of indexed ids, their exact float32 unit rows in item_ids order).
+        int8 partitions read the originals, so products of these rows are
+        exact cosines.
+        """
+        present = np.array([i in self._rows for i in item_ids], dtype=bool)
+        kept = [i for i, keep in zip(item_ids, present) if keep]
+        if not kept:
+            return present, np.empty((0, self.dims or 0), dtype=np.float32)
+        if self.quantized:
+            return present, _normalise_rows(self._original_matrix(kept))
+        return present, self._matrix[self.rows_for(kept)]
+
+    def _rescored_query(self, vector, rows, approx, k, threshold):
+        """int8 path: pick candidates on the codes, score them on float32 originals."""
+        pool = min(len(rows), k * SIMILARITY_RESCORE_OVERSAMPLE)
+        picked = np.argpartition(-approx, pool - 1)[:pool]
+        if threshold is not None:
+            q = _unit(vector)
+            bound = self._scales[rows] * 0.5 * (float(np.abs(q).sum()) if q is not None else 0.0)
+            picked = np.union1d(picked, np.flatnonzero(approx + bound >= threshold))
+        candidate_ids = [self.ids[rows[i]] for i in picked]
+        exact = self.exact_scores(candidate_ids, vector)
+        order = np.argsort(-exact)
+        keep = [
+            j for rank, j in enumerate(order)
+            if rank < k or (threshold is not None and exact[j] >= threshold)
+        ]
+        return [(candidate_ids[j], round(float(exact[j]), 4)) for j in keep]
+
+    def _prefix_candidates(self, vector, k, threshold) -> Optional[np.ndarray]:
+        """Rows worth a full-dimension score, from the prefix matrix; None = all rows."""
+        n = len(self.ids)
+        if k is None and threshold is None:
+            return None
+        q = np.asarray(vector, dtype=np.float32)[:self.prefix_dims]
+        norm = np.linalg.norm(q)
+        if not norm:
+            return None
+        coarse = self._prefix[:n] @ (q / norm)
+        rows = np.empty(0, dtype=np.int64)
+        if k is not None:
+            pool = min(n, max(PREFIX_MIN_CANDIDATES, k * SIMILARITY_RESCORE_OVERSAMPLE))
+            rows = np.argpartition(-coarse, pool - 1)[:pool]
+        if threshold is not None:
+            rows = np.union1d(rows, np.flatnonzero(coarse >= threshold - self.prefix_margin))
+        return rows
+
+    def _original_matrix(self, item_ids: list[str]) -> np.ndarray:
+        missing = [i for i in item_ids if i not in self._originals]
+        if missing:
+            for item_id, vec in self._loader(missing).items():
+                self._originals[item_id] = np.asarray(vec, dtype=np.float32)
+        out = np.empty((len(item_ids), self.dims), dtype=np.float32)
+        for n, item_id in enumerate(item_ids):
+            vec = self._originals.get(item_id)
+            if vec is None:  # original gone from the store: fall back to the codes
+                row = self._rows[item_id]
+                vec = self._matrix[row].astype(np.float32) * self._scales[row]
+            else:
+                self._originals.move_to_end(item_id)
+            out[n] = vec
+        while len(self._originals) > ORIGINALS_CACHE_MAX:
+            self._originals.popitem(last=False)
+        return out
+
+    def _empty(self, capacity: int) -> np.ndarray:
+        dtype = np.int8 if self.quantized else np.float32
+        return np.empty((capacity, self.dims or 0), dtype=dtype)
+
+
+def _unit(vector) -> Optional[np.ndarray]:
+    q = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(q)
+    return q / norm if norm else None
+
+
+def _normalise_rows(block: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    return block / np.where(norms == 0, 1.0, norms)
+
+
+class SimilarityIndex:
+    """
+    Process-wide registry of SimilarityPartitions.
+
+    One partition per permit_type holds completed, embedded sessions; the
+    "specs" partition holds every NarrowAgentSpec. A partition is loaded from
+    the database on first use. After that, writers keep it current through
+    add_session / remove_session / add_spec / remove_spec. Those calls do
+    nothing for partitions that are not loaded yet, because the first load
+    reads current rows.
+    """
+
+    def __init__(self):
+        self._partitions: dict[str, SimilarityPartition] = {}
+
+    def sessions(self, permit_type: str, db: Session) -> SimilarityPartition:
+        key = f"sessions:{permit_type}"
+        partition = self._partitions.get(key)
+        if partition is None:
+            rows = db.exec(
+                select(SessionRecord.session_id, SessionRecord.embedding).where(
+                    SessionRecord.permit_type == permit_type,
+                    SessionRecord.completed_at != None,
+                    SessionRecord.embedding != None,
+                )
+            ).all()
+            partition = self._load(
+                key,
+                rows,
+                originals_loader(SessionRecord.session_id, SessionRecord.embedding),
+                SIMILARITY_PREFIX_DIMS_SESSIONS,
+            )
+        return partition
+
+    def specs(self, db: Session) -> SimilarityPartition:
+        partition = self._partitions.get(SPECS_PARTITION)
+        if partition is None:
+            rows = db.exec(
+                select(NarrowAgentSpec.id, NarrowAgentSpec.embedding).where(
+                    NarrowAgentSpec.embedding != None,
+                )
+            ).all()
+            partition = self._load(
+                SPECS_PARTITION, rows, spec_originals_loader(), SIMILARITY_PREFIX_DIMS_SPECS
+            )
+        return partition
+
+    def add_session(self, session: SessionRecord) -> None:
+        partition = self._partitions.get(f"sessions:{session.permit_type}")
+        if partition is not None and session.embedding is not None and session.completed_at:
+            partition.add(session.session_id, session.embedding)
+
+    def add_sessions(self, permit_type: str, session_ids: list[str], vectors) -> None:
+        partition = self._partitions.get(f"sessions:{permit_type}")
+        if partition is not None:
+            partition.add_many(session_ids, vectors)
+
+    def remove_session(self, session_id: str, permit_type: str) -> None:
+        partition = self._partitions.get(f"sessions:{permit_type}")
+        if partition is not None:
+            partition.remove(session_id)
+
+    def add_spec(self, spec: NarrowAgentSpec) -> None:
+        partition = self._partitions.get(SPECS_PARTITION)
+        if partition is not None and spec.embedding is not None:
+            partition.add(spec.id, spec.embedding)
+
+    def remove_spec(self, spec_id: str) -> None:
+        partition = self._partitions.get(SPECS_PARTITION)
+        if partition is not None:
+            partition.remove(spec_id)
+
+    def loaded(self, key: str) -> Optional[SimilarityPartition]:
+        """The partition for key if it is already in memory; never loads."""
+        return self._partitions.get(key)
+
+    def set_partition(self, key: str, partition: SimilarityPartition) -> None:
+        """Install a partition built elsewhere (e.g. restored from disk)."""
+        self._partitions[key] = partition
+
+    def invalidate(self) -> None:
+        """Drop every partition; each reloads from the database on next use."""
+        self._partitions.clear()
+
+    def _load(self, key: str, rows, loader: OriginalsLoader, prefix_dims: int) -> SimilarityPartition:
+        partition = SimilarityPartition(
+            quantization=SIMILARITY_QUANTIZATION, loader=loader, prefix_dims=prefix_dims
+        )
+        if rows:
+            partition.reserve(len(rows))
+            for start in range(0, len(rows), LOAD_CHUNK):
+                chunk = rows[start:start + LOAD_CHUNK]
+                partition.add_many([r[0] for r in chunk], np.stack([r[1] for r in chunk]))
+        self._partitions[key] = partition
+        logger.info(
+            f"[SimilarityIndex] Loaded {key} ({len(partition)} vectors, "
+            f"{SIMILARITY_QUANTIZATION}, prefix={partition.prefix_dims or 'off'}, "
+            f"{partition.nbytes / 1e6:.1f} MB)"
+        )
+        return partition
+
+
+def originals_loader(id_column, embedding_column) -> OriginalsLoader:
+    """Loader that reads float32 originals for an int8 partition by id."""
+    def load(item_ids: list[str]) -> dict[str, np.ndarray]:
+        from db import engine  # avoid circular at module level
+        out: dict[str, np.ndarray] = {}
+        with Session(engine) as db:
+            for start in range(0, len(item_ids), 500):
+                rows = db.exec(
+                    select(id_column, embedding_column).where(
+                        id_column.in_(item_ids[start:start + 500])
+                    )
+                ).all()
+                out.update({r[0]: r[1] for r in rows if r[1] is not None})
+        return out
+    return load
+
+
+def spec_originals_loader() -> OriginalsLoader:
+    return originals_loader(NarrowAgentSpec.id, NarrowAgentSpec.embedding)
+
+
+similarity_index = SimilarityIndex()
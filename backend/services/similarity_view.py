@@ -0,0 +1,133 @@
+from __future__ import annotations
+import os
+from typing import Optional
+
+from sqlalchemy import func, insert, or_
+from sqlmodel import Session, select, delete
+
+from models.session import SessionRecord
+from models.session_similarity import SessionSimilarity
+from services.similarity_index import similarity_index
+
+SIMILARITY_VIEW_FLOOR = float(os.getenv("SIMILARITY_VIEW_FLOOR", "0.5"))  # pairs below are not stored
+SIMILARITY_VIEW_MAX_NEIGHBOURS = int(os.getenv("SIMILARITY_VIEW_MAX_NEIGHBOURS", "200"))  # per recorded session
+BACKFILL_CHUNK = 500  # sessions recorded per block when the view is rebuilt
+
+
+class SimilarityView:
+    """
+    Materialised session_similarity table: every pair of completed sessions
+    of the same permit type that scores at least SIMILARITY_VIEW_FLOOR.
+
+    record() runs when sessions are embedded. It scores the new rows against
+    their similarity partition in one block product and stores up to
+    SIMILARITY_VIEW_MAX_NEIGHBOURS neighbours per session, in both
+    directions. A later session can therefore add itself to an older
+    session's list past that cap. Readers query neighbours by index instead
+    of recomputing the N×N cosine matrix:
+      - match_counts() backs PatternDetector.detect_for_permit_type. The cap
+        only bounds how many matches are counted, and READY needs
+        PATTERN_THRESHOLD - 1 of them.
+      - neighbours() backs GET /api/evidence?mode=neighbors.
+    Cosine only: the alignment and blend scorers still score pairwise.
+    """
+
+    def __init__(
+        self,
+        floor: float = SIMILARITY_VIEW_FLOOR,
+        max_neighbours: int = SIMILARITY_VIEW_MAX_NEIGHBOURS,
+    ):
+        self.floor = floor
+        self.max_neighbours = max(1, max_neighbours)
+
+    def record(self, permit_type: str, session_ids: list[str], db: Session) -> int:
+        """
+        (Re)compute the stored pairs of freshly embedded sessions; returns
+        the number of directed pairs found. Sessions must already be in the
+        similarity index. The caller commits.
+        """
+        if not session_ids:
+            return 0
+        self.delete(session_ids, db)
+        return self._insert(permit_type, session_ids, db)
+
+    def delete(self, session_ids: list[str], db: Session) -> None:
+        """Drop every pair a session takes part in; the caller commits."""
+        if not session_ids:
+            return
+        db.exec(delete(SessionSimilarity).where(or_(
+            SessionSimilarity.session_id.in_(session_ids),
+            SessionSimilarity.neighbour_id.in_(session_ids),
+        )))
+
+    def _insert(self, permit_type: str, session_ids: list[str], db: Session) -> int:
+        partition = similarity_index.sessions(permit_type, db)
+        found = partition.top_neighbours(session_ids, self.max_neighbours, self.floor)
+        pairs: dict[tuple[str, str], float] = {}
+        for session_id, neighbours in found.items():
+            for neighbour_id, score in neighbours:
+                pairs[(session_id, neighbour_id)] = score
+                pairs[(neighbour_id, session_id)] = score
+        if pairs:
+            # OR IGNORE: a pair found from both ends in different batches is stored once
+            db.exec(
+                insert(SessionSimilarity).prefix_with("OR IGNORE"),
+                params=[
+                    {"session_id": a, "neighbour_id": b, "permit_type": permit_type, "score": score}
+                    for (a, b), score in pairs.items()
+                ],
+            )
+        return len(pairs)
+
+    def neighbours(
+        self,
+        session_ids: list[str],
+        k: int,
+        db: Session,
+    ) -> dict[str, list[tuple[str, float]]]:
+        """Up to k stored neighbours per session, best first."""
+        out: dict[str, list[tuple[str, float]]] = {sid: [] for sid in session_ids}
+        if not session_ids:
+            return out
+        rows = db.exec(
+            select(SessionSimilarity.session_id, SessionSimilarity.neighbour_id, SessionSimilarity.score)
+            .where(SessionSimilarity.session_id.in_(session_ids))
+            .order_by(SessionSimilarity.session_id, SessionSimilarity.score.desc())
+        ).all()
+        for session_id, neighbour_id, score in rows:
+            if len(out[session_id]) < k:
+                out[session_id].append((neighbour_id, score))
+        return out
+
+    def match_counts(self, permit_type: str, threshold: float, db: Session) -> dict[str, int]:
+        """Stored neighbours scoring >= threshold, per session; exact while threshold >= floor."""
+        return dict(db.exec(
+            select(SessionSimilarity.session_id, func.count())
+            .where(SessionSimilarity.permit_type == permit_type, SessionSimilarity.score >= threshold)
+            .group_by(SessionSimilarity.session_id)
+        ).all())
+
+    def rebuild(self, db: Session, permit_type: Optional[str] = None) -> int:
+        """Recompute the view for one permit type, or all of them; commits db."""
+        stmt = select(SessionRecord.permit_type, SessionRecord.session_id).where(
+            SessionRecord.completed_at != None, SessionRecord.embedding != None
+        )
+        if permit_type is not None:
+            stmt = stmt.where(SessionRecord.permit_type == permit_type)
+        by_type: dict[str, list[str]] = {}
+        for pt, session_id in db.exec(stmt).all():
+            by_type.setdefault(pt, []).append(session_id)
+        stale = delete(SessionSimilarity)
+        if permit_type is not None:
+            stale = stale.where(SessionSimilarity.permit_type == permit_type)
+        db.exec(stale)
+        written = 0
+        for pt, ids in by_type.items():
+            for start in range(0, len(ids), BACKFILL_CHUNK):
+                written += self._insert(pt, ids[start:start + BACKFILL_CHUNK], db)
+            db.commit()
+        db.commit()
+        return written
+
+
+similarity_view = SimilarityView()
@@ -0,0 +1,289 @@
+from __future__ import annotations
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+from typing import AsyncIterator
+from uuid import uuid4
+
+from pydantic import ValidationError
+from sqlalchemy import delete, insert, update
+from sqlmodel import Session
+
+from models.event import ActionTrace, UIEvent, SSEEventType
+from models.session import SessionRecord, PatternState, UIEventRecord
+from agents.observer_agent import SessionWorkingSet, observer_agent
+from services.blob_store import blob_store
+from services.embedding_service import embedding_service
+from services.event_log import event_log
+from services.fingerprint import trace_fingerprinter
+from services.log_streamer import logger
+from services.pattern_detector import pattern_detector
+from services.sse_bus import sse_bus
+from services.similarity_index import similarity_index
+from services.similarity_view import similarity_view
+
+IMPORT_CHUNK_SESSIONS = int(os.getenv("IMPORT_CHUNK_SESSIONS", "200"))
+IMPORT_MAX_LINE_BYTES = 8 * 1024 * 1024
+
+
+class TraceImporter:
+    """
+    Streams NDJSON UIEvents (one JSON object per line) into the session store.
+
+    Events are grouped into sessions in memory; a session is complete at its
+    submit event. Completed sessions are bulk-inserted (executemany) in chunks
+    of IMPORT_CHUNK_SESSIONS and their traces embedded in one batched call per
+    chunk. Pattern detection runs once per permit type after the stream ends.
+
+    Every session is inserted as COLLECTING without completed_at. A completed
+    session gets its embedding, completed_at and COMPARING state in one update
+    once its chunk is embedded, so the rest of the backend never sees a
+    completed session without a vector. Sessions that never submit stay
+    COLLECTING. Completed sessions that already exist are skipped, so
+    re-importing the same file is harmless. Open ones (never submitted, or
+    left un-embedded by a crashed import) are replaced from the file.
+    """
+
+    async def import_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        db: Session,
+        content_encoding: str = "",
+    ) -> dict:
+        import_id = str(uuid4())
+        t0 = time.time()
+        stats = {"events": 0, "sessions": 0, "completed": 0, "skipped_events": 0, "invalid_lines": 0}
+        open_sessions: dict[str, SessionWorkingSet] = {}
+        completed: list[tuple[SessionWorkingSet, datetime]] = []
+        done_ids: set[str] = set()
+        replace: set[str] = set()  # open rows from an earlier import, re-inserted from this file
+        permit_types: set[str] = set()
+
+        await self._progress(import_id, "started", stats)
+
+        async for line in _ndjson_lines(chunks, content_encoding):
+            try:
+                event = UIEvent.model_validate(json.loads(line))
+            except (ValueError, ValidationError):
+                stats["invalid_lines"] += 1
+                continue
+            stats["events"] += 1
+
+            sid = event.session_id
+            if sid in done_ids:
+                stats["skipped_events"] += 1
+                continue
+            ws = open_sessions.get(sid)
+            if ws is None:
+                existing = db.get(SessionRecord, sid)
+                if existing is not None and existing.completed_at is not None:
+                    done_ids.add(sid)
+                    stats["skipped_events"] += 1
+                    continue
+                if existing is not None:
+                    replace.add(sid)
+                ws = SessionWorkingSet(
+                    session_id=sid,
+                    user_id=event.user_id,
+                    permit_type=event.permit_type or observer_agent._infer_permit_type(event),
+                    started_at=event.timestamp,
+                    persisted=False,
+                )
+                open_sessions[sid] = ws
+
+            stored = event.model_dump(mode="json", exclude={"screenshot_b64"})
+            stored["screenshot_ref"] = blob_store.event_ref(
+                sid, event.screenshot_b64, event.screenshot_ref
+            )
+            ws.append(stored)
+
+            if event.event_type == "submit":
+                ws.close_run()
+                completed.append((open_sessions.pop(sid), event.timestamp))
+                done_ids.add(sid)
+                if len(completed) >= IMPORT_CHUNK_SESSIONS:
+                    await self._write_chunk(completed, db, stats, permit_types, replace)
+                    completed = []
+                    await self._progress(import_id, "ingesting", stats)
+
+        if completed:
+            await self._write_chunk(completed, db, stats, permit_types, replace)
+        if open_sessions:
+            for ws in open_sessions.values():
+                ws.close_run()
+            self._insert(list(open_sessions.values()), db, replace)
+            stats["sessions"] += len(open_sessions)
+            db.commit()
+        await self._progress(import_id, "detecting", stats)
+
+        detection = [
+            pattern_detector.detect_for_permit_type(permit_type, db)
+            for permit_type in sorted(permit_types)
+        ]
+        stats["elapsed_ms"] = int((time.time() - t0) * 1000)
+        summary = {"import_id": import_id, **stats, "detection": detection}
+        await self._progress(import_id, "done", stats, detection=detection)
+        logger.info(
+            f"[Import] {import_id[:8]} done | {stats['events']} events, "
+            f"{stats['sessions']} sessions ({stats['completed']} completed), "
+            f"{len(permit_types)} permit types | {stats['elapsed_ms']}ms"
+        )
+        return summary
+
+    async def _write_chunk(
+        self,
+        completed: list[tuple[SessionWorkingSet, datetime]],
+        db: Session,
+        stats: dict,
+        permit_types: set[str],
+        replace: set[str],
+    ) -> None:
+        """
+        Insert a chunk of completed sessions, fingerprint them, then embed one
+        trace per structure not seen before in a single batch. Sessions whose
+        structure is already known (in the DB or earlier in the chunk) reuse
+        that embedding. The sessions are marked complete only together with
+        their embeddings.
+        """
+        sessions = [ws for ws, _ in completed]
+        completed_at = {ws.session_id: ts for ws, ts in completed}
+        self._insert(sessions, db, replace)
+        db.commit()
+        stats["sessions"] += len(sessions)
+        stats["completed"] += len(sessions)
+        permit_types.update(ws.permit_type for ws in sessions)
+
+        fingerprints = [
+            trace_fingerprinter.fingerprint(ws.permit_type, ws.pending_events) for ws in sessions
+        ]
+        known = trace_fingerprinter.embeddings_for_digests({fp.digest for fp in fingerprints}, db)
+        to_embed: dict[str, SessionWorkingSet] = {}
+        for ws, fp in zip(sessions, fingerprints):
+            if fp.digest not in known:
+                to_embed.setdefault(fp.digest, ws)
+        texts = [
+            embedding_service.serialize_trace(ActionTrace(
+                session_id=ws.session_id,
+                user_id=ws.user_id,
+                permit_type=ws.permit_type,
+                events=[UIEvent(**e) for e in ws.pending_events],
+                completed_at=completed_at[ws.session_id],
+            ))
+            for ws in to_embed.values()
+        ]
+        embedded = await embedding_service.embed_batch(
+            texts, [f"session:{ws.session_id}" for ws in to_embed.values()]
+        )
+        known.update(zip(to_embed, embedded))
+        stats["embeds_skipped"] = stats.get("embeds_skipped", 0) + len(sessions) - len(to_embed)
+        vectors = [known[fp.digest] for fp in fingerprints]
+        for ws, fp in zip(sessions, fingerprints):
+            trace_fingerprinter.store(ws.session_id, ws.permit_type, fp, db)
+        db.exec(
+            update(SessionRecord),
+            params=[
+                {
+                    "session_id": ws.session_id,
+                    "embedding": vec,
+                    "completed_at": completed_at[ws.session_id],
+                    "state": PatternState.COMPARING,
+                }
+                for ws, vec in zip(sessions, vectors)
+            ],
+        )
+        db.commit()
+        by_type: dict[str, tuple[list, list]] = {}
+        for ws, vec in zip(sessions, vectors):
+            ids, vecs = by_type.setdefault(ws.permit_type, ([], []))
+            ids.append(ws.session_id)
+            vecs.append(vec)
+        for permit_type, (ids, vecs) in by_type.items():
+            similarity_index.add_sessions(permit_type, ids, vecs)
+            similarity_view.record(permit_type, ids, db)
+        db.commit()
+
+    def _insert(
+        self,
+        sessions: list[SessionWorkingSet],
+        db: Session,
+        replace: set[str],
+    ) -> None:
+        """
+        executemany inserts for open session rows and their ui_events rows,
+        after deleting the rows of any session listed in replace.
+        """
+        if not sessions:
+            return
+        stale = [ws.session_id for ws in sessions if ws.session_id in replace]
+        if stale:
+            for session_id in stale:
+                event_log.delete_session(session_id, db)
+                trace_fingerprinter.delete(session_id, db)
+            db.exec(delete(SessionRecord).where(SessionRecord.session_id.in_(stale)))
+            logger.info(f"[Import] Replacing {len(stale)} unfinished session(s) from an earlier import")
+        session_rows = []
+        event_rows = []
+        for ws in sessions:
+            session_rows.append(SessionRecord(
+                session_id=ws.session_id,
+                user_id=ws.user_id,
+                permit_type=ws.permit_type,
+                state=PatternState.COLLECTING,
+                event_count=len(ws.pending_events),
+                started_at=ws.started_at,
+            ).model_dump())
+            event_rows.extend(
+                {
+                    "session_id": ws.session_id,
+                    "seq": seq,
+                    "event_type": e.get("event_type", ""),
+                    "payload": e,
+                }
+                for seq, e in enumerate(ws.pending_events)
+            )
+        db.exec(insert(SessionRecord), params=session_rows)
+        db.exec(insert(UIEventRecord), params=event_rows)
+
+    async def _progress(self, import_id: str, phase: str, stats: dict, **extra) -> None:
+        await sse_bus.publish(
+            SSEEventType.IMPORT_PROGRESS,
+            {"import_id": import_id, "phase": phase, **stats, **extra},
+        )
+
+
+async def _ndjson_lines(
+    chunks: AsyncIterator[bytes],
+    content_encoding: str = "",
+) -> AsyncIterator[bytes]:
+    """Split a (optionally gzip-encoded) byte stream into non-empty lines."""
+    inflater = None
+    if content_encoding.strip().lower() == "gzip":
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    buf = b""
+    async for chunk in chunks:
+        if inflater is not None:
+            chunk = _inflate(inflater.decompress, chunk)
+        buf += chunk
+        if len(buf) > IMPORT_MAX_LINE_BYTES and b"\n" not in buf:
+            raise ValueError("NDJSON line exceeds IMPORT_MAX_LINE_BYTES")
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if inflater is not None:
+        buf += _inflate(inflater.flush)
+    if buf.strip():
+        yield buf
+
+
+def _inflate(step, *args) -> bytes:
+    """Run one zlib step; a corrupt gzip body is a client error, so ValueError."""
+    try:
+        return step(*args)
+    except zlib.error as exc:
+        raise ValueError(f"invalid gzip body: {exc}") from exc
+
+
+trace_importer = TraceImporter()
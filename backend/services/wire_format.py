@@ -0,0 +1,106 @@
+from __future__ import annotations
+import json
+import os
+import zlib
+from typing import Any
+
+try:
+    import msgpack
+except ImportError:  # optional — MessagePack bodies are rejected without it
+    msgpack = None
+
+OBSERVE_MAX_BODY_BYTES = int(os.getenv("OBSERVE_MAX_BODY_BYTES", str(32 * 1024 * 1024)))
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+TUPLES_TYPE = "application/vnd.r4mi.tuples+json"
+
+
+class WireFormatError(ValueError):
+    """Body could not be decoded; the router maps this to 4xx."""
+
+    def __init__(self, message: str, status_code: int = 422):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def supported_formats() -> dict:
+    """What capture.js may negotiate via GET /api/observe/formats."""
+    content_types = ["application/json", TUPLES_TYPE]
+    if msgpack is not None:
+        content_types.append(MSGPACK_TYPES[0])
+    return {
+        "content_types": content_types,
+        "content_encodings": ["identity", "gzip"],
+        "max_body_bytes": OBSERVE_MAX_BODY_BYTES,
+    }
+
+
+def decode_body(body: bytes, content_type: str = "", content_encoding: str = "") -> Any:
+    """
+    Decode an /api/observe request body into plain Python objects.
+
+    Handles Content-Encoding gzip/deflate, JSON or MessagePack serialisation,
+    and the keyed-tuple layout {"keys": [...], "rows": [[...], ...]} in either
+    serialisation. The layout is recognised by shape rather than content type
+    so sendBeacon payloads (always text/plain) can use it too.
+    """
+    body = _decompress(body, content_encoding.strip().lower())
+    media_type = content_type.split(";")[0].strip().lower()
+
+    if media_type in MSGPACK_TYPES:
+        if msgpack is None:
+            raise WireFormatError("MessagePack bodies require the msgpack package", 415)
+        try:
+            obj = msgpack.unpackb(body, raw=False)
+        except Exception as exc:
+            raise WireFormatError(f"Invalid MessagePack body: {exc}")
+    else:
+        try:
+            obj = json.loads(body or b"null")
+        except ValueError as exc:
+            raise WireFormatError(f"Invalid JSON body: {exc}")
+
+    return expand_tuples(obj)
+
+
+def expand_tuples(obj: Any) -> Any:
+    """Turn a keyed-tuple payload back into a list of dicts; pass anything else through."""
+    if isinstance(obj, dict) and isinstance(obj.get("keys"), list) and isinstance(obj.get("rows"), list):
+        keys = obj["keys"]
+        return [
+            {k: v for k, v in zip(keys, row) if v is not None}
+            for row in obj["rows"]
+        ]
+    return obj
+
+
+def encode_tuples(events: list[dict]) -> dict:
+    """Inverse of expand_tuples — used by the benchmark and non-browser clients."""
+    keys: list[str] = []
+    for e in events:
+        for k in e:
+            if k not in keys:
+                keys.append(k)
+    return {"keys": keys, "rows": [[e.get(k) for k in keys] for e in events]}
+
+
+def _decompress(body: bytes, encoding: str) -> bytes:
+    if encoding in ("", "identity"):
+        if len(body) > OBSERVE_MAX_BODY_BYTES:
+            raise WireFormatError("Body too large", 413)
+        return body
+    if encoding == "gzip":
+        wbits = 16 + zlib.MAX_WBITS
+    elif encoding == "deflate":
+        wbits = zlib.MAX_WBITS
+    else:
+        raise WireFormatError(f"Unsupported Content-Encoding: {encoding}", 415)
+    # Bounded inflate so a small compressed body cannot expand without limit
+    inflater = zlib.decompressobj(wbits)
+    try:
+        out = inflater.decompress(body, OBSERVE_MAX_BODY_BYTES)
+    except zlib.error as exc:
+        raise WireFormatError(f"Invalid {encoding} body: {exc}", 400)
+    if inflater.unconsumed_tail:
+        raise WireFormatError("Decompressed body too large", 413)
+    return out
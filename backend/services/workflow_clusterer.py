@@ -0,0 +1,335 @@
+from __future__ import annotations
+import asyncio
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+from sqlmodel import Session, select, delete
+
+from models.session import SessionRecord
+from models.workflow_cluster import WorkflowCluster, ClusterMember
+from services.log_streamer import logger
+
+CLUSTER_ENABLED = os.getenv("CLUSTER_ENABLED", "true").lower() == "true"
+CLUSTER_INTERVAL_S = float(os.getenv("CLUSTER_INTERVAL_S", "300"))
+CLUSTER_JOIN_MIN = float(os.getenv("CLUSTER_JOIN_MIN", "0.85"))  # cosine to a centroid needed to join it
+CLUSTER_MIN_SIZE = int(os.getenv("CLUSTER_MIN_SIZE", "3"))  # smallest cluster reported as a workflow
+CLUSTER_BATCH = int(os.getenv("CLUSTER_BATCH", "1024"))  # sessions per mini-batch
+CLUSTER_LABEL_SHARE = 0.5  # a permit_type names the cluster when it holds this share of members
+
+_UNLABELLED = "general"  # ObserverAgent._infer_permit_type fallback
+
+
+class _Centroids:
+    """Centroid matrix plus per-cluster bookkeeping for one clustering run."""
+
+    def __init__(self, clusters: list[WorkflowCluster], reps: dict[str, float]):
+        self.records = list(clusters)
+        self.matrix = _unit_rows([c.centroid for c in clusters])
+        self.counts = np.array([c.size for c in clusters], dtype=np.int64)
+        self.permit_types = [Counter(c.permit_types) for c in clusters]
+        self.rep = [(reps.get(c.representative_session_id, -1.0), c.representative_session_id) for c in clusters]
+
+    def assign(self, x: np.ndarray, join_min: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest centroid for each row of x, or a new cluster when none is
+        within join_min. Leftover rows are grouped leader-style: the first
+        one seeds a centroid and every leftover within join_min of it joins.
+        """
+        assign = np.full(len(x), -1, dtype=np.int64)
+        sims = np.zeros(len(x), dtype=np.float32)
+        if len(self.records):
+            scores = x @ self.matrix.T
+            assign = scores.argmax(axis=1)
+            sims = scores[np.arange(len(x)), assign]
+            assign[sims < join_min] = -1
+        left = np.flatnonzero(assign < 0)
+        while left.size:
+            seed = left[0]
+            s = x[left] @ x[seed]
+            joined = s >= join_min
+            assign[left[joined]] = self._new(x[seed])
+            sims[left[joined]] = s[joined]
+            left = left[~joined]
+        return assign, sims
+
+    def update(self, x: np.ndarray, assign: np.ndarray) -> np.ndarray:
+        """
+        Mini-batch k-means step: each touched centroid moves towards the mean
+        of its new rows with a per-cluster rate of 1 / size. Returns the
+        touched cluster indexes.
+        """
+        k = len(self.records)
+        added = np.bincount(assign, minlength=k)
+        sums = np.zeros((k, x.shape[1]), dtype=np.float32)
+        np.add.at(sums, assign, x)
+        touched = np.flatnonzero(added)
+        self.counts[touched] += added[touched]
+        self.matrix[touched] += (
+            sums[touched] - added[touched, None] * self.matrix[touched]
+        ) / self.counts[touched, None]
+        self.matrix[touched] = _unit_rows(list(self.matrix[touched]))
+        return touched
+
+    def _new(self, centroid: np.ndarray) -> int:
+        self.records.append(WorkflowCluster(label=""))
+        self.matrix = np.vstack([self.matrix.reshape(-1, centroid.size), centroid[None, :]])
+        self.counts = np.append(self.counts, 0)
+        self.permit_types.append(Counter())
+        self.rep.append((-1.0, None))
+        return len(self.records) - 1
+
+
+class WorkflowClusterer:
+    """
+    Background clustering of completed sessions across permit types.
+
+    PatternDetector only compares sessions with the same permit_type, which
+    comes from screen-name heuristics or a client attribute. Sessions with
+    the wrong label, or with the "general" fallback, are never grouped with
+    the workflow they repeat. This job groups every completed, embedded
+    session by embedding alone, with spherical mini-batch k-means:
+      - each run takes the sessions not yet in cluster_members, CLUSTER_BATCH
+        at a time, and assigns each one to its nearest centroid
+      - a session with no centroid within CLUSTER_JOIN_MIN starts a new
+        cluster, so k grows with the data and is not fixed up front
+      - the touched centroids then move towards their new members
+    Runs are incremental and cost O(new sessions × clusters). run(full=True)
+    re-clusters from scratch, then reassigns every session to its nearest
+    final centroid so early arrivals are not stuck where they first landed.
+
+    Clusters of at least CLUSTER_MIN_SIZE sessions are exposed under
+    /api/clusters. A cluster is labelled with its dominant permit_type, or
+    cluster_<id> when no single type dominates. The detector
+    (detect_for_cluster) and SpecBuilder can use that label as a permit type.
+    """
+
+    def __init__(self, join_min: float = CLUSTER_JOIN_MIN, batch: int = CLUSTER_BATCH):
+        self.join_min = join_min
+        self.batch = max(1, batch)
+        self._lock = threading.Lock()  # background loop vs POST /api/clusters/run
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"runs": 0, "assigned": 0, "created": 0, "last_run_ms": 0}
+
+    def run(self, db: Session, full: bool = False) -> dict:
+        """Cluster every completed, embedded session not yet assigned."""
+        with self._lock:
+            t0 = time.time()
+            if full:
+                self._clear(db)
+            clusters = db.exec(select(WorkflowCluster)).all()
+            reps = dict(db.exec(
+                select(ClusterMember.session_id, ClusterMember.similarity).where(
+                    ClusterMember.session_id.in_([c.representative_session_id for c in clusters])
+                )
+            ).all()) if clusters else {}
+            state = _Centroids(clusters, reps)
+            before = len(state.records)
+
+            assigned = 0
+            while True:
+                rows = db.exec(
+                    select(SessionRecord.session_id, SessionRecord.permit_type, SessionRecord.embedding)
+                    .outerjoin(ClusterMember, ClusterMember.session_id == SessionRecord.session_id)
+                    .where(
+                        SessionRecord.completed_at != None,
+                        SessionRecord.embedding != None,
+                        ClusterMember.session_id == None,
+                    )
+                    .order_by(SessionRecord.completed_at)
+                    .limit(self.batch)
+                ).all()
+                if not rows:
+                    break
+                x = _unit_rows([r[2] for r in rows])
+                idx, sims = state.assign(x, self.join_min)
+                touched = state.update(x, idx)
+                members = self._tally(state, [(r[0], r[1]) for r in rows], idx, sims)
+                self._persist(state, touched, members, db)
+                assigned += len(rows)
+
+            if full and assigned:
+                self._reassign(state, db)
+
+            summary = {
+                "assigned": assigned,
+                "created": len(state.records) - before,
+                "clusters": int((state.counts > 0).sum()),
+                "workflows": sum(1 for n in state.counts.tolist() if n >= CLUSTER_MIN_SIZE),
+                "elapsed_ms": int((time.time() - t0) * 1000),
+            }
+            self.stats["runs"] += 1
+            self.stats["assigned"] += assigned
+            self.stats["created"] += summary["created"]
+            self.stats["last_run_ms"] = summary["elapsed_ms"]
+            if assigned:
+                logger.info(
+                    f"[Clusters] {'Full' if full else 'Incremental'} run: {assigned} sessions → "
+                    f"{summary['clusters']} clusters ({summary['created']} new, "
+                    f"{summary['workflows']} with ≥{CLUSTER_MIN_SIZE} sessions) | {summary['elapsed_ms']}ms"
+                )
+            return summary
+
+    def invalidate(self, db: Session) -> None:
+        """Drop all clusters, e.g. after sessions were deleted; the next run rebuilds them."""
+        with self._lock:
+            self._clear(db)
+
+    def workflows(self, db: Session, min_size: int = CLUSTER_MIN_SIZE) -> list[WorkflowCluster]:
+        return db.exec(
+            select(WorkflowCluster)
+            .where(WorkflowCluster.size >= min_size)
+            .order_by(WorkflowCluster.size.desc())
+        ).all()
+
+    def members(
+        self,
+        cluster_id: int,
+        db: Session,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> list[tuple[SessionRecord, float]]:
+        """(session, cosine to centroid) for a cluster's members, closest first."""
+        stmt = (
+            select(SessionRecord, ClusterMember.similarity)
+            .join(ClusterMember, ClusterMember.session_id == SessionRecord.session_id)
+            .where(ClusterMember.cluster_id == cluster_id)
+            .order_by(ClusterMember.similarity.desc())
+            .offset(offset)
+        )
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return [(record, sim) for record, sim in db.exec(stmt).all()]
+
+    def snapshot(self) -> dict:
+        return dict(self.stats)
+
+    async def start(self) -> None:
+        if CLUSTER_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        from db import engine  # avoid circular at module level
+
+        def once() -> None:
+            with Session(engine) as db:
+                self.run(db)
+
+        while True:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, once)
+            except Exception as exc:
+                logger.error(f"[Clusters] Clustering run failed: {exc}")
+            await asyncio.sleep(CLUSTER_INTERVAL_S)
+
+    def _tally(
+        self,
+        state: _Centroids,
+        sessions: list[tuple[str, str]],
+        idx: np.ndarray,
+        sims: np.ndarray,
+    ) -> list[tuple[str, int, float]]:
+        """Fold a batch's assignments into permit_type counts and representatives."""
+        out = []
+        for (session_id, permit_type), j, sim in zip(sessions, idx.tolist(), sims.tolist()):
+            state.permit_types[j][permit_type] += 1
+            if sim > state.rep[j][0]:
+                state.rep[j] = (sim, session_id)
+            out.append((session_id, j, round(sim, 4)))
+        return out
+
+    def _persist(
+        self,
+        state: _Centroids,
+        touched: np.ndarray,
+        members: list[tuple[str, int, float]],
+        db: Session,
+    ) -> None:
+        now = datetime.utcnow()
+        for j in touched.tolist():
+            record = state.records[j]
+            record.centroid = state.matrix[j].copy()
+            record.size = int(state.counts[j])
+            record.permit_types = dict(state.permit_types[j])
+            record.representative_session_id = state.rep[j][1]
+            record.updated_at = now
+            db.add(record)
+        db.flush()  # new clusters get their ids
+        for j in touched.tolist():
+            record = state.records[j]
+            record.label = _label(state.permit_types[j], record.id)
+        for session_id, j, sim in members:
+            db.add(ClusterMember(session_id=session_id, cluster_id=state.records[j].id, similarity=sim))
+        db.commit()
+
+    def _reassign(self, state: _Centroids, db: Session) -> None:
+        """Move every member to its nearest final centroid and recount; drop emptied clusters."""
+        ids = np.array([r.id for r in state.records])
+        state.counts[:] = 0
+        state.permit_types = [Counter() for _ in state.records]
+        state.rep = [(-1.0, None) for _ in state.records]
+        offset = 0
+        while True:
+            rows = db.exec(
+                select(SessionRecord.session_id, SessionRecord.permit_type, SessionRecord.embedding)
+                .join(ClusterMember, ClusterMember.session_id == SessionRecord.session_id)
+                .order_by(SessionRecord.session_id)
+                .offset(offset)
+                .limit(self.batch)
+            ).all()
+            if not rows:
+                break
+            offset += len(rows)
+            scores = _unit_rows([r[2] for r in rows]) @ state.matrix.T
+            idx = scores.argmax(axis=1)
+            sims = scores[np.arange(len(rows)), idx]
+            np.add.at(state.counts, idx, 1)
+            for member in self._tally(state, [(r[0], r[1]) for r in rows], idx, sims):
+                session_id, j, sim = member
+                db.merge(ClusterMember(session_id=session_id, cluster_id=int(ids[j]), similarity=sim))
+            db.commit()
+        for j, record in enumerate(state.records):
+            if not state.counts[j]:
+                db.delete(record)
+                continue
+            record.size = int(state.counts[j])
+            record.permit_types = dict(state.permit_types[j])
+            record.representative_session_id = state.rep[j][1]
+            record.label = _label(state.permit_types[j], record.id)
+            db.add(record)
+        db.commit()
+
+    @staticmethod
+    def _clear(db: Session) -> None:
+        db.exec(delete(ClusterMember))
+        db.exec(delete(WorkflowCluster))
+        db.commit()
+
+
+def _label(permit_types: Counter, cluster_id: int) -> str:
+    if permit_types:
+        top, n = permit_types.most_common(1)[0]
+        if top != _UNLABELLED and n >= CLUSTER_LABEL_SHARE * sum(permit_types.values()):
+            return top
+    return f"cluster_{cluster_id}"
+
+
+def _unit_rows(vectors: list[np.ndarray]) -> np.ndarray:
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32)
+    out = np.stack(vectors).astype(np.float32)
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    return out / np.where(norms == 0, 1.0, norms)
+
+
+workflow_clusterer = WorkflowClusterer()
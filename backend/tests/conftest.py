@@ -0,0 +1,47 @@
+"""
+Shared fixtures. Configuration is read at import time throughout the
+backend, so the environment is pinned here before any app module loads:
+a throwaway SQLite file, a temp blob store and the local embedding
+provider, so no test reaches Gemini.
+"""
+import os
+import sys
+import tempfile
+
+_TMP = tempfile.mkdtemp(prefix="r4mi-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_TMP}/test.db",
+    "BLOB_STORE_DIR": f"{_TMP}/blobs",
+    "MARKET_ANN_PATH": f"{_TMP}/market_ann.npz",
+    "GEMINI_API_KEY": "test",
+    "EMBEDDING_PROVIDER": "local",
+    "DEMO_SESSION_SEED": "false",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+from sqlmodel import Session, SQLModel  # noqa: E402
+
+import main  # noqa: E402,F401  registers every table model
+from db import engine, create_db_and_tables  # noqa: E402
+from agents.observer_agent import session_cache  # noqa: E402
+from services.detector_state import detector_state  # noqa: E402
+from services.similarity_index import similarity_index  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_db():
+    """Empty tables and in-memory caches for every test."""
+    SQLModel.metadata.drop_all(engine)
+    create_db_and_tables()
+    session_cache._sets.clear()
+    similarity_index.invalidate()
+    detector_state._windows.clear()
+    yield
+    session_cache._sets.clear()
+
+
+@pytest.fixture
+def db():
+    with Session(engine) as session:
+        yield session
@@ -0,0 +1,19 @@
+"""Builders shared by the tests."""
+from datetime import datetime, timedelta
+
+from models.event import UIEvent
+
+
+def make_event(session_id: str, i: int, **overrides) -> UIEvent:
+    """The i-th click of a session on the fence_variance form."""
+    fields = {
+        "session_id": session_id,
+        "user_id": "permit-tech-001",
+        "timestamp": datetime(2024, 5, 1) + timedelta(seconds=i),
+        "event_type": "click",
+        "screen_name": "FENCE_FORM",
+        "element_selector": f"#el{i}",
+        "permit_type": "fence_variance",
+    }
+    fields.update(overrides)
+    return UIEvent(**fields)
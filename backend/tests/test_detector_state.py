@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from models.session import SessionRecord
+from services.detector_state import detector_state
+from services.similarity_index import SimilarityPartition, originals_loader, similarity_index
+
+THRESHOLD = 0.85
+PERMIT = "fence_variance"
+
+
+def _vector(seed: int, base: np.ndarray) -> np.ndarray:
+    noise = np.random.default_rng(seed).normal(size=base.size).astype(np.float32)
+    return base + 0.05 * noise
+
+
+def _complete(db, session_id: str, vector: np.ndarray, minute: int) -> SessionRecord:
+    session = SessionRecord(
+        session_id=session_id,
+        user_id="permit-tech-001",
+        permit_type=PERMIT,
+        embedding=vector,
+        completed_at=datetime(2024, 5, 1) + timedelta(minutes=minute),
+    )
+    db.add(session)
+    db.commit()
+    similarity_index.add_session(session)
+    return session
+
+
+def _observe_all(db, n: int):
+    base = np.random.default_rng(0).normal(size=64).astype(np.float32)
+    out = []
+    for i in range(n):
+        vector = _vector(i + 1, base)
+        session = _complete(db, f"s{i}", vector, i)
+        out.append((session, vector, detector_state.observe(session, vector, db, THRESHOLD)))
+    return out
+
+
+def test_first_observe_after_a_rebuild_counts_each_pair_once(db):
+    base = np.random.default_rng(0).normal(size=64).astype(np.float32)
+    for i in range(2):
+        _complete(db, f"s{i}", _vector(i + 1, base), i)
+    vector = _vector(3, base)
+    session = _complete(db, "s2", vector, 2)
+
+    # No detector_state row yet: observe() rebuilds from the sessions table,
+    # which already holds s2
+    obs = detector_state.observe(session, vector, db, THRESHOLD)
+
+    state = detector_state._windows[PERMIT]
+    assert state.ids == ["s0", "s1", "s2"]
+    assert state.match_counts == {"s0": 2, "s1": 2, "s2": 2}
+    assert (obs.prior_count, obs.matches) == (2, 2)
+    assert state.completed_count == 3
+
+
+def test_resubmit_does_not_count_neighbours_twice(db):
+    observed = _observe_all(db, 3)
+    session, vector, _ = observed[1]
+
+    obs = detector_state.observe(session, vector, db, THRESHOLD)
+
+    state = detector_state._windows[PERMIT]
+    assert state.match_counts == {"s0": 2, "s1": 2, "s2": 2}
+    assert state.completed_count == 3 and obs.prior_count == 2
+
+
+def test_live_scores_come_from_the_int8_partition(db, monkeypatch):
+    partition = SimilarityPartition(
+        quantization="int8",
+        loader=originals_loader(SessionRecord.session_id, SessionRecord.embedding),
+    )
+    similarity_index.set_partition(f"sessions:{PERMIT}", partition)
+    calls = []
+    scores_for = partition.scores_for
+
+    def spy(item_ids, vector, threshold):
+        calls.append(list(item_ids))
+        return scores_for(item_ids, vector, threshold)
+
+    monkeypatch.setattr(partition, "scores_for", spy)
+
+    observed = _observe_all(db, 3)
+
+    assert calls[-1] == ["s0", "s1"]
+    assert observed[-1][2].matches == 2
+    assert detector_state._windows[PERMIT].match_counts == {"s0": 2, "s1": 2, "s2": 2}
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from services.embed_coalescer import EmbedCoalescer
+
+
+def _run_all(coalescer: EmbedCoalescer, keys: list[str]):
+    async def go():
+        results = await asyncio.gather(
+            *(coalescer.submit(key, f"text {key}") for key in keys),
+            return_exceptions=True,
+        )
+        return results, dict(coalescer._inflight)
+
+    return asyncio.run(go())
+
+
+def test_concurrent_requests_share_one_upstream_call():
+    calls = []
+
+    async def send(batch):
+        calls.append([key for key, _ in batch])
+        return [[float(i)] for i in range(len(batch))]
+
+    results, inflight = _run_all(EmbedCoalescer(send, window_ms=1), ["a", "b", "a", "c"])
+
+    assert calls == [["a", "b", "c"]]
+    assert results == [[0.0], [1.0], [0.0], [2.0]]
+    assert inflight == {}
+
+
+def test_short_response_fails_every_caller_and_frees_the_keys():
+    async def send(batch):
+        return [[1.0]] * (len(batch) - 1)
+
+    coalescer = EmbedCoalescer(send, window_ms=1)
+    results, inflight = _run_all(coalescer, ["a", "b", "c"])
+
+    assert all(isinstance(r, ValueError) for r in results)
+    assert inflight == {}
+
+
+def test_upstream_error_reaches_every_caller():
+    async def send(batch):
+        raise RuntimeError("quota")
+
+    results, inflight = _run_all(EmbedCoalescer(send, window_ms=1), ["a", "b"])
+
+    assert [str(r) for r in results] == ["quota", "quota"]
+    assert inflight == {}
+
+
+def test_cancelled_send_does_not_strand_callers():
+    async def go():
+        started = asyncio.Event()
+
+        async def send(batch):
+            started.set()
+            await asyncio.sleep(10)
+
+        coalescer = EmbedCoalescer(send, window_ms=0)
+        waiter = asyncio.ensure_future(coalescer.submit("a", "text"))
+        await started.wait()
+        for task in asyncio.all_tasks():
+            if task.get_coro().__name__ == "_run":
+                task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(waiter, 1)
+        return dict(coalescer._inflight)
+
+    assert asyncio.run(go()) == {}
+
+
+def test_in_flight_sends_are_referenced_until_done():
+    async def go():
+        async def send(batch):
+            await asyncio.sleep(0.01)
+            return [[1.0]] * len(batch)
+
+        coalescer = EmbedCoalescer(send, window_ms=0)
+        waiter = asyncio.ensure_future(coalescer.submit("a", "text"))
+        await asyncio.sleep(0.001)
+        held = len(coalescer._tasks)
+        await waiter
+        await asyncio.sleep(0)
+        return held, len(coalescer._tasks)
+
+    assert asyncio.run(go()) == (1, 0)
@@ -0,0 +1,47 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from services.embedding_cache import embedding_cache
+from services.embedding_providers import EmbeddingProvider, LocalHashingProvider
+from services.embedding_service import EmbeddingService
+
+TRACE = (
+    "permit_type:fence_variance | navigate:APPLICATION_INBOX:app_row_s1 | "
+    "input:GIS_LOOKUP:parcel_id:R2-123 | submit:FENCE_FORM:approve"
+)
+
+
+def test_local_vectors_do_not_depend_on_earlier_traffic():
+    provider = LocalHashingProvider()
+    before = provider.vectorize(TRACE)
+    for i in range(200):
+        provider.vectorize(f"permit_type:solar_permit | click:FORM_{i}:btn | input:FORM:v:value {i}")
+
+    assert np.array_equal(before, provider.vectorize(TRACE))
+    assert np.array_equal(before, LocalHashingProvider().vectorize(TRACE))
+
+
+def test_local_vectors_go_through_the_cache():
+    service = EmbeddingService(provider=LocalHashingProvider())
+    text = TRACE + " | click:FENCE_FORM:cache_probe"
+
+    async def go():
+        first = await service.embed(text, "session:a")
+        hits = embedding_cache.stats["memory_hits"]
+        again = await service.embed_batch([text], ["session:b"])
+        return first, again[0], embedding_cache.stats["memory_hits"] - hits
+
+    first, again, new_hits = asyncio.run(go())
+
+    assert new_hits == 1
+    assert again is first
+
+
+def test_incomplete_provider_fails_at_construction():
+    class NoEmbed(EmbeddingProvider):
+        model = "none"
+
+    with pytest.raises(TypeError):
+        NoEmbed()
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import main
+from models.session import SessionRecord
+from services.embedding_service import embedding_service
+
+client = TestClient(main.app)
+
+
+def _seed(db, n: int) -> None:
+    rng = np.random.default_rng(0)
+    for i in range(n):
+        db.add(SessionRecord(
+            session_id=f"s{i:02d}",
+            user_id="permit-tech-001",
+            permit_type="fence_variance",
+            embedding=rng.normal(size=8).astype(np.float32),
+            completed_at=datetime(2024, 5, 1) + timedelta(minutes=i),
+        ))
+    db.commit()
+
+
+def test_default_page_contains_the_target_session(db):
+    _seed(db, 60)
+
+    out = client.get("/api/evidence/s55", params={"include_events": "false"}).json()
+
+    assert out["target_index"] == 55
+    assert out["offset"] == 50
+    assert "s55" in [s["session_id"] for s in out["sessions"]]
+    assert out["embedding_model"] == embedding_service.provider.model
+
+
+def test_explicit_offset_is_kept(db):
+    _seed(db, 60)
+
+    out = client.get("/api/evidence/s55", params={"offset": 0, "include_events": "false"}).json()
+
+    assert out["offset"] == 0 and out["target_index"] == 55
+    assert len(out["sessions"]) == 50
@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+import main
+import services.ingest_queue as ingest_module
+from agents.observer_agent import session_cache
+from db import engine
+from models.ingest_dead_letter import IngestDeadLetter
+from routers.observe import _ingest_session_events
+from services.blob_store import blob_store
+from services.event_log import event_log
+from services.ingest_queue import IngestQueue, ingest_queue
+from services.vision_service import vision_service
+from tests.helpers import make_event
+
+
+def _selectors(session_id: str) -> list[str]:
+    session_cache.flush_all()
+    with Session(engine) as db:
+        return [e["element_selector"] for e in event_log.load_events(session_id, db)]
+
+
+def _screenshot(session_id: str, i: int):
+    return make_event(session_id, i, event_type="screen_switch", screenshot_b64="aGVsbG8=")
+
+
+async def _drain(queue: IngestQueue) -> None:
+    """Wait until every queued event is handled and no retry is held."""
+    for _ in range(500):
+        await asyncio.gather(*(q.join() for q in queue._shards))
+        if not any(queue._held):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("ingest queue did not drain")
+
+
+def _run(queue: IngestQueue, *batches) -> None:
+    async def go():
+        await queue.start()
+        for batch in batches:
+            assert queue.submit(batch)
+        await _drain(queue)
+        await queue.stop()
+
+    asyncio.run(go())
+
+
+def _queue() -> IngestQueue:
+    queue = IngestQueue(maxsize=20, workers=1)
+    queue.set_handler(_ingest_session_events)
+    return queue
+
+
+def test_failing_group_does_not_lose_other_groups(monkeypatch):
+    monkeypatch.setattr(ingest_module, "OBSERVE_INGEST_MODE", "queue")
+    monkeypatch.setattr(ingest_module, "OBSERVE_RETRY_BASE_S", 0.01)
+    calls = []
+
+    async def flaky(**_):
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("vision backend down")
+        return None
+
+    monkeypatch.setattr(vision_service, "extract_knowledge_sources", flaky)
+    bad = [make_event("bad", 0), _screenshot("bad", 1), make_event("bad", 2)]
+    good = [make_event("good", i) for i in range(3)]
+
+    _run(_queue(), bad + good, [make_event("bad", 3)])
+
+    assert _selectors("good") == ["#el0", "#el1", "#el2"]
+    # The failed event was kept; the rest were retried in order, ahead of later events
+    assert _selectors("bad") == ["#el0", "#el1", "#el2", "#el3"]
+
+
+def test_exhausted_retries_are_dead_lettered_and_replayed(monkeypatch):
+    monkeypatch.setattr(ingest_module, "OBSERVE_INGEST_MODE", "queue")
+    monkeypatch.setattr(ingest_module, "OBSERVE_RETRY_BASE_S", 0.01)
+    monkeypatch.setattr(ingest_module, "OBSERVE_RETRY_MAX", 2)
+
+    def disk_full(_):
+        raise OSError("No space left on device")
+
+    async def ok(**_):
+        return None
+
+    monkeypatch.setattr(blob_store, "put_b64", disk_full)
+    monkeypatch.setattr(vision_service, "extract_knowledge_sources", ok)
+    events = [make_event("q", 0), _screenshot("q", 1), make_event("q", 2)]
+
+    _run(_queue(), events)
+
+    with Session(engine) as db:
+        (row,) = db.exec(select(IngestDeadLetter)).all()
+    assert row.retryable and row.session_id == "q" and row.attempts == 2
+    assert [e["element_selector"] for e in row.events] == ["#el1", "#el2"]
+    assert _selectors("q") == ["#el0"]
+
+    monkeypatch.undo()
+    monkeypatch.setattr(ingest_module, "OBSERVE_INGEST_MODE", "queue")
+    monkeypatch.setattr(vision_service, "extract_knowledge_sources", ok)
+    _run(_queue())
+
+    assert _selectors("q") == ["#el0", "#el1", "#el2"]
+    with Session(engine) as db:
+        assert db.exec(select(IngestDeadLetter)).all() == []
+
+
+def test_unexpected_error_dead_letters_the_group(monkeypatch):
+    monkeypatch.setattr(ingest_module, "OBSERVE_INGEST_MODE", "queue")
+
+    async def broken(session_id, events, db):
+        raise ValueError("bad handler")
+
+    queue = IngestQueue(maxsize=20, workers=1)
+    queue.set_handler(broken)
+    _run(queue, [make_event("x", 0), make_event("x", 1)])
+
+    with Session(engine) as db:
+        (row,) = db.exec(select(IngestDeadLetter)).all()
+    assert not row.retryable and len(row.events) == 2 and "bad handler" in row.error
+
+
+def test_batch_larger_than_a_shard_is_rejected_with_413(monkeypatch):
+    monkeypatch.setattr(ingest_module, "OBSERVE_INGEST_MODE", "queue")
+    monkeypatch.setattr(ingest_queue, "max_batch", 2)
+    client = TestClient(main.app)
+
+    res = client.post(
+        "/api/observe/batch",
+        json=[make_event("big", i).model_dump(mode="json") for i in range(3)],
+    )
+
+    assert res.status_code == 413
+    assert res.json() == {"status": "batch_too_large", "max_batch": 2}
+    assert ingest_queue.depth() == 0
+
+
+@pytest.mark.parametrize("group_commit_max", [1, 50])  # still queued / taken but not started
+def test_events_undrained_at_shutdown_are_dead_lettered(monkeypatch, group_commit_max):
+    monkeypatch.setattr(ingest_module, "OBSERVE_INGEST_MODE", "queue")
+    release = asyncio.Event()
+
+    async def slow(session_id, events, db):
+        await release.wait()
+        return {"status": "ok"}
+
+    async def go():
+        queue = IngestQueue(maxsize=20, workers=1, group_commit_max=group_commit_max)
+        queue.set_handler(slow)
+        await queue.start()
+        assert queue.submit([make_event("a", 0), make_event("b", 0), make_event("b", 1)])
+        await asyncio.sleep(0.01)  # worker is now stuck on a's event
+        await queue.stop(timeout=0.05)
+
+    asyncio.run(go())
+
+    with Session(engine) as db:
+        rows = db.exec(select(IngestDeadLetter)).all()
+    assert [(r.session_id, r.retryable, [e["element_selector"] for e in r.events]) for r in rows] == [
+        ("b", True, ["#el0", "#el1"])
+    ]
@@ -0,0 +1,27 @@
+import base64
+import hashlib
+
+from sqlmodel import Session, select
+
+import main
+from db import engine
+from models.session import UIEventRecord
+
+
+def test_inline_screenshot_migration_drops_malformed_screenshots():
+    good = base64.b64encode(b"legacy screenshot").decode()
+    with Session(engine) as db:
+        db.add(UIEventRecord(session_id="old", seq=0, event_type="screen_switch",
+                             payload={"screenshot_b64": "not base64!"}))
+        db.add(UIEventRecord(session_id="old", seq=1, event_type="screen_switch",
+                             payload={"screenshot_b64": good}))
+        db.commit()
+
+    main._migrate_inline_screenshots()
+
+    with Session(engine) as db:
+        payloads = [r.payload for r in db.exec(select(UIEventRecord).order_by(UIEventRecord.seq))]
+    assert payloads == [
+        {"screenshot_ref": None},
+        {"screenshot_ref": hashlib.sha256(b"legacy screenshot").hexdigest()},
+    ]
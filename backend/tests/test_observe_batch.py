@@ -0,0 +1,114 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+import main
+from agents.observer_agent import session_cache
+from db import engine
+from services.blob_store import blob_store
+from services.event_log import event_log
+from services.exceptions import QuotaExhaustedException
+from services.vision_service import vision_service
+from tests.helpers import make_event
+
+client = TestClient(main.app)
+
+
+def _post(events):
+    return client.post(
+        "/api/observe/batch", json=[e.model_dump(mode="json") for e in events]
+    ).json()
+
+
+def _stored(session_id: str) -> list[dict]:
+    session_cache.flush_all()
+    with Session(engine) as db:
+        return event_log.load_events(session_id, db)
+
+
+def _selectors(session_id: str) -> list[str]:
+    return [e["element_selector"] for e in _stored(session_id)]
+
+
+def test_quota_error_reports_the_events_to_resend(monkeypatch):
+    async def quota(**_):
+        raise QuotaExhaustedException("429 RESOURCE_EXHAUSTED")
+
+    monkeypatch.setattr(vision_service, "extract_knowledge_sources", quota)
+    events = [make_event("q1", i) for i in range(6)]
+    events[3] = make_event("q1", 3, event_type="screen_switch", screenshot_b64="aGVsbG8=")
+
+    out = _post(events)
+
+    assert out["status"] == "quota_exhausted"
+    assert out["unprocessed"] == [4, 5]
+    assert out["accepted"] == 4
+    assert _selectors("q1") == ["#el0", "#el1", "#el2", "#el3"]
+
+    # capture.js resends exactly the unprocessed events once the quota recovers
+    out = _post([events[i] for i in out["unprocessed"]])
+    assert out["status"] == "ok" and out["unprocessed"] == []
+    assert _selectors("q1") == [f"#el{i}" for i in range(6)]
+
+
+def test_unprocessed_indices_refer_to_the_posted_array(monkeypatch):
+    async def quota(**_):
+        raise QuotaExhaustedException("429")
+
+    monkeypatch.setattr(vision_service, "extract_knowledge_sources", quota)
+    events = [
+        make_event("a", 0),
+        make_event("b", 0, event_type="screen_switch", screenshot_b64="aGVsbG8="),
+        make_event("a", 1),
+        make_event("b", 1),
+    ]
+
+    out = _post(events)
+
+    assert out["unprocessed"] == [3]
+    assert _selectors("a") == ["#el0", "#el1"]
+    assert _selectors("b") == ["#el0"]
+
+
+def test_bad_screenshots_and_unknown_refs_are_dropped(monkeypatch):
+    seen = []
+
+    async def vision(**kwargs):
+        seen.append(kwargs["screenshot_b64"])
+        return []
+
+    monkeypatch.setattr(vision_service, "extract_knowledge_sources", vision)
+    known = blob_store.put(b"stored screenshot")
+    events = [
+        make_event("s", 0, event_type="screen_switch", screenshot_b64="not base64!"),
+        make_event("s", 1, screenshot_ref="../../etc/passwd"),
+        make_event("s", 2, screenshot_ref="f" * 64),
+        make_event("s", 3, screenshot_ref=known),
+    ]
+
+    out = _post(events)
+
+    assert out["status"] == "ok" and out["accepted"] == 4
+    assert [e["screenshot_ref"] for e in _stored("s")] == [None, None, None, known]
+    assert seen == []  # the malformed screenshot never reached the vision model
+
+
+def test_other_errors_report_the_rest_of_the_batch(monkeypatch):
+    async def down(**_):
+        raise RuntimeError("vision backend down")
+
+    monkeypatch.setattr(vision_service, "extract_knowledge_sources", down)
+    events = [
+        make_event("a", 0),
+        make_event("a", 1, event_type="screen_switch", screenshot_b64="aGVsbG8="),
+        make_event("b", 0),
+        make_event("a", 2),
+    ]
+
+    res = client.post("/api/observe/batch", json=[e.model_dump(mode="json") for e in events])
+
+    assert res.status_code == 200
+    out = res.json()
+    assert out["status"] == "error"
+    assert out["unprocessed"] == [2, 3]
+    assert _selectors("a") == ["#el0", "#el1"]
+    assert _selectors("b") == []
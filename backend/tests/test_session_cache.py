@@ -0,0 +1,63 @@
+import asyncio
+
+from sqlmodel import Session
+
+from agents.observer_agent import observer_agent, session_cache
+from db import engine
+from models.session import SessionRecord
+from services.event_log import event_log
+from services.vision_service import vision_service
+from tests.helpers import make_event
+
+SCREENSHOT = "aGVsbG8="  # base64 "hello"
+
+
+def _selectors(session_id: str) -> list[str]:
+    with Session(engine) as db:
+        return [e["element_selector"] for e in event_log.load_events(session_id, db)]
+
+
+def test_flush_during_vision_await_loses_nothing(db, monkeypatch):
+    monkeypatch.setattr(session_cache, "flush_events", 3)
+
+    async def extract_and_flush(**_):
+        await asyncio.sleep(0)
+        session_cache.flush_all(evict_idle=True)  # the periodic flusher firing mid-await
+        return []
+
+    monkeypatch.setattr(vision_service, "extract_knowledge_sources", extract_and_flush)
+    events = [make_event("s1", i) for i in range(9)]
+    events[4] = make_event("s1", 4, event_type="screen_switch", screenshot_b64=SCREENSHOT)
+
+    asyncio.run(observer_agent.handle_batch(events, db))
+    session_cache.flush_all()
+
+    assert _selectors("s1") == [f"#el{i}" for i in range(9)]
+    assert db.get(SessionRecord, "s1", populate_existing=True).event_count == 9
+
+
+def test_failed_write_keeps_pending_events(db, monkeypatch):
+    asyncio.run(observer_agent.handle_batch([make_event("s2", i) for i in range(2)], db))
+    real_append = event_log.append_many
+
+    def failing_append(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(event_log, "append_many", failing_append)
+    session_cache.flush_all()
+    assert len(session_cache.get("s2").pending_events) == 2
+    assert _selectors("s2") == []
+
+    monkeypatch.setattr(event_log, "append_many", real_append)
+    session_cache.flush_all()
+    assert _selectors("s2") == ["#el0", "#el1"]
+    assert not session_cache.get("s2").dirty
+
+
+def test_lru_eviction_writes_the_evicted_session(db, monkeypatch):
+    monkeypatch.setattr(session_cache, "max_size", 1)
+    asyncio.run(observer_agent.handle_event(make_event("old", 0), db))
+    asyncio.run(observer_agent.handle_event(make_event("new", 0), db))
+
+    assert session_cache.get("old") is None
+    assert _selectors("old") == ["#el0"]
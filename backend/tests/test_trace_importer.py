@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+import main
+from db import engine
+from models.session import PatternState, SessionRecord
+from services.embedding_service import embedding_service
+from services.event_log import event_log
+from services.trace_importer import trace_importer
+from tests.helpers import make_event
+
+
+def _ndjson(session_id: str, n: int = 4) -> bytes:
+    events = [make_event(session_id, i) for i in range(n - 1)]
+    events.append(make_event(session_id, n - 1, event_type="submit"))
+    return b"".join(json.dumps(e.model_dump(mode="json")).encode() + b"\n" for e in events)
+
+
+def _import(body: bytes) -> dict:
+    async def chunks():
+        yield body
+
+    async def go():
+        with Session(engine) as db:
+            return await trace_importer.import_stream(chunks(), db)
+
+    return asyncio.run(go())
+
+
+def test_crash_before_embedding_leaves_session_open_and_reimport_completes_it(monkeypatch):
+    async def down(*_args, **_kwargs):
+        raise RuntimeError("embedding backend down")
+
+    monkeypatch.setattr(embedding_service, "embed_batch", down)
+    with pytest.raises(RuntimeError):
+        _import(_ndjson("imp1"))
+
+    with Session(engine) as db:
+        row = db.get(SessionRecord, "imp1")
+        assert row.state == PatternState.COLLECTING
+        assert row.completed_at is None and row.embedding is None
+
+    monkeypatch.undo()
+    summary = _import(_ndjson("imp1"))
+
+    assert summary["completed"] == 1
+    with Session(engine) as db:
+        row = db.get(SessionRecord, "imp1")
+        assert row.completed_at is not None and row.embedding is not None
+        assert len(event_log.load_events("imp1", db)) == 4  # replaced, not duplicated
+
+    # Once complete, the same file is skipped
+    assert _import(_ndjson("imp1"))["skipped_events"] == 4
+
+
+def test_corrupt_gzip_body_is_a_400():
+    client = TestClient(main.app)
+
+    res = client.post(
+        "/api/import/traces",
+        content=b"\x1f\x8b\x08\x00not really gzip at all",
+        headers={"Content-Encoding": "gzip"},
+    )
+
+    assert res.status_code == 400
+    assert "invalid gzip body" in res.json()["detail"]
@@ -4,6 +4,10 @@
  * Include via:
  *   <script src="/capture.js" data-api="http://localhost:8000" data-user-id="permit-tech-001"></script>
  *
+ * Optional batching attributes (events are buffered and sent to /api/observe/batch):
+ *   data-batch-size="20"   flush once this many events are queued
+ *   data-flush-ms="2000"   flush at most this long after the first queued event
+ *
  * The host application cooperates by adding two data attributes to <body>:
  *   data-session-id="<unique-session-id>"   (changes on each new work item)
  *   data-permit-type="<permit-type-slug>"   (e.g. "fence_variance")
@@ -130,21 +134,237 @@
     }
   }
 
-  // ── POST to backend ──────────────────────────────────────────────────────────
-  async function postEvent(eventData) {
-    if (localStorage.getItem('r4mi_pause_recording') === 'true') return;
+  // ── Buffered POST to backend ────────────────────────────────────────────────
+  // Events are queued and flushed to /api/observe/batch when the buffer reaches
+  // BATCH_SIZE or FLUSH_MS elapses. Submits flush immediately so pattern
+  // detection is not delayed; pagehide flushes via sendBeacon.
+  //
+  // Browsers cap keepalive fetches and beacons at 64 KB in flight, so a flush
+  // is split into chunks of at most KEEPALIVE_MAX_BYTES, sent one at a time.
+  // Chunks that carry a screenshot (or a single event over the cap) go out as
+  // ordinary fetches. On a network error, a 5xx, a 429 or a response listing
+  // unprocessed events, the unsent events go back to the head of the buffer.
+  // A 413 (more events than the backend queue takes at once) lowers the
+  // per-chunk event cap to the backend's max_batch and resends. Hiding the
+  // tab only flushes; what pagehide cannot beacon is stashed in localStorage
+  // and sent on the next load.
+  const BATCH_SIZE = parseInt((script && script.getAttribute('data-batch-size')) || '20', 10)
+  const FLUSH_MS = parseInt((script && script.getAttribute('data-flush-ms')) || '2000', 10)
+  var _buffer = []
+  var _flushTimer = null
+  var _retryAt = 0  // set from Retry-After when the backend answers 429
+  var _sending = false  // one flush at a time keeps chunks in capture order
+  var _maxChunkEvents = 200  // lowered from the backend's max_batch on a 413
+  const QUOTA_RETRY_MS = 30000  // back-off after the backend reports quota_exhausted
+  const NETWORK_RETRY_MS = 5000  // back-off after a failed request
+  const KEEPALIVE_MAX_BYTES = 60000  // under the 64 KB keepalive/beacon budget
+  const UNSENT_KEY = 'r4mi_unsent_events'
+
+  function takeBuffer() {
+    if (_flushTimer) {
+      clearTimeout(_flushTimer)
+      _flushTimer = null
+    }
+    var batch = _buffer
+    _buffer = []
+    return batch
+  }
+
+  function hasScreenshot(e) {
+    return !!e.screenshot_b64
+  }
+
+  // Consecutive runs of at most _maxChunkEvents events whose JSON stays under
+  // KEEPALIVE_MAX_BYTES. The JSON size is an upper bound for the keyed-tuple
+  // encoding too.
+  function splitBySize(batch) {
+    var chunks = []
+    var current = []
+    var size = 2
+    batch.forEach(function (e) {
+      var bytes = new Blob([JSON.stringify(e)]).size + 1
+      if (current.length && (size + bytes > KEEPALIVE_MAX_BYTES || current.length >= _maxChunkEvents)) {
+        chunks.push(current)
+        current = []
+        size = 2
+      }
+      current.push(e)
+      size += bytes
+    })
+    if (current.length) chunks.push(current)
+    return chunks
+  }
+
+  // Put events back at the head of the buffer, in order, and retry after retryMs
+  function requeue(events, retryMs) {
+    _buffer = events.concat(_buffer)
+    _retryAt = Date.now() + retryMs
+    if (!_flushTimer) _flushTimer = setTimeout(flush, retryMs)
+  }
+
+  // ── Wire format negotiation ────────────────────────────────────────────────
+  // Ask the backend which encodings it accepts; fall back to plain JSON until
+  // (or unless) it answers. Keyed tuples drop the repeated per-event keys, and
+  // gzip runs via CompressionStream where the browser supports it.
+  var _wire = { tuples: false, gzip: false }
+  fetch(API_BASE + '/api/observe/formats')
+    .then(function (r) { return r.ok ? r.json() : null })
+    .then(function (f) {
+      if (!f) return
+      _wire.tuples = (f.content_types || []).indexOf('application/vnd.r4mi.tuples+json') !== -1
+      _wire.gzip = (f.content_encodings || []).indexOf('gzip') !== -1 &&
+        typeof window.CompressionStream === 'function'
+    })
+    .catch(function () { })
+
+  function encodeBatch(batch) {
+    if (!_wire.tuples) return { type: 'application/json', text: JSON.stringify(batch) }
+    var keys = []
+    batch.forEach(function (e) {
+      Object.keys(e).forEach(function (k) { if (keys.indexOf(k) === -1) keys.push(k) })
+    })
+    var rows = batch.map(function (e) {
+      return keys.map(function (k) { return e[k] === undefined ? null : e[k] })
+    })
+    return { type: 'application/vnd.r4mi.tuples+json', text: JSON.stringify({ keys: keys, rows: rows }) }
+  }
+
+  async function gzip(text) {
+    var stream = new Blob([text]).stream().pipeThrough(new CompressionStream('gzip'))
+    return await new Response(stream).blob()
+  }
+
+  // POST one chunk. Returns { events, retryMs } for events to send again, or null.
+  async function postChunk(events) {
+    var encoded = encodeBatch(events)
+    var headers = { 'Content-Type': encoded.type }
+    var body = encoded.text
+    var res
     try {
-      await fetch(API_BASE + '/api/observe', {
+      if (_wire.gzip) {
+        body = await gzip(encoded.text)
+        headers['Content-Encoding'] = 'gzip'
+      }
+      res = await fetch(API_BASE + '/api/observe/batch', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(eventData),
-        keepalive: true,
+        headers: headers,
+        body: body,
+        keepalive: !events.some(hasScreenshot) && new Blob([body]).size <= KEEPALIVE_MAX_BYTES,
       })
+    } catch (_) {
+      return { events: events, retryMs: NETWORK_RETRY_MS }
+    }
+    if (res.status === 429) {
+      // Backend ingest queue is full — retry after Retry-After
+      return { events: events, retryMs: Math.max(1, parseInt(res.headers.get('Retry-After') || '1', 10)) * 1000 }
+    }
+    if (res.status >= 500) {
+      // Backend error — the events may not have been recorded, so send them again
+      return { events: events, retryMs: NETWORK_RETRY_MS }
+    }
+    if (res.status === 413) {
+      // Too many events for one backend queue shard — split smaller and resend now
+      var limit = await res.json().catch(function () { return null })
+      _maxChunkEvents = Math.max(1, (limit && limit.max_batch) || Math.floor(events.length / 2))
+      return { events: events, retryMs: 0 }
+    }
+    if (res.ok) {
+      // On quota_exhausted the backend lists the events it did not get to
+      var result = await res.json().catch(function () { return null })
+      var unprocessed = (result && result.unprocessed) || []
+      if (unprocessed.length) {
+        return { events: unprocessed.map(function (i) { return events[i] }), retryMs: QUOTA_RETRY_MS }
+      }
+    }
+    return null
+  }
+
+  async function flush() {
+    if (_sending || Date.now() < _retryAt) return
+    _sending = true
+    try {
+      var chunks = splitBySize(takeBuffer())
+      for (var c = 0; c < chunks.length; c++) {
+        var retry = await postChunk(chunks[c])
+        if (retry) {
+          // Retried events first, then every chunk not sent yet, then anything captured meanwhile
+          var rest = retry.events
+          chunks.slice(c + 1).forEach(function (chunk) { rest = rest.concat(chunk) })
+          requeue(rest, retry.retryMs)
+          break
+        }
+      }
     } catch (_) {
       // Non-fatal — observer failures must not interrupt the worker
+    } finally {
+      _sending = false
+    }
+    // Events captured while this flush was sending
+    if (_buffer.length && !_flushTimer) _flushTimer = setTimeout(flush, FLUSH_MS)
+  }
+
+  function stashUnsent(events) {
+    var stashed = []
+    try { stashed = JSON.parse(localStorage.getItem(UNSENT_KEY) || '[]') } catch (_) { }
+    try {
+      localStorage.setItem(UNSENT_KEY, JSON.stringify(stashed.concat(events)))
+    } catch (_) {
+      // Over the storage quota — keep the events, drop their screenshots
+      try {
+        localStorage.setItem(UNSENT_KEY, JSON.stringify(stashed.concat(events).map(function (e) {
+          var copy = Object.assign({}, e)
+          delete copy.screenshot_b64
+          return copy
+        })))
+      } catch (_) { }
     }
   }
 
+  function flushOnUnload() {
+    var unsent = []
+    splitBySize(takeBuffer()).forEach(function (events) {
+      // Compression is async, so unload flushes send the (uncompressed) encoding only
+      var body = encodeBatch(events).text
+      var sent = false
+      if (!events.some(hasScreenshot)) {
+        // text/plain keeps the beacon a "simple" request (no CORS preflight)
+        try {
+          sent = !!navigator.sendBeacon &&
+            navigator.sendBeacon(API_BASE + '/api/observe/batch', new Blob([body], { type: 'text/plain' }))
+        } catch (_) { }
+      }
+      if (!sent) unsent = unsent.concat(events)
+    })
+    if (unsent.length) stashUnsent(unsent)
+  }
+
+  function postEvent(eventData) {
+    if (localStorage.getItem('r4mi_pause_recording') === 'true') return;
+    _buffer.push(eventData)
+    if (eventData.event_type === 'submit' || _buffer.length >= BATCH_SIZE) {
+      flush()
+    } else if (!_flushTimer) {
+      _flushTimer = setTimeout(flush, FLUSH_MS)
+    }
+  }
+
+  // Resend whatever the previous page could not beacon
+  try {
+    var _unsent = JSON.parse(localStorage.getItem(UNSENT_KEY) || '[]')
+    localStorage.removeItem(UNSENT_KEY)
+    if (_unsent.length) {
+      _buffer = _unsent.concat(_buffer)
+      _flushTimer = setTimeout(flush, FLUSH_MS)
+    }
+  } catch (_) { }
+
+  window.addEventListener('pagehide', flushOnUnload)
+  document.addEventListener('visibilitychange', function () {
+    // A hidden tab may come back: send normally (screenshots included) and
+    // leave beacons and the stash to pagehide
+    if (document.visibilityState === 'hidden') flush()
+  })
+
   function buildBase(eventType, el) {
     const meta = getSessionMeta()
     const teachMode = isTeachMode()